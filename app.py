@@ -1,16 +1,21 @@
 import os.path
 import shutil
-from concurrent.futures import ThreadPoolExecutor
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 
 import streamlit as st
-from tqdm import tqdm
 
 from path import get_work_path
-from util.biorxiv_fetcher import Category, get_daily_papers, Paper, download_pdf, MAIN_LIST
-from util.file_util import get_image, compress_folder, DocData, write_to_docx
-from util.grobid_util import parse_pdf, extract_paragraphs
-from util.llm_integration import conclusion
+from util.biorxiv_fetcher import Category, get_daily_papers, Paper
+from util.chat_history import ChatHistory, PAGE_SIZE
+from util.file_util import compress_folder, write_to_docx, DocData
+from util.metrics import tracer
+from util.paper_index import PaperIndex, PaperState
+from util.pipeline import SharedLimits, get_output_file, drop_written, process_paper, interleave
+from util.relevance import load_profiles, select_relevant
+from util.resilience import reset_run
+from util.search_index import SearchIndex
 
 st.set_page_config(
     page_title='文献总结',
@@ -24,8 +29,31 @@ os.environ["LANGCHAIN_PROJECT"] = 'BioSummary'
 category_options = [category.value for category in Category]
 yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
 
-if 'summary_history' not in st.session_state:
-    st.session_state.summary_history = []
+
+@st.cache_resource
+def get_resources() -> tuple[SharedLimits, PaperIndex, SearchIndex, ChatHistory]:
+    """Opened once per server instead of on every rerun."""
+    return SharedLimits(), PaperIndex(), SearchIndex(), ChatHistory()
+
+
+limits, paper_index, search_index, history = get_resources()
+
+if 'history_pages' not in st.session_state:
+    st.session_state.history_pages = 1
+if 'session_id' not in st.session_state:
+    # kept in the URL, so reloading the page finds its messages again
+    st.session_state.session_id = st.query_params.get('session') or uuid.uuid4().hex
+    st.query_params['session'] = st.session_state.session_id
+
+
+def history_session() -> str:
+    """The history is shared by every browser session of the server, each one only sees its own messages."""
+    return f'{st.session_state.session_id}/{yesterday}'
+
+
+def add_history(role: str, content: str) -> None:
+    history.append(history_session(), role, content)
+
 
 st.title("每日文献总结")
 col1, col2 = st.columns([2, 3], gap='medium')
@@ -33,22 +61,31 @@ col1, col2 = st.columns([2, 3], gap='medium')
 chat_container = col2.container(height=700, border=False)
 
 with chat_container:
-    for message in st.session_state.summary_history:
-        icon = 'logo.png' if message['role'] != 'user' else None
-        with st.chat_message(message['role']):
-            st.write(message['content'])
+    if history.count(history_session()) > st.session_state.history_pages * PAGE_SIZE:
+        if st.button("加载更早的记录", key="load_history"):
+            st.session_state.history_pages += 1
+            st.rerun()
+
+    for message in history.recent(history_session(), st.session_state.history_pages):
+        icon = 'logo.png' if message.role != 'user' else None
+        with st.chat_message(message.role):
+            st.write(message.content)
 
 with col1:
     st.toggle("全部分类", key="all_category")
     st.multiselect("筛选领域", category_options, [Category.Bioinformatics], key="categories", disabled=st.session_state.all_category)
+    st.number_input("每类最多总结篇数（按兴趣相关性，0为不限）", min_value=0, value=0, step=5, key="top_n")
     st.button("生成", key="generate")
 
     if st.session_state.generate:
         yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        reset_run()
 
-        with st.status("下载文献信息..", expanded=True) as status:
+        with st.status("下载文献信息..", expanded=True) as status, tracer.run():
             all_paper = get_daily_papers(yesterday)
             new_paper = all_paper[all_paper['version'] == '1'].sort_values(by='category')
+            if st.session_state.top_n > 0:
+                new_paper = select_relevant(new_paper, load_profiles(), top_n=st.session_state.top_n)
             total = new_paper.shape[0]
 
             if total == 0:
@@ -61,85 +98,82 @@ with col1:
             else:
                 category_list = st.session_state.categories
 
+            groups: dict[str, list[Paper]] = {}
             for cat in category_list:
                 cat_paper = new_paper[new_paper['category'] == cat]
-                total = cat_paper.shape[0]
-
-                if total == 0:
+                if cat_paper.shape[0] == 0:
                     continue
 
-                base_path = os.path.join(get_work_path(), 'tmp', cat)
-
-                output_file = os.path.join(
-                    get_work_path(),
-                    f'{yesterday}-summary',
-                    f"{yesterday} BiorRxiv预印本速读【{cat.title()}】.docx"
-                ) if cat not in MAIN_LIST else os.path.join(
-                    get_work_path(),
-                    f'{yesterday}-summary',
-                    'main',
-                    f"{yesterday} BiorRxiv预印本速读【{cat.title()}】.docx"
-                )
-
+                output_file = get_output_file(yesterday, cat)
                 os.makedirs(os.path.dirname(output_file), exist_ok=True)
 
                 if os.path.exists(output_file):
                     st.write(f"{cat}分类文献总结生成完毕")
                     continue
 
-                index = 1
-                paper_data = []
-                for _, row in tqdm(cat_paper.iterrows(), total=total):
-                    status.update(label=f"处理{cat}类别的文献({index}/{total})")
-                    _paper = Paper.from_dict(row)
-
-                    pdf_file = download_pdf(base_path, _paper.doi)
-
-                    with ThreadPoolExecutor() as executor:
-                        future_first_image = executor.submit(get_image, pdf_file)
-                        future_parsed_pdf = executor.submit(parse_pdf, pdf_file)
+                cat_paper = drop_written(cat_paper, output_file, paper_index)
+                if cat_paper.shape[0] == 0:
+                    st.write(f"{cat}分类文献均已总结过")
+                    continue
 
-                        parsed_pdf = future_parsed_pdf.result()
-                        future_more_paragraphs = executor.submit(extract_paragraphs, parsed_pdf)
+                groups[cat] = Paper.from_frame(cat_paper)
 
-                        first_image = future_first_image.result()
-                        more_paragraphs = future_more_paragraphs.result()
+            total = sum(len(papers) for papers in groups.values())
+            progress = {cat: st.progress(0.0, text=f"{cat} (0/{len(papers)})") for cat, papers in groups.items()}
+            results: dict[str, dict[str, DocData]] = {cat: {} for cat in groups}
+            finished = {cat: 0 for cat in groups}
 
-                    _paper.more_graph = more_paragraphs
+            # all categories run at once under the global limits, their papers are submitted in turn
+            with ThreadPoolExecutor(max_workers=limits.total) as executor:
+                futures = {
+                    executor.submit(process_paper, _paper, os.path.join(get_work_path(), 'tmp', cat), limits, paper_index): (cat, _paper)
+                    for cat, _paper in interleave([[(cat, _paper) for _paper in papers] for cat, papers in groups.items()])
+                }
+                status.update(label=f"处理文献(0/{total})")
 
+                for done, future in enumerate(as_completed(futures), start=1):
+                    cat, _paper = futures[future]
                     user_log = f"请总结文献《{_paper.title}》"
                     chat_container.chat_message("human").write(user_log)
-                    st.session_state.summary_history.append({'role': 'user', 'content': user_log})
-
-                    response = conclusion(_paper)
-                    conclusion_result = chat_container.chat_message("ai").write_stream(response)
-                    st.session_state.summary_history.append({'role': 'assistant', 'content': conclusion_result})
-                    index += 1
-
-                    author_list = _paper.authors.split('; ')
-                    author_str = "; ".join(author_list[:2]+['et.al.'] if len(author_list) > 2 else author_list)
-                    author_corresponding = "; ".join([
-                        f"{a}*"
-                        for a in _paper.author_corresponding.split('; ')
-                    ])
-                    paper_data.append(DocData(
-                        _paper.title,
-                        f"{author_str}, {author_corresponding}",
-                        _paper.author_corresponding_institution,
-                        _paper.doi,
-                        conclusion_result,
-                        first_image
-                    ))
-
-                status.update(label="保存结果至docx文件...")
-                write_to_docx(paper_data, output_file)
-                st.write(f"{cat}分类文献总结生成完毕")
+                    add_history('user', user_log)
+
+                    try:
+                        doc_data = future.result()
+                    except Exception as e:
+                        st.warning(f"{cat}分类文献《{_paper.title}》处理失败: {repr(e)}")
+                    else:
+                        results[cat][_paper.doi] = doc_data
+                        chat_container.chat_message("ai").write(doc_data.desc)
+                        add_history('assistant', doc_data.desc)
+
+                    finished[cat] += 1
+                    cat_total = len(groups[cat])
+                    progress[cat].progress(finished[cat] / cat_total, text=f"{cat} ({finished[cat]}/{cat_total})")
+                    status.update(label=f"处理文献({done}/{total})")
+
+                    if finished[cat] < cat_total:
+                        continue
+
+                    failed = cat_total - len(results[cat])
+                    if failed:
+                        # no docx yet, so the next run plans the category again and reuses the stored summaries
+                        st.warning(f"{cat}分类有{failed}篇文献处理失败，暂不保存，请重新生成")
+                        continue
+
+                    output_file = get_output_file(yesterday, cat)
+                    paper_data = [results[cat][p.doi] for p in groups[cat] if p.doi in results[cat]]
+                    write_to_docx(paper_data, output_file)
+                    paper_index.mark_many(results[cat].keys(), PaperState.WRITTEN, output_file=output_file)
+                    search_index.add_summaries(yesterday, cat, paper_data)
+                    st.write(f"{cat}分类文献总结生成完毕")
 
             status.update(label="压缩文件...")
             compress_folder(yesterday)
-            shutil.rmtree('tmp')
+            shutil.rmtree(os.path.join(get_work_path(), 'tmp'), ignore_errors=True)
             st.write("文件压缩完毕")
 
+            tracer.export(os.path.join(get_work_path(), 'metrics'), yesterday)
+
             status.update(
                 label="总结完毕",
                 state="complete"
@@ -0,0 +1,438 @@
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import chain
+from typing import Callable
+
+from loguru import logger
+from pandas import DataFrame
+
+from path import get_work_path
+from util.batch_job import BatchJob, load_client, POLL_SECONDS
+from util.biorxiv_fetcher import get_daily_papers, Paper, Category
+from util.file_util import DocData, Degraded, write_to_docx, compress_folder
+from util.metrics import tracer
+from util.paper_index import PaperIndex, PaperState, INDEX_FILE
+from util.pipeline import ResourceLimits, SharedLimits, get_output_file, process_paper, drop_written, PAPER_TASK, \
+    paper_payload, Deadlines, DEADLINES, prepare_paper, build_doc_data, record_degraded, interleave
+from util.relevance import load_profiles, select_relevant, PROFILE_FILE
+from util.resilience import reset_run
+from util.search_index import SearchIndex, SEARCH_FILE
+from util.work_queue import WorkQueue, TaskState, QUEUE_FILE, decode_doc
+
+
+@dataclass
+class WorkItem:
+    date: str
+    category: str
+    output_file: str
+    papers: list[Paper]
+    results: dict[str, DocData] = field(default_factory=dict)
+    pending: int = 0
+    failed: list[str] = field(default_factory=list)
+
+
+def date_range(start: str, end: str) -> list[str]:
+    start_date = datetime.strptime(start, '%Y-%m-%d')
+    end_date = datetime.strptime(end, '%Y-%m-%d')
+    if end_date < start_date:
+        raise ValueError(f'结束日期 {end} 早于开始日期 {start}')
+
+    return [
+        (start_date + timedelta(days=i)).strftime('%Y-%m-%d')
+        for i in range((end_date - start_date).days + 1)
+    ]
+
+
+def date_is_done(date: str, categories: list[str] | None) -> bool:
+    """
+    Whether every category of a date has its docx. The zip is no marker, the app zips a date after any run.
+
+    With `categories` None the categories of the day are only known from its papers, so the date is fetched and
+    `plan_date` skips the categories that are done.
+    """
+    if categories is None:
+        return False
+
+    return all(os.path.exists(get_output_file(date, cat)) for cat in categories)
+
+
+def plan_date(
+        date: str,
+        all_paper: DataFrame,
+        categories: list[str] | None,
+        select: Callable[[DataFrame], DataFrame] | None = None,
+        index: PaperIndex | None = None
+) -> list[WorkItem]:
+    if all_paper is None or all_paper.empty:
+        return []
+
+    new_paper = all_paper[all_paper['version'] == '1'].sort_values(by='category')
+    if select is not None:
+        new_paper = select(new_paper)
+    category_list = categories if categories is not None else all_paper['category'].unique().tolist()
+
+    work_items = []
+    for cat in category_list:
+        output_file = get_output_file(date, cat)
+        if os.path.exists(output_file):
+            logger.info(f'{date} {cat} 已存在，跳过')
+            continue
+
+        cat_paper = new_paper[new_paper['category'] == cat]
+        if index is not None:
+            cat_paper = drop_written(cat_paper, output_file, index)
+        if cat_paper.shape[0] == 0:
+            continue
+
+        papers = Paper.from_frame(cat_paper)
+        work_items.append(WorkItem(date, cat, output_file, papers, pending=len(papers)))
+
+    return work_items
+
+
+def plan_backfill(
+        dates: list[str],
+        categories: list[str] | None,
+        max_fetch: int = 4,
+        select: Callable[[DataFrame], DataFrame] | None = None,
+        index: PaperIndex | None = None
+) -> list[WorkItem]:
+    """
+    Plan the (date, category) work of a backfill, skipping dates and categories whose outputs already exist.
+
+    Args:
+        dates (list[str]): Dates in the format 'YYYY-MM-DD'.
+        categories (list[str] | None): Categories to summarize, None for all categories of each day.
+        max_fetch (int): Number of dates whose paper lists are fetched at the same time.
+        select (Callable | None): Narrows down the version-1 papers of a date, e.g. to the relevant ones.
+        index (PaperIndex | None): Papers already written to another summary are left out.
+
+    Returns:
+        list[WorkItem]: One work item per (date, category) that still has to be summarized.
+    """
+    todo_dates = []
+    for date in dates:
+        if date_is_done(date, categories):
+            logger.info(f'{date} 的总结已存在，跳过')
+        else:
+            todo_dates.append(date)
+
+    work_items = []
+    with ThreadPoolExecutor(max_workers=max_fetch) as executor:
+        futures = {executor.submit(get_daily_papers, date): date for date in todo_dates}
+        for future in as_completed(futures):
+            date = futures[future]
+            try:
+                all_paper = future.result()
+            except Exception as e:
+                logger.error(f'{date} 的文献信息下载失败，跳过: {repr(e)}')
+                continue
+            date_items = plan_date(date, all_paper, categories, select, index)
+            if not date_items:
+                logger.info(f'{date} 的总结已存在，跳过')
+            work_items.extend(date_items)
+
+    work_items.sort(key=lambda item: (item.date, item.category))
+    return work_items
+
+
+def run_backfill(
+        work_items: list[WorkItem],
+        limits: SharedLimits,
+        index: PaperIndex | None = None,
+        search_index: SearchIndex | None = None,
+        deadlines: Deadlines = DEADLINES
+) -> None:
+    """Process every paper of every work item concurrently, bounded only by the shared limits."""
+    dates = dict.fromkeys(item.date for item in work_items)
+
+    with ThreadPoolExecutor(max_workers=limits.total) as executor:
+        futures = {}
+        # categories of a date take turns, dates still go one after another so each is finished early
+        order = chain.from_iterable(
+            interleave([[(item, paper) for paper in item.papers] for item in work_items if item.date == date])
+            for date in dates
+        )
+        for item, paper in order:
+            base_path = os.path.join(get_work_path(), 'tmp', item.date, item.category)
+            future = executor.submit(process_paper, paper, base_path, limits, index, deadlines)
+            futures[future] = (item, paper)
+
+        for future in as_completed(futures):
+            item, paper = futures[future]
+            try:
+                item.results[paper.doi] = future.result()
+            except Exception as e:
+                logger.error(f'{item.date} {paper.doi} 处理失败: {repr(e)}')
+                item.failed.append(paper.doi)
+
+            item.pending -= 1
+            if item.pending == 0:
+                finish_item(item, work_items, index, search_index)
+
+
+def prepare_batch(
+        job: BatchJob,
+        items: list[WorkItem],
+        limits: SharedLimits,
+        index: PaperIndex | None = None,
+        deadlines: Deadlines = DEADLINES
+) -> int:
+    """Download and parse the papers of one date and write them to its batch job. Returns the number of requests."""
+    papers = [
+        (item, paper) for item in items for paper in item.papers
+        if index is None or index.get_summary(paper.doi) is None
+    ]
+
+    with ThreadPoolExecutor(max_workers=limits.total) as executor:
+        futures = [
+            executor.submit(
+                prepare_paper, paper, os.path.join(get_work_path(), 'tmp', item.date, item.category), limits,
+                index=index, deadlines=deadlines
+            )
+            for item, paper in papers
+        ]
+        prepared = [(paper, *future.result()) for (_, paper), future in zip(papers, futures)]
+
+    return job.write(prepared)
+
+
+def collect_batch(
+        job: BatchJob,
+        items: list[WorkItem],
+        summaries: dict[str, str],
+        limits: SharedLimits,
+        index: PaperIndex | None = None,
+        search_index: SearchIndex | None = None,
+        deadlines: Deadlines = DEADLINES
+) -> None:
+    """
+    Map the batch results back to the papers by DOI and write the summaries of one date.
+
+    Papers without a batch result, because their request failed or they were added after the job was
+    written, are summarized one by one with streaming calls.
+    """
+    entries = job.entries()
+    fallback = []
+    for item in items:
+        for paper in item.papers:
+            entry = entries.get(paper.doi)
+            if entry is None or paper.doi not in summaries:
+                fallback.append((item, paper))
+                continue
+
+            image = ''
+            if entry.image:
+                with open(entry.image, 'rb') as f:
+                    image = f.read()
+            degraded = [Degraded(reason) for reason in entry.degraded]
+            record_degraded(paper, degraded)
+            if not degraded and index is not None:
+                index.mark(paper.doi, PaperState.SUMMARIZED, summary=summaries[paper.doi], image=image or None)
+            item.results[paper.doi] = build_doc_data(paper, summaries[paper.doi], image, degraded)
+
+    if fallback:
+        logger.info(f'{job.name} 有 {len(fallback)} 篇文献没有批量结果，逐篇总结')
+        with ThreadPoolExecutor(max_workers=limits.total) as executor:
+            futures = {
+                executor.submit(
+                    process_paper, paper, os.path.join(get_work_path(), 'tmp', item.date, item.category), limits,
+                    index, deadlines
+                ): (item, paper)
+                for item, paper in fallback
+            }
+            for future in as_completed(futures):
+                item, paper = futures[future]
+                try:
+                    item.results[paper.doi] = future.result()
+                except Exception as e:
+                    logger.error(f'{item.date} {paper.doi} 处理失败: {repr(e)}')
+                    item.failed.append(paper.doi)
+
+    for item in items:
+        item.pending = 0
+        finish_item(item, items, index, search_index)
+
+
+def run_batch(
+        work_items: list[WorkItem],
+        limits: SharedLimits,
+        index: PaperIndex | None = None,
+        search_index: SearchIndex | None = None,
+        deadlines: Deadlines = DEADLINES,
+        poll: float = POLL_SECONDS,
+        timeout: float | None = None
+) -> None:
+    """
+    Summarize the work items through one batch job per date instead of one streaming call per paper.
+
+    Every date is prepared and submitted first, then the jobs are awaited in turn. A job that is still running
+    after `timeout` seconds is left to the next run, which resumes it without preparing or submitting again.
+    """
+    dates: dict[str, list[WorkItem]] = {}
+    for item in work_items:
+        dates.setdefault(item.date, []).append(item)
+
+    client = load_client()
+    jobs = {}
+    for date, items in dates.items():
+        job = BatchJob(date)
+        if not job.prepared:
+            prepare_batch(job, items, limits, index, deadlines)
+        job.submit(client)
+        jobs[date] = job
+
+    for date, job in jobs.items():
+        try:
+            summaries = job.results(client, poll, timeout)
+        except TimeoutError:
+            logger.warning(f'{date} 的批量任务尚未完成，下次运行时继续')
+            continue
+
+        collect_batch(job, dates[date], summaries, limits, index, search_index, deadlines)
+        job.remove()
+
+
+def finish_item(
+        item: WorkItem,
+        work_items: list[WorkItem],
+        index: PaperIndex | None = None,
+        search_index: SearchIndex | None = None
+) -> None:
+    """
+    Write a work item whose papers are all processed, and finish its date when it was the last one.
+
+    An item with failed papers is not written, so the next run plans its category again: the papers that
+    succeeded reuse their stored summaries and the failed ones are retried. Its date is not finished either.
+    """
+    if item.failed:
+        logger.warning(f'{item.date} {item.category} 有 {len(item.failed)} 篇文献处理失败，下次运行时重试: '
+                       f'{", ".join(item.failed)}')
+    else:
+        write_item(item, index, search_index)
+
+    siblings = [other for other in work_items if other.date == item.date]
+    if any(other.pending > 0 for other in siblings):
+        return
+    if any(other.failed for other in siblings):
+        logger.warning(f'{item.date} 有文献处理失败，暂不压缩')
+        return
+    finish_date(item.date)
+
+
+def write_item(item: WorkItem, index: PaperIndex | None = None, search_index: SearchIndex | None = None) -> None:
+    paper_data = [item.results[p.doi] for p in item.papers if p.doi in item.results]
+    os.makedirs(os.path.dirname(item.output_file), exist_ok=True)
+    write_to_docx(paper_data, item.output_file)
+    if index is not None:
+        index.mark_many(item.results.keys(), PaperState.WRITTEN, output_file=item.output_file)
+    if search_index is not None:
+        search_index.add_summaries(item.date, item.category, paper_data)
+    logger.info(f'{item.date} {item.category}分类文献总结生成完毕')
+
+
+def enqueue_backfill(work_items: list[WorkItem], queue: WorkQueue, deadlines: Deadlines = DEADLINES) -> int:
+    """Put every paper of the work items on the queue for `worker.py` processes. Returns the number of new tasks."""
+    added = queue.enqueue_many(PAPER_TASK, [
+        (paper.doi, paper_payload(paper, deadlines))
+        for item in work_items
+        for paper in item.papers
+    ])
+    logger.info(f'新加入 {added} 个任务，队列状态: {dict(queue.counts(PAPER_TASK))}')
+    return added
+
+
+def collect_backfill(
+        work_items: list[WorkItem],
+        queue: WorkQueue,
+        index: PaperIndex | None = None,
+        search_index: SearchIndex | None = None,
+        poll: float = 5.0
+) -> None:
+    """Wait for the workers and write each (date, category) summary as soon as all its papers are finished."""
+    remaining = list(work_items)
+    while remaining:
+        for item in list(remaining):
+            finished = queue.finished(PAPER_TASK, [p.doi for p in item.papers])
+            item.pending = len(item.papers) - len(finished)
+            if item.pending > 0:
+                continue
+
+            for doi, (state, value) in finished.items():
+                if state == TaskState.DONE:
+                    item.results[doi] = decode_doc(value)
+                else:
+                    logger.error(f'{item.date} {doi} 处理失败: {value}')
+                    item.failed.append(doi)
+
+            remaining.remove(item)
+            finish_item(item, work_items, index, search_index)
+
+        if remaining:
+            logger.info(f'等待worker完成，剩余 {sum(item.pending for item in remaining)} 篇')
+            time.sleep(poll)
+
+
+def finish_date(date: str) -> None:
+    compress_folder(date)
+    shutil.rmtree(os.path.join(get_work_path(), 'tmp', date), ignore_errors=True)
+    logger.info(f'{date} 的总结已压缩')
+
+
+def main() -> None:
+    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+
+    parser = argparse.ArgumentParser(description='补全一段时间内的每日文献总结')
+    parser.add_argument('--start', required=True, help='开始日期，YYYY-MM-DD')
+    parser.add_argument('--end', default=yesterday, help='结束日期（包含），YYYY-MM-DD，默认为昨天')
+    parser.add_argument('--category', action='append', choices=[c.value for c in Category],
+                        help='需要总结的分类，可多次指定，默认为全部分类')
+    parser.add_argument('--download', type=int, default=ResourceLimits.download, help='PDF下载并发上限')
+    parser.add_argument('--grobid', type=int, default=ResourceLimits.grobid, help='Grobid并发上限')
+    parser.add_argument('--llm', type=int, default=ResourceLimits.llm, help='LLM并发上限')
+    parser.add_argument('--top-n', type=int, help='每个分类只总结相关性最高的N篇')
+    parser.add_argument('--threshold', type=float, help='只总结相关性得分不低于该值的文献')
+    parser.add_argument('--profiles', default=PROFILE_FILE, help='兴趣配置文件')
+    parser.add_argument('--deadline', type=float, default=DEADLINES.paper, help='每篇文献的总时限（秒），超时则降级处理')
+    parser.add_argument('--llm-deadline', type=float, default=DEADLINES.llm, help='总结生成的时限（秒）')
+    parser.add_argument('--index', default=INDEX_FILE, help='文献处理记录数据库')
+    parser.add_argument('--search-index', default=SEARCH_FILE, help='全文检索数据库')
+    parser.add_argument('--batch', action='store_true', help='每天的总结作为一个批量任务提交，适合无人值守的定时运行')
+    parser.add_argument('--batch-poll', type=float, default=POLL_SECONDS, help='查询批量任务状态的间隔（秒）')
+    parser.add_argument('--batch-timeout', type=float, help='最多等待批量任务的时间（秒），超时则留到下次运行，默认一直等待')
+    parser.add_argument('--queue', nargs='?', const=QUEUE_FILE, metavar='QUEUE_FILE',
+                        help='把文献放入任务队列，由worker.py处理，本进程只负责汇总，默认队列为工作目录下的work_queue.sqlite3')
+    args = parser.parse_args()
+
+    limits = SharedLimits(ResourceLimits(args.download, args.grobid, args.llm))
+    reset_run()
+
+    select = None
+    if args.top_n is not None or args.threshold is not None:
+        select = partial(select_relevant, profiles=load_profiles(args.profiles), top_n=args.top_n, threshold=args.threshold)
+
+    with PaperIndex(args.index) as index, SearchIndex(args.search_index) as search_index:
+        work_items = plan_backfill(date_range(args.start, args.end), args.category, select=select, index=index)
+        total = sum(len(item.papers) for item in work_items)
+        logger.info(f'共 {len(work_items)} 个(日期, 分类)任务，{total} 篇文献')
+
+        deadlines = Deadlines(paper=args.deadline, llm=args.llm_deadline)
+        if args.batch:
+            run_batch(work_items, limits, index, search_index, deadlines, args.batch_poll, args.batch_timeout)
+        elif args.queue is None:
+            run_backfill(work_items, limits, index, search_index, deadlines)
+        else:
+            with WorkQueue(args.queue) as queue:
+                enqueue_backfill(work_items, queue, deadlines)
+                collect_backfill(work_items, queue, index, search_index)
+    tracer.export(os.path.join(get_work_path(), 'metrics'), f'backfill_{args.start}_{args.end}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Cold-start profile of the entry points: the first render of the Streamlit app and the import of every CLI script.
+
+    python -m benchmark.bench_import                 # measure and check against benchmark/import_budget.json
+    python -m benchmark.bench_import -k app --top 15 # only the app, with the 15 heaviest packages
+
+Every measurement runs in a fresh interpreter. Exits with status 1 if an entry point takes longer than its budget
+or loads a module it should only load when the stage that needs it runs.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_budget.json')
+
+# the statement whose time is measured, it runs after the interpreter has started
+ENTRY_POINTS = {
+    'app': (
+        "from streamlit.testing.v1 import AppTest\n"
+        "app = AppTest.from_file('app.py')\n"
+        "app.secrets['langsmith_api'] = 'bench'\n"
+        "app.run(timeout=60)\n"
+        "assert not app.exception, app.exception"
+    ),
+    'last_month_conclude': 'import last_month_conclude',
+    'backfill': 'import backfill',
+    'worker': 'import worker',
+    'search': 'import search',
+}
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {repo!r})
+start = time.perf_counter()
+exec({statement!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'modules': sorted(m for m in sys.modules if '.' not in m)}}))
+"""
+
+
+def probe(statement: str, work_path: str, importtime: bool = False) -> tuple[dict, str]:
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + [
+        '-c', PROBE.format(repo=REPO_PATH, statement=statement)
+    ]
+    env = {**os.environ, 'BIOSUMMARY_WORK_PATH': work_path, 'MPLBACKEND': 'Agg'}
+    process = subprocess.run(command, cwd=REPO_PATH, env=env, capture_output=True, text=True, check=True)
+    return json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
+
+
+def heaviest_packages(importtime_log: str, top: int, exclude: str = '') -> list[tuple[str, float]]:
+    """The top-level packages with the largest cumulative import time, from a `-X importtime` log."""
+    packages = {}
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        if '.' not in name and name != exclude:
+            packages[name] = max(packages.get(name, 0.0), int(cumulative) / 1e6)
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+def measure(name: str, repeat: int, top: int) -> dict:
+    with tempfile.TemporaryDirectory() as work_path:
+        runs = [probe(ENTRY_POINTS[name], work_path)[0] for _ in range(repeat)]
+        _, log = probe(ENTRY_POINTS[name], work_path, importtime=True)
+
+    return {
+        'median': round(statistics.median(run['seconds'] for run in runs), 3),
+        'min': round(min(run['seconds'] for run in runs), 3),
+        'modules': runs[0]['modules'],
+        'heaviest': heaviest_packages(log, top, exclude=name),
+    }
+
+
+def check(name: str, result: dict, budget: dict) -> list[str]:
+    if name not in budget:
+        return []
+
+    failures = []
+    if result['median'] > budget[name]['seconds']:
+        failures.append(f"{name}: {result['median']:.2f}s > {budget[name]['seconds']:.2f}s budget")
+    loaded = sorted(set(budget[name].get('forbidden', [])) & set(result['modules']))
+    if loaded:
+        failures.append(f"{name}: loads {', '.join(loaded)} at start")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Cold-start profile of the app and the CLI scripts.')
+    parser.add_argument('-k', dest='keyword', help='Only entry points whose name contains this string.')
+    parser.add_argument('--repeat', type=int, default=3, help='Fresh interpreters per entry point.')
+    parser.add_argument('--top', type=int, default=8, help='Number of heaviest packages to list.')
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args()
+
+    with open(BUDGET_FILE, encoding='utf8') as f:
+        budget = json.load(f)
+
+    results = {}
+    failures = []
+    for name in ENTRY_POINTS:
+        if args.keyword and args.keyword not in name:
+            continue
+
+        result = measure(name, args.repeat, args.top)
+        results[name] = result
+        failures.extend(check(name, result, budget))
+
+        limit = budget.get(name, {}).get('seconds')
+        print(f"{name:<22} median {result['median'] * 1000:8.1f} ms  min {result['min'] * 1000:8.1f} ms  "
+              f"budget {f'{limit * 1000:.0f} ms' if limit else '-'}")
+        print('    ' + ', '.join(f'{package} {seconds * 1000:.0f} ms' for package, seconds in result['heaviest']))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=2)
+
+    if failures:
+        print('\n'.join(['', 'over budget:'] + failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
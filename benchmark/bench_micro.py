@@ -0,0 +1,207 @@
+"""
+Microbenchmarks of the CPU-bound helpers on the fixture corpus in `benchmark/corpus`.
+
+    python -m benchmark.bench_micro                    # run and compare with benchmark/baseline.json
+    python -m benchmark.bench_micro --save-baseline    # record a new baseline on this machine
+    python -m benchmark.bench_micro -k get_image       # only benchmarks whose name contains "get_image"
+
+Exits with status 1 if a median time or a memory peak exceeds the baseline by more than its threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+from benchmark.build_corpus import CORPUS_PATH
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+TIME_THRESHOLD = 1.5
+MEMORY_THRESHOLD = 1.5
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Callable[[str], tuple]
+    func: Callable
+    repeat: int = 20
+
+
+def corpus_file(name: str) -> str:
+    return os.path.join(CORPUS_PATH, name)
+
+
+def copy_pdf(name: str) -> Callable[[str], tuple]:
+    def setup(work_path: str) -> tuple:
+        target = os.path.join(work_path, name)
+        shutil.copy(corpus_file(name), target)
+        return (target,)
+
+    return setup
+
+
+def read_tei(name: str) -> Callable[[str], tuple]:
+    def setup(_: str) -> tuple:
+        with open(corpus_file(name), encoding='utf8') as f:
+            return (f.read(),)
+
+    return setup
+
+
+def recover_all(pdf_path: str) -> int:
+    import fitz
+    from util.file_util import recover_pix
+
+    with fitz.open(pdf_path) as doc:
+        return sum(
+            len(recover_pix(doc, img)['image'])
+            for pno in range(doc.page_count)
+            for img in doc.get_page_images(pno)
+        )
+
+
+def large_png(_: str) -> tuple:
+    from PIL import Image
+
+    gradient = Image.linear_gradient('L').resize((3840, 2160))
+    image = Image.merge('RGB', (gradient, gradient.rotate(180), gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    output = io.BytesIO()
+    image.save(output, format='png')
+    return output.getvalue(), 'png'
+
+
+def docx_papers(count: int) -> Callable[[str], tuple]:
+    def setup(work_path: str) -> tuple:
+        from util.file_util import DocData, get_image
+
+        image = get_image(copy_pdf('short.pdf')(work_path)[0])
+        papers = [
+            DocData(f'Title {i}', 'Author A; Author B; et.al., Author A*', 'Institute', f'10.1101/{i}', '总结内容。' * 120, image)
+            for i in range(count)
+        ]
+        return papers, os.path.join(work_path, 'output.docx')
+
+    return setup
+
+
+def wordcloud_setup(work_path: str) -> tuple:
+    return corpus_file('result_10.csv'), os.path.join(work_path, 'image'), 10, os.path.join(work_path, 'keyword_map.json')
+
+
+def month_abstracts(_: str) -> tuple:
+    from benchmark.fixtures import make_papers
+
+    return [p['abstract'] for p in make_papers('2024-10-01', '2024-10-31', 100)],
+
+
+def get_benchmarks() -> list[Benchmark]:
+    from last_month_conclude import draw_wordcloud
+    from util.file_util import get_image, resize_image_if_needed, write_to_docx
+    from util.grobid_util import extract_paragraphs
+    from util.keywords import extract_keywords_local
+
+    return [
+        Benchmark('extract_paragraphs[short]', read_tei('short.grobid.xml'), extract_paragraphs),
+        Benchmark('extract_paragraphs[medium]', read_tei('medium.grobid.xml'), extract_paragraphs),
+        Benchmark('extract_paragraphs[long]', read_tei('long.grobid.xml'), extract_paragraphs),
+        Benchmark('get_image[short]', copy_pdf('short.pdf'), get_image),
+        Benchmark('get_image[masked]', copy_pdf('masked.pdf'), get_image),
+        Benchmark('get_image[long]', copy_pdf('long.pdf'), get_image),
+        Benchmark('recover_pix[masked]', copy_pdf('masked.pdf'), recover_all),
+        Benchmark('resize_image_if_needed[3840x2160]', large_png, resize_image_if_needed, repeat=5),
+        Benchmark('write_to_docx[50]', docx_papers(50), write_to_docx, repeat=5),
+        Benchmark('draw_wordcloud[result_10]', wordcloud_setup, draw_wordcloud, repeat=1),
+        Benchmark('extract_keywords_local[3100]', month_abstracts, extract_keywords_local, repeat=3),
+    ]
+
+
+def run_benchmark(benchmark: Benchmark, repeat: int | None = None) -> dict:
+    quiet = io.StringIO()
+    with tempfile.TemporaryDirectory() as work_path, contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet):
+        args = benchmark.setup(work_path)
+        benchmark.func(*args)
+
+        timings = []
+        for _ in range(repeat or benchmark.repeat):
+            start = time.perf_counter()
+            benchmark.func(*args)
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        benchmark.func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        'min': round(min(timings), 6),
+        'median': round(statistics.median(timings), 6),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def compare(name: str, result: dict, baseline: dict) -> list[str]:
+    if name not in baseline:
+        return []
+
+    failures = []
+    base = baseline[name]
+    if result['median'] > base['median'] * base.get('time_threshold', TIME_THRESHOLD):
+        failures.append(f"{name}: median {result['median']:.4f}s > {base['median']:.4f}s baseline")
+    if result['peak_kb'] > base['peak_kb'] * base.get('memory_threshold', MEMORY_THRESHOLD):
+        failures.append(f"{name}: peak {result['peak_kb']:.0f}KB > {base['peak_kb']:.0f}KB baseline")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Microbenchmarks of the CPU-bound helpers.')
+    parser.add_argument('-k', dest='keyword', help='Only run benchmarks whose name contains this string.')
+    parser.add_argument('--repeat', type=int, help='Override the number of timed runs.')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Write the results to {BASELINE_FILE}.')
+    args = parser.parse_args()
+
+    from loguru import logger
+    logger.remove()
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding='utf8') as f:
+            baseline = json.load(f)
+
+    results = {}
+    failures = []
+    for benchmark in get_benchmarks():
+        if args.keyword and args.keyword not in benchmark.name:
+            continue
+
+        result = run_benchmark(benchmark, args.repeat)
+        results[benchmark.name] = result
+        failures.extend(compare(benchmark.name, result, baseline))
+
+        base = baseline.get(benchmark.name)
+        ratio = f"{result['median'] / base['median']:.2f}x" if base else '-'
+        print(f"{benchmark.name:<40} median {result['median'] * 1000:9.2f} ms  "
+              f"min {result['min'] * 1000:9.2f} ms  peak {result['peak_kb']:9.1f} KB  vs baseline {ratio}")
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(BASELINE_FILE, 'w', encoding='utf8') as f:
+            json.dump(baseline, f, indent=2)
+        print(f'baseline saved to {BASELINE_FILE}')
+    elif failures:
+        print('\n'.join(['', 'regressions:'] + failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+End-to-end throughput benchmark of the daily and monthly pipelines against local stand-in services.
+
+    python -m benchmark.bench_pipeline --pipeline all --papers-per-day 20 --grobid-latency 0.5
+    python -m benchmark.bench_pipeline --pipeline queue --workers 4 --download 1 --grobid 1 --llm 1
+    python -m benchmark.bench_pipeline --pipeline batch --batch-latency 5
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from tabulate import tabulate
+
+from benchmark.stub_services import StubServer, StubConfig, ServiceConfig, LLMConfig
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_daily(date: str, limits: dict, deadlines: dict) -> int:
+    from backfill import plan_backfill, run_backfill
+    from util.pipeline import SharedLimits, ResourceLimits, Deadlines
+
+    work_items = plan_backfill([date], None)
+    run_backfill(work_items, SharedLimits(ResourceLimits(**limits)), deadlines=Deadlines(**deadlines))
+    return sum(len(item.papers) for item in work_items)
+
+
+def run_batch(date: str, limits: dict, deadlines: dict) -> int:
+    """The daily run with the summaries as one batch job."""
+    from backfill import plan_backfill, run_batch
+    from util.pipeline import SharedLimits, ResourceLimits, Deadlines
+
+    work_items = plan_backfill([date], None)
+    run_batch(work_items, SharedLimits(ResourceLimits(**limits)), deadlines=Deadlines(**deadlines), poll=0.5)
+    return sum(len(item.papers) for item in work_items)
+
+
+def run_queue(date: str, limits: dict, workers: int) -> int:
+    """The daily run through the work queue, with `workers` worker processes each bounded by `limits`."""
+    from backfill import plan_backfill, enqueue_backfill, collect_backfill
+    from util.work_queue import WorkQueue
+
+    work_items = plan_backfill([date], None)
+    command = [
+        sys.executable, os.path.join(REPO_PATH, 'worker.py'), '--index', '',
+        '--download', str(limits['download']), '--grobid', str(limits['grobid']), '--llm', str(limits['llm']),
+    ]
+    with WorkQueue() as queue:
+        enqueue_backfill(work_items, queue)
+        processes = [
+            subprocess.Popen(command + ['--worker-id', f'bench-{i}'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for i in range(workers)
+        ]
+        collect_backfill(work_items, queue, poll=0.2)
+        for process in processes:
+            process.wait()
+    return sum(len(item.papers) for item in work_items)
+
+
+def run_monthly(month: int) -> int:
+    """Count every day of the month into the running keyword statistics, then draw the report from them."""
+    import last_month_conclude as monthly
+    from util.keyword_stats import KeywordStats
+    from util.search_index import SearchIndex
+
+    year = datetime.now().year
+    with KeywordStats() as stats:
+        with SearchIndex() as search_index:
+            monthly.update_month(year, month, stats, search_index=search_index)
+        monthly.draw_month(stats, year, month, os.path.join('conclusion', 'image'))
+        return int(stats.paper_counts(year, month).sum())
+
+
+def measure(name: str, func, *args, trace_memory: bool = False) -> dict:
+    from util.metrics import tracer
+
+    tracer.reset()
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    papers = func(*args)
+    elapsed = time.perf_counter() - start
+
+    traced_peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024 if trace_memory else None
+    if trace_memory:
+        tracemalloc.stop()
+
+    summary = tracer.summary()
+    degraded = summary['counters'].get('degraded', {})
+    return {
+        'pipeline': name,
+        'papers': papers,
+        'elapsed': round(elapsed, 3),
+        'papers_per_minute': round(papers / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'peak_traced_mb': round(traced_peak, 1) if traced_peak is not None else None,
+        'degraded': degraded,
+        'stages': {
+            stage: {'count': data['count'], 'p50': data['p50'], 'p95': data['p95']}
+            for stage, data in summary['stages'].items()
+        },
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"\n[{report['pipeline']}] {report['papers']} papers in {report['elapsed']}s, "
+          f"{report['papers_per_minute']} papers/min, peak RSS {report['peak_rss_mb']} MB"
+          + (f", peak traced {report['peak_traced_mb']} MB" if report['peak_traced_mb'] is not None else ''))
+    rows = [
+        [stage, data['count'], f"{data['p50'] * 1000:.1f}", f"{data['p95'] * 1000:.1f}"]
+        for stage, data in report['stages'].items()
+    ]
+    print(tabulate(rows, headers=['stage', 'count', 'p50 (ms)', 'p95 (ms)']))
+    if report['degraded']:
+        print(f"degraded: {report['degraded']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the pipelines against local stand-in services.')
+    parser.add_argument('--pipeline', choices=['daily', 'monthly', 'queue', 'batch', 'all'], default='all')
+    parser.add_argument('--date', default='2024-10-01', help='Date of the daily run.')
+    parser.add_argument('--month', type=int, default=datetime.now().month, help='Month of the monthly run.')
+    parser.add_argument('--papers-per-day', type=int, default=20)
+    parser.add_argument('--month-papers-per-day', type=int, default=2)
+    parser.add_argument('--api-latency', type=float, default=0.05)
+    parser.add_argument('--pdf-latency', type=float, default=0.05)
+    parser.add_argument('--grobid-latency', type=float, default=0.5)
+    parser.add_argument('--llm-ttft', type=float, default=0.2)
+    parser.add_argument('--llm-token-latency', type=float, default=0.002)
+    parser.add_argument('--jitter', type=float, default=0.0, help='Uniform extra latency added to every service.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with HTTP 503.')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='Requests per second per service, 0 for none.')
+    parser.add_argument('--download', type=int, default=4)
+    parser.add_argument('--grobid', type=int, default=2)
+    parser.add_argument('--llm', type=int, default=4)
+    parser.add_argument('--deadline', type=float, default=240, help='Seconds per paper before it degrades.')
+    parser.add_argument('--llm-deadline', type=float, default=120, help='Seconds for the summary stream.')
+    parser.add_argument('--batch-latency', type=float, default=2.0, help='Seconds a stub batch job takes.')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes of the queue pipeline.')
+    parser.add_argument('--trace-memory', action='store_true', help='Also report the tracemalloc peak (slower).')
+    parser.add_argument('--output', help='Write the report as JSON.')
+    args = parser.parse_args()
+
+    def service(latency: float) -> ServiceConfig:
+        return ServiceConfig(latency, args.jitter, args.error_rate, args.rate_limit)
+
+    config = StubConfig(
+        api=service(args.api_latency),
+        pdf=service(args.pdf_latency),
+        grobid=service(args.grobid_latency),
+        llm=LLMConfig(0.0, args.jitter, args.error_rate, args.rate_limit, ttft=args.llm_ttft,
+                      token_latency=args.llm_token_latency),
+        papers_per_day=args.papers_per_day,
+        batch_latency=args.batch_latency,
+    )
+
+    reports = []
+    with StubServer(config) as server, tempfile.TemporaryDirectory() as work_path:
+        os.environ.update(server.environ())
+        os.environ['BIOSUMMARY_WORK_PATH'] = work_path
+        os.chdir(work_path)
+
+        if args.pipeline in ('daily', 'all'):
+            limits = {'download': args.download, 'grobid': args.grobid, 'llm': args.llm}
+            deadlines = {'paper': args.deadline, 'llm': args.llm_deadline}
+            reports.append(measure('daily', run_daily, args.date, limits, deadlines, trace_memory=args.trace_memory))
+
+        if args.pipeline == 'queue':
+            limits = {'download': args.download, 'grobid': args.grobid, 'llm': args.llm}
+            reports.append(measure(f'queue x{args.workers}', run_queue, args.date, limits, args.workers))
+
+        if args.pipeline == 'batch':
+            limits = {'download': args.download, 'grobid': args.grobid, 'llm': args.llm}
+            deadlines = {'paper': args.deadline, 'llm': args.llm_deadline}
+            reports.append(measure('batch', run_batch, args.date, limits, deadlines))
+
+        if args.pipeline in ('monthly', 'all'):
+            server.state.config.papers_per_day = args.month_papers_per_day
+            reports.append(measure('monthly', run_monthly, args.month, trace_memory=args.trace_memory))
+
+        requests_served = dict(server.state.requests)
+
+    for report in reports:
+        print_report(report)
+    print(f'\nrequests served: {requests_served}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump({'config': vars(args), 'reports': reports, 'requests': requests_served}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Regenerate the checked-in fixture corpus in `benchmark/corpus`. The output is deterministic."""
+import csv
+import os
+
+from benchmark.fixtures import make_pdf, make_tei, make_keyword_rows
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+PDFS = {
+    'short.pdf': dict(images=1, image_size=(200, 150), paragraphs=2),
+    'masked.pdf': dict(images=2, image_size=(200, 150), soft_mask=True, paragraphs=3),
+    'long.pdf': dict(images=4, image_size=(160, 120), paragraphs=10),
+}
+
+TEIS = {
+    'short.grobid.xml': 2,
+    'medium.grobid.xml': 6,
+    'long.grobid.xml': 20,
+}
+
+KEYWORD_TABLES = {
+    'result_10.csv': (2000, 10),
+}
+
+
+def main() -> None:
+    os.makedirs(CORPUS_PATH, exist_ok=True)
+
+    for name, options in PDFS.items():
+        with open(os.path.join(CORPUS_PATH, name), 'wb') as f:
+            f.write(make_pdf(name, name.removesuffix('.pdf').title(), **options))
+
+    for name, paragraphs in TEIS.items():
+        with open(os.path.join(CORPUS_PATH, name), 'w', encoding='utf8') as f:
+            f.write(make_tei(name, paragraphs))
+
+    for name, (rows, month) in KEYWORD_TABLES.items():
+        data = make_keyword_rows(rows, month)
+        with open(os.path.join(CORPUS_PATH, name), 'w', encoding='utf8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(data[0]))
+            writer.writeheader()
+            writer.writerows(data)
+
+    print(f'corpus written to {CORPUS_PATH}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""Deterministic synthetic papers, PDFs and Grobid TEI documents for the benchmarks."""
+import random
+import zlib
+from datetime import datetime, timedelta
+
+CATEGORIES = [
+    'bioinformatics',
+    'genomics',
+    'neuroscience',
+    'microbiology',
+    'cell biology',
+    'ecology',
+]
+
+VOCABULARY = [
+    'single-cell', 'RNA sequencing', 'genome assembly', 'k-mer', 'k-mers', 'protein structure', 'deep learning',
+    'transcriptomics', 'CRISPR', 'gene regulation', 'chromatin', 'microbiome', 'phylogenetics', 'metagenomics',
+    'variant calling', 'spatial transcriptomics', 'neural circuits', 'synaptic plasticity', 'cortex', 'zebrafish',
+    'mouse model', 'organoid', 'cell migration', 'mitochondria', 'immune response', 'T cells', 'antibiotic resistance',
+    'biofilm', 'population genetics', 'selection', 'adaptation', 'climate change', 'biodiversity', 'machine learning',
+    'language model', 'alignment', 'long reads', 'structural variants', 'epigenetics', 'methylation',
+]
+
+FILLER = (
+    'we', 'show', 'that', 'the', 'method', 'improves', 'accuracy', 'across', 'datasets', 'and', 'reveals',
+    'novel', 'patterns', 'in', 'data', 'from', 'experiments', 'with', 'high', 'resolution', 'using', 'a',
+)
+
+SECTION_TITLES = ['Introduction', 'Results', 'Discussion', 'Methods', 'Conclusion']
+
+
+def make_sentence(rng: random.Random, words: int = 14) -> str:
+    tokens = [rng.choice(VOCABULARY) if rng.random() < 0.25 else rng.choice(FILLER) for _ in range(words)]
+    return ' '.join(tokens).capitalize() + '.'
+
+
+def make_text(rng: random.Random, sentences: int) -> str:
+    return ' '.join(make_sentence(rng) for _ in range(sentences))
+
+
+def make_paper(index: int, date: str, category: str | None = None, version: str = '1') -> dict:
+    """A record in the shape of the bioRxiv details API."""
+    rng = random.Random(f'{date}-{index}')
+    doi = f"10.1101/{date.replace('-', '.')}.{index:06d}"
+    authors = '; '.join(f'Author{rng.randint(1, 999)}, A.' for _ in range(rng.randint(1, 6)))
+    return {
+        'doi': doi,
+        'title': make_sentence(rng, 8).rstrip('.'),
+        'authors': authors,
+        'author_corresponding': authors.split('; ')[0],
+        'author_corresponding_institution': f'Institute {rng.randint(1, 50)}',
+        'date': date,
+        'version': version,
+        'type': 'new results',
+        'license': 'cc_by',
+        'category': category or CATEGORIES[index % len(CATEGORIES)],
+        'jatsxml': f'https://www.biorxiv.org/content/early/{date}/{doi}.source.xml',
+        'abstract': make_text(rng, 8),
+        'published': 'NA',
+        'server': 'bioRxiv',
+    }
+
+
+def make_papers(start: str, end: str, papers_per_day: int) -> list[dict]:
+    start_date = datetime.strptime(start, '%Y-%m-%d')
+    end_date = datetime.strptime(end, '%Y-%m-%d')
+    papers = []
+    for day in range((end_date - start_date).days + 1):
+        date = (start_date + timedelta(days=day)).strftime('%Y-%m-%d')
+        papers.extend(
+            make_paper(i, date, version='1' if i % 5 else '2')
+            for i in range(papers_per_day)
+        )
+    return papers
+
+
+def make_sections(seed: str, paragraphs: int = 3) -> dict[str, list[str]]:
+    rng = random.Random(seed)
+    return {
+        title: [make_text(rng, 6) for _ in range(paragraphs)]
+        for title in SECTION_TITLES
+    }
+
+
+def make_tei(seed: str, paragraphs: int = 3) -> str:
+    """A Grobid `processFulltextDocument` style TEI document."""
+    divs = []
+    for title, section in make_sections(seed, paragraphs).items():
+        body = ''.join(f'<p>{p}</p>' for p in section)
+        divs.append(f'<div xmlns="http://www.tei-c.org/ns/1.0"><head>{title}</head>{body}</div>')
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<TEI xml:space="preserve" xmlns="http://www.tei-c.org/ns/1.0">'
+        '<teiHeader><fileDesc><titleStmt><title level="a" type="main">Synthetic paper</title></titleStmt>'
+        '</fileDesc></teiHeader>'
+        f'<text xml:lang="en"><body>{"".join(divs)}</body><back/></text></TEI>'
+    )
+
+
+def _escape_pdf_text(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _wrap(text: str, width: int = 95) -> list[str]:
+    lines, line = [], ''
+    for word in text.split():
+        if len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f'{line} {word}'.strip()
+    if line:
+        lines.append(line)
+    return lines
+
+
+def _image_stream(width: int, height: int, seed: str) -> bytes:
+    rng = random.Random(seed)
+    base = [rng.randint(0, 255) for _ in range(3)]
+    rows = bytearray()
+    for y in range(height):
+        for x in range(width):
+            rows += bytes(((base[0] + x) % 256, (base[1] + y) % 256, (base[2] + x * y) % 256))
+    return zlib.compress(bytes(rows))
+
+
+def make_pdf(
+        seed: str,
+        title: str = 'Synthetic paper',
+        images: int = 1,
+        image_size: tuple[int, int] = (320, 240),
+        soft_mask: bool = False,
+        paragraphs: int = 3
+) -> bytes:
+    """
+    Build a small but valid multi-page PDF with a bold title, bold section headings, body text and images.
+
+    Headings are set at a larger size than the body so font-size heuristics can find them. With `soft_mask`
+    every image gets a /SMask, which takes the slow path of `recover_pix`.
+    """
+    page_width, page_height = 612, 792
+    lines: list[tuple[str, str, int]] = [('F2', title, 16), ('F1', '', 10)]
+    for heading, section in make_sections(seed, paragraphs).items():
+        lines.append(('F2', heading, 13))
+        for paragraph in section:
+            lines.extend(('F1', line, 10) for line in _wrap(paragraph))
+        lines.append(('F1', '', 10))
+
+    per_page = 50
+    pages = [lines[i:i + per_page] for i in range(0, len(lines), per_page)]
+
+    objects: list[bytes] = []
+
+    def add(obj: bytes) -> int:
+        objects.append(obj)
+        return len(objects)
+
+    catalog_id = add(b'')
+    pages_id = add(b'')
+    font_regular = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    font_bold = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >>')
+
+    image_ids = []
+    for i in range(images):
+        width, height = image_size
+        data = _image_stream(width, height, f'{seed}-{i}')
+        mask = ''
+        if soft_mask:
+            alpha = zlib.compress(bytes((x * 255 // width) for _ in range(height) for x in range(width)))
+            mask_id = add(
+                f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray '
+                f'/BitsPerComponent 8 /Filter /FlateDecode /Length {len(alpha)} >>\nstream\n'.encode() + alpha + b'\nendstream'
+            )
+            mask = f'/SMask {mask_id} 0 R '
+        image_ids.append(add(
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceRGB {mask}'
+            f'/BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>\nstream\n'.encode() + data + b'\nendstream'
+        ))
+
+    page_ids = []
+    for page_no, page_lines in enumerate(pages):
+        commands = []
+        y = page_height - 60
+        for font, text, size in page_lines:
+            if text:
+                commands.append(f'BT /{font} {size} Tf 50 {y} Td ({_escape_pdf_text(text)}) Tj ET')
+            y -= size + 4
+
+        xobjects = ''
+        if page_no < len(image_ids):
+            commands.append(f'q 240 0 0 180 330 {max(y - 190, 20)} cm /Im{page_no} Do Q')
+            xobjects = f'/XObject << /Im{page_no} {image_ids[page_no]} 0 R >>'
+
+        content = '\n'.join(commands).encode('latin-1', 'replace')
+        content_id = add(f'<< /Length {len(content)} >>\nstream\n'.encode() + content + b'\nendstream')
+        page_ids.append(add(
+            f'<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 {page_width} {page_height}] '
+            f'/Resources << /Font << /F1 {font_regular} 0 R /F2 {font_bold} 0 R >> {xobjects} >> '
+            f'/Contents {content_id} 0 R >>'.encode()
+        ))
+
+    objects[catalog_id - 1] = f'<< /Type /Catalog /Pages {pages_id} 0 R >>'.encode()
+    kids = ' '.join(f'{i} 0 R' for i in page_ids)
+    objects[pages_id - 1] = f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode()
+
+    output = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f'{number} 0 obj\n'.encode() + obj + b'\nendobj\n'
+
+    xref_offset = len(output)
+    output += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    for offset in offsets:
+        output += f'{offset:010d} 00000 n \n'.encode()
+    output += f'trailer\n<< /Size {len(objects) + 1} /Root {catalog_id} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode()
+
+    return bytes(output)
+
+
+def _keyword_variant(rng: random.Random, keyword: str) -> str:
+    """The kind of surface variation an LLM produces for the same keyword."""
+    roll = rng.random()
+    if roll < 0.15:
+        return keyword.title()
+    if roll < 0.25 and not keyword.endswith('s'):
+        return f'{keyword}s'
+    if roll < 0.3:
+        return keyword.lower()
+    return keyword
+
+
+def make_keyword_rows(rows: int, month: int, seed: int = 0) -> list[dict]:
+    """Rows in the shape of `result_{month}.csv` written by `get_key_words`."""
+    rng = random.Random(seed)
+    result = []
+    for index in range(rows):
+        paper = make_paper(index, f'2024-{month:02d}-{index % 28 + 1:02d}')
+        keywords = [_keyword_variant(rng, k) for k in rng.sample(VOCABULARY, rng.randint(3, 7))]
+        result.append({
+            'doi': paper['doi'],
+            'title': paper['title'],
+            'date': paper['date'],
+            'category': paper['category'],
+            'abstract': None,
+            'keywords': repr(keywords),
+        })
+    return result
@@ -0,0 +1,388 @@
+"""
+Local stand-ins for the bioRxiv details API, bioRxiv PDF hosting, Grobid and OpenAI-compatible chat and batch
+endpoints.
+
+Every service has its own latency, error rate and rate limit, so pipeline benchmarks can be reproduced offline.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+from benchmark.fixtures import make_papers, make_pdf, make_tei, VOCABULARY
+
+
+@dataclass
+class ServiceConfig:
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_limit: float = 0.0
+    """Requests per second, 0 for unlimited. Requests over the limit get HTTP 429."""
+
+
+@dataclass
+class LLMConfig(ServiceConfig):
+    ttft: float = 0.2
+    token_latency: float = 0.005
+    tokens: int = 200
+
+
+@dataclass
+class StubConfig:
+    api: ServiceConfig = field(default_factory=ServiceConfig)
+    pdf: ServiceConfig = field(default_factory=lambda: ServiceConfig(latency=0.05))
+    grobid: ServiceConfig = field(default_factory=lambda: ServiceConfig(latency=0.5))
+    llm: LLMConfig = field(default_factory=LLMConfig)
+    papers_per_day: int = 20
+    batch_latency: float = 2.0
+    """Seconds a batch stays in progress before it completes."""
+    pdf_images: int = 2
+    seed: int = 0
+
+
+class TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        if self.rate <= 0:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class StubState:
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.rng_lock = threading.Lock()
+        self.buckets = {
+            name: TokenBucket(getattr(config, name).rate_limit)
+            for name in ('api', 'pdf', 'grobid', 'llm')
+        }
+        self.requests = {name: 0 for name in self.buckets}
+        self._pdf_cache: dict[str, bytes] = {}
+        self.files: dict[str, tuple[str, bytes]] = {}
+        self.batches: dict[str, dict] = {}
+        self.batch_lock = threading.Lock()
+
+    def random(self) -> float:
+        with self.rng_lock:
+            return self.rng.random()
+
+    def pdf(self, doi: str) -> bytes:
+        # a handful of templates keeps the stand-in itself from becoming the bottleneck
+        key = f'paper-{zlib.crc32(doi.encode()) % 16}'
+        with self.rng_lock:
+            if key not in self._pdf_cache:
+                self._pdf_cache[key] = make_pdf(key, key, images=self.config.pdf_images)
+            return self._pdf_cache[key]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: 'StubServer'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self) -> StubState:
+        return self.server.state
+
+    def _admit(self, service: str) -> bool:
+        """Apply the latency, rate limit and error rate of `service`. Returns False if an error was sent."""
+        config: ServiceConfig = getattr(self.state.config, service)
+        self.state.requests[service] += 1
+
+        if not self.state.buckets[service].take():
+            self._send(429, b'rate limited', 'text/plain')
+            return False
+
+        delay = config.latency + (self.state.random() * config.jitter if config.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+        if config.error_rate and self.state.random() < config.error_rate:
+            self._send(503, b'injected error', 'text/plain')
+            return False
+
+        return True
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, status: int = 200) -> None:
+        self._send(status, json.dumps(data).encode(), 'application/json')
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+
+        if match := re.fullmatch(r'/details/biorxiv/([\d-]+)/([\d-]+)/(\d+)(?:/json)?', path):
+            if self._admit('api'):
+                self._details(match.group(1), match.group(2), int(match.group(3)))
+        elif match := re.fullmatch(r'/content/(.+)v\d+\.full\.pdf', path):
+            if self._admit('pdf'):
+                self._send(200, self.state.pdf(match.group(1)), 'application/pdf')
+        elif match := re.fullmatch(r'/v1/files/([\w-]+)/content', path):
+            self._file_content(match.group(1))
+        elif match := re.fullmatch(r'/v1/batches/([\w-]+)', path):
+            self._batch(match.group(1))
+        elif path == '/api/isalive':
+            self._send(200, b'true', 'text/plain')
+        else:
+            self._send(404, b'not found', 'text/plain')
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_body()
+
+        if path == '/api/processFulltextDocument':
+            if self._admit('grobid'):
+                self._send(200, make_tei(str(len(body))).encode(), 'application/xml')
+        elif path == '/v1/chat/completions':
+            if self._admit('llm'):
+                self._chat(json.loads(body))
+        elif path == '/v1/files':
+            if self._admit('llm'):
+                self._upload(body)
+        elif path == '/v1/batches':
+            if self._admit('llm'):
+                self._create_batch(json.loads(body))
+        else:
+            self._send(404, b'not found', 'text/plain')
+
+    def _details(self, start: str, end: str, cursor: int) -> None:
+        papers = make_papers(start, end, self.state.config.papers_per_day)
+        page = papers[cursor:cursor + 100]
+        self._send_json({
+            'messages': [{
+                'status': 'ok',
+                'interval': f'{start}:{end}',
+                'cursor': cursor,
+                'count': len(page),
+                'count_new_papers': sum(p['version'] == '1' for p in papers),
+                'total': len(papers),
+            }],
+            'collection': page,
+        })
+
+    def _completion_text(self, messages: list[dict]) -> str:
+        prompt = ' '.join(str(m.get('content', '')) for m in messages)
+        if 'keywords' in prompt.lower() and 'format' in prompt.lower():
+            rng = random.Random(prompt)
+            return json.dumps({'keywords': rng.sample(VOCABULARY, rng.randint(3, 7))})
+
+        rng = random.Random(prompt)
+        return ''.join(rng.choice('来自研究团队的这项工作提出了新的方法并取得显著成果。') for _ in range(self.state.config.llm.tokens))
+
+    def _chat(self, request: dict) -> None:
+        config = self.state.config.llm
+        text = self._completion_text(request.get('messages', []))
+        model = request.get('model', 'stub')
+
+        if not request.get('stream'):
+            time.sleep(config.ttft + config.token_latency * len(text))
+            self._send_json(completion_body(model, text))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write_chunk(data: bytes) -> None:
+            self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+            self.wfile.flush()
+
+        time.sleep(config.ttft)
+        for i, token in enumerate(text):
+            chunk = {
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': token} if i == 0 else {'content': token},
+                             'finish_reason': None}],
+            }
+            write_chunk(f'data: {json.dumps(chunk)}\n\n'.encode())
+            if config.token_latency:
+                time.sleep(config.token_latency)
+
+        done = {
+            'id': 'chatcmpl-stub', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+        }
+        write_chunk(f'data: {json.dumps(done)}\n\n'.encode())
+        write_chunk(b'data: [DONE]\n\n')
+        write_chunk(b'')
+
+    def _upload(self, body: bytes) -> None:
+        message = BytesParser(policy=HTTP).parsebytes(
+            f'Content-Type: {self.headers["Content-Type"]}\r\n\r\n'.encode() + body
+        )
+        fields = {part.get_param('name', header='content-disposition'): part for part in message.iter_parts()}
+        upload = fields['file']
+        filename = upload.get_filename() or 'upload.jsonl'
+        data = upload.get_payload(decode=True)
+
+        file_id = f'file-{uuid.uuid4().hex[:12]}'
+        with self.state.batch_lock:
+            self.state.files[file_id] = (filename, data)
+        self._send_json(file_object(file_id, filename, len(data), fields['purpose'].get_content().strip()))
+
+    def _file_content(self, file_id: str) -> None:
+        with self.state.batch_lock:
+            file = self.state.files.get(file_id)
+        if file is None:
+            self._send_json({'error': {'message': f'no file {file_id}'}}, status=404)
+        else:
+            self._send(200, file[1], 'application/jsonl')
+
+    def _create_batch(self, request: dict) -> None:
+        with self.state.batch_lock:
+            if request['input_file_id'] not in self.state.files:
+                self._send_json({'error': {'message': f"no file {request['input_file_id']}"}}, status=400)
+                return
+            batch = {
+                'id': f'batch_{uuid.uuid4().hex[:12]}',
+                'object': 'batch',
+                'endpoint': request['endpoint'],
+                'input_file_id': request['input_file_id'],
+                'completion_window': request['completion_window'],
+                'status': 'in_progress',
+                'created_at': int(time.time()),
+                'output_file_id': None,
+                'error_file_id': None,
+                'metadata': request.get('metadata'),
+                'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+            }
+            self.state.batches[batch['id']] = batch
+        self._send_json(batch)
+
+    def _batch(self, batch_id: str) -> None:
+        with self.state.batch_lock:
+            batch = self.state.batches.get(batch_id)
+            if batch is None:
+                self._send_json({'error': {'message': f'no batch {batch_id}'}}, status=404)
+                return
+            if batch['status'] == 'in_progress' and time.time() - batch['created_at'] >= self.state.config.batch_latency:
+                self._run_batch(batch)
+        self._send_json(batch)
+
+    def _run_batch(self, batch: dict) -> None:
+        """Answer every request of a batch at once, with the chat error rate applied to each one."""
+        lines = self.state.files[batch['input_file_id']][1].decode().splitlines()
+        results = []
+        failed = 0
+        for line in filter(None, lines):
+            request = json.loads(line)
+            result = {'id': f'batch_req_{uuid.uuid4().hex[:12]}', 'custom_id': request['custom_id']}
+            error_rate = self.state.config.llm.error_rate
+            if error_rate and self.state.random() < error_rate:
+                failed += 1
+                result['response'] = {'status_code': 503, 'request_id': result['id'], 'body': {}}
+                result['error'] = {'code': 'injected_error', 'message': 'injected error'}
+            else:
+                body = request['body']
+                text = self._completion_text(body.get('messages', []))
+                result['response'] = {
+                    'status_code': 200, 'request_id': result['id'], 'body': completion_body(body.get('model', 'stub'), text)
+                }
+                result['error'] = None
+            results.append(json.dumps(result, ensure_ascii=False))
+
+        output_id = f'file-{uuid.uuid4().hex[:12]}'
+        self.state.files[output_id] = (f"{batch['id']}_output.jsonl", '\n'.join(results).encode() + b'\n')
+        batch.update(
+            status='completed',
+            output_file_id=output_id,
+            completed_at=int(time.time()),
+            request_counts={'total': len(results), 'completed': len(results) - failed, 'failed': failed},
+        )
+
+
+def completion_body(model: str, text: str) -> dict:
+    return {
+        'id': 'chatcmpl-stub',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': len(text), 'total_tokens': len(text)},
+    }
+
+
+def file_object(file_id: str, filename: str, size: int, purpose: str) -> dict:
+    return {
+        'id': file_id,
+        'object': 'file',
+        'bytes': size,
+        'created_at': int(time.time()),
+        'filename': filename,
+        'purpose': purpose,
+        'status': 'processed',
+    }
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config: StubConfig, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), StubHandler)
+        self.state = StubState(config)
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def environ(self) -> dict[str, str]:
+        """Environment variables that point the pipeline at this server."""
+        return {
+            'BIORXIV_API_ENDPOINT': f'{self.url}/details/biorxiv',
+            'BIORXIV_PDF_ENDPOINT': f'{self.url}/content',
+            'GROBID_SERVER': self.url,
+            'LLM_API_BASE': f'{self.url}/v1',
+            'OPENAI_API_BASE': f'{self.url}/v1',
+            'LLM_BATCH_ENDPOINT': '/v1/chat/completions',
+            'GML_KEY': 'stub-key',
+            'GPT_KEY': 'stub-key',
+        }
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        self.server_close()
@@ -1,25 +1,28 @@
+import argparse
 import calendar
 import os
-import random
-from datetime import datetime
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator
 
 import pandas as pd
-import streamlit as st
-import seaborn as sns
 import requests
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
-from langchain_openai import ChatOpenAI
 from loguru import logger
-from matplotlib import pyplot as plt
-from openai import BadRequestError
-from pandas import DataFrame
-from pydantic import FilePath, Field, BaseModel
+from pandas import DataFrame, Series
+from pydantic import FilePath
 from tqdm import tqdm
-from wordcloud import WordCloud
 
 from util.biorxiv_fetcher import USER_AGENT, CONTENT_ENDPOINT
 from util.decorator import retry
+from util.keyword_norm import canonical_keywords, KEYWORD_MAP_FILE
+from util.keyword_stats import KeywordStats, month_of, add_months
+from util.keywords import KeywordResponse, KeywordBackend, KEYWORD_BACKEND, extract_keywords_local
+from util.llm_integration import get_secret, LLM_API_BASE, OPENAI_API_BASE
+from util.metrics import tracer, span, traced
+from util.resilience import Dependency, RetryableError, reset_run, is_retryable
+from util.search_index import SearchIndex, parse_keywords
+
 
 KEYWORD_SYSTEM = """
 I will provide you with the abstract of an academic paper. 
@@ -55,24 +58,27 @@ Here is the abstract of a research paper. Please extract 3 to 7 keywords based o
 {abstract}
 """
 
-YEAR = 24
-
+# rows read or extracted at a time, memory stays flat whatever the date range
+CHUNK_SIZE = 2000
+PAPER_COLUMNS = ['doi', 'title', 'date', 'category', 'abstract']
 
-class KeywordResponse(BaseModel):
-    keywords: list[str] = Field(description='Keywords list of the paper.')
 
-
-def get_month_start_end(month: int) -> tuple[str, str]:
-    year = datetime.now().year
+def get_month_start_end(month: int, year: int | None = None) -> tuple[str, str]:
+    year = year or datetime.now().year
     first_day = f"{year}-{month:02d}-01"
     last_day = f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]}"
     return first_day, last_day
 
 
-@retry(delay=random.uniform(2.0, 5.0))
-def download_info(month: int, start: int = 0) -> tuple[int, DataFrame]:
-    first_day, last_day = get_month_start_end(month)
+def last_month() -> tuple[int, int]:
+    first_of_month = datetime.now().replace(day=1)
+    previous = first_of_month - timedelta(days=1)
+    return previous.year, previous.month
+
 
+@retry(delay=2.0, breaker=Dependency.BIORXIV_API)
+@traced('fetch')
+def download_info(first_day: str, last_day: str, start: int = 0) -> tuple[int, DataFrame]:
     url = f"{CONTENT_ENDPOINT}/{first_day}/{last_day}/{start}/json"
     payload = {}
     headers = {'User-Agent': USER_AGENT}
@@ -80,109 +86,338 @@ def download_info(month: int, start: int = 0) -> tuple[int, DataFrame]:
     response = requests.request("GET", url, headers=headers, data=payload).json()
     message: dict = response['messages'][0]
 
-    total = int(message['total'])
+    # bioRxiv answers a range without papers, like a day without posts, with this status instead of "ok"
+    if message['status'] == "no posts found":
+        return 0, DataFrame(columns=PAPER_COLUMNS)
     if message['status'] != "ok":
-        raise Exception("下载信息失败")
+        raise RetryableError("下载信息失败")
+    total = int(message['total'])
 
     return total, DataFrame(response['collection'])
 
 
-def get_month_data(month: int, csv_path: FilePath) -> None:
+def iter_pages(first_day: str, last_day: str) -> Iterator[DataFrame]:
+    """Every page of the details API over a date range, one page of at most 100 papers at a time."""
+    total, page = download_info(first_day, last_day)
+    yield page
+    for start in range(len(page), total, 100):
+        yield download_info(first_day, last_day, start)[1]
+
+
+def rechunk(frames: Iterable[DataFrame], size: int = CHUNK_SIZE) -> Iterator[DataFrame]:
+    """Regroup a stream of small frames, like API pages, into chunks of about `size` rows."""
+    buffer, rows = [], 0
+    for frame in frames:
+        buffer.append(frame)
+        rows += len(frame)
+        if rows >= size:
+            yield pd.concat(buffer, ignore_index=True)
+            buffer, rows = [], 0
+    if buffer:
+        yield pd.concat(buffer, ignore_index=True)
+
+
+def get_month_data(month: int, csv_path: FilePath, year: int | None = None) -> None:
     if os.path.exists(csv_path):
         os.remove(csv_path)
         logger.warning('检测到已经存在文件，已删除')
 
-    total, _ = download_info(month)
-    logger.info(f'总共 {total} 篇文献，开始下载...')
-
-    for start in tqdm(range(0, total, 100)):
-        _, df = download_info(month, start)
-        df.to_csv(csv_path, index=False, mode='a', header=not os.path.exists(csv_path))
+    first_day, last_day = get_month_start_end(month, year)
+    logger.info(f'开始下载 {first_day} 至 {last_day} 的文献...')
+    for page in tqdm(iter_pages(first_day, last_day)):
+        page.to_csv(csv_path, index=False, mode='a', header=not os.path.exists(csv_path))
 
     logger.info(f'结果已保存至 {csv_path}')
 
 
-def clear_data(raw_path: FilePath, clean_path: FilePath) -> DataFrame:
-    raw_data = pd.read_csv(raw_path)
-    clean_data = raw_data.drop_duplicates(
-        subset=['doi']
-    ).drop(
-        columns=[
-            'authors', 'author_corresponding',
-            'author_corresponding_institution',
-            'version', 'type',
-            'license', 'jatsxml',
-            'published', 'server'
-        ]
-    )
+def clear_data(raw_path: FilePath, clean_path: FilePath, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Drop the repeated versions and the unused columns of a raw month file, one chunk at a time.
+
+    Returns:
+        int: The number of papers written to `clean_path`.
+    """
+    if os.path.exists(clean_path):
+        os.remove(clean_path)
+
+    seen: set[str] = set()
+    papers = 0
+    for chunk in pd.read_csv(raw_path, chunksize=chunk_size):
+        chunk = chunk.drop_duplicates(subset=['doi'])
+        chunk = chunk[~chunk['doi'].isin(seen)].drop(
+            columns=[
+                'authors', 'author_corresponding',
+                'author_corresponding_institution',
+                'version', 'type',
+                'license', 'jatsxml',
+                'published', 'server'
+            ],
+            errors='ignore'
+        )
+        seen.update(chunk['doi'])
+        chunk.to_csv(clean_path, index=False, mode='a', header=not os.path.exists(clean_path))
+        papers += len(chunk)
 
-    clean_data.to_csv(clean_path, index=False)
+    return papers
 
-    return clean_data
 
+def is_parse_error(e: BaseException) -> bool:
+    # langchain is only loaded with the LLM backend, so its exception is not imported here
+    exceptions = sys.modules.get('langchain_core.exceptions')
+    return exceptions is not None and isinstance(e, exceptions.OutputParserException)
 
-def get_key_words(paper_infos: DataFrame, result_path: FilePath) -> None:
-    @retry(delay=random.uniform(2.0, 5.0))
-    def ask_llm(_abstract: str):
-        llm = ChatOpenAI(
-            model_name="glm-4-flash",
-            openai_api_base='https://open.bigmodel.cn/api/paas/v4',
-            temperature=0.1,
-            openai_api_key=st.secrets['gml_key'],
-        )
 
-        parser = PydanticOutputParser(pydantic_object=KeywordResponse)
+@retry(delay=2.0, breaker=Dependency.LLM, retry_on=lambda e: is_retryable(e) or is_parse_error(e))
+def ask_llm(abstract: str) -> KeywordResponse:
+    from langchain_core.output_parsers import PydanticOutputParser
+    from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
+    from langchain_openai import ChatOpenAI
+    from openai import BadRequestError
 
-        prompt = ChatPromptTemplate.from_messages([
-            SystemMessagePromptTemplate.from_template(KEYWORD_SYSTEM),
-            HumanMessagePromptTemplate.from_template(KEYWORD_QUESTION)
-        ])
+    llm = ChatOpenAI(
+        model_name="glm-4-flash",
+        openai_api_base=LLM_API_BASE,
+        temperature=0.1,
+        openai_api_key=get_secret('gml_key'),
+    )
 
-        prompt_and_model = prompt | llm | parser
+    parser = PydanticOutputParser(pydantic_object=KeywordResponse)
 
-        try:
-            return prompt_and_model.invoke({'abstract': _abstract, 'format_instructions': parser.get_format_instructions()})
-        except BadRequestError:
-            llm_gpt = ChatOpenAI(
-                model_name="gpt-4o-mini",
-                temperature=0.1,
-                openai_api_key=st.secrets['gpt_key'],
-            )
-            prompt_and_model = prompt | llm_gpt | parser
-            logger.warning('check to gpt 40 mini')
+    prompt = ChatPromptTemplate.from_messages([
+        SystemMessagePromptTemplate.from_template(KEYWORD_SYSTEM),
+        HumanMessagePromptTemplate.from_template(KEYWORD_QUESTION)
+    ])
 
-            return prompt_and_model.invoke({'abstract': _abstract, 'format_instructions': parser.get_format_instructions()})
+    prompt_and_model = prompt | llm | parser
 
+    try:
+        with span('keywords', model='glm-4-flash'):
+            return prompt_and_model.invoke({'abstract': abstract, 'format_instructions': parser.get_format_instructions()})
+    except BadRequestError:
+        llm_gpt = ChatOpenAI(
+            model_name="gpt-4o-mini",
+            openai_api_base=OPENAI_API_BASE,
+            temperature=0.1,
+            openai_api_key=get_secret('gpt_key'),
+        )
+        prompt_and_model = prompt | llm_gpt | parser
+        logger.warning('check to gpt 40 mini')
+
+        with span('keywords', model='gpt-4o-mini'):
+            return prompt_and_model.invoke({'abstract': abstract, 'format_instructions': parser.get_format_instructions()})
+
+
+def llm_keywords(abstract: str) -> list[str]:
+    """The keywords of one abstract, none when the LLM keeps answering in the wrong format."""
+    if not isinstance(abstract, str):
+        return []
+    try:
+        return ask_llm(abstract).keywords
+    except Exception as e:
+        if not is_parse_error(e):
+            raise
+        logger.warning(f'关键词格式错误，该文献不计关键词: {repr(e)}')
+        tracer.incr('keywords', 'parse_errors')
+        return []
+
+
+def get_key_words(
+        clean_path: FilePath,
+        result_path: FilePath,
+        backend: KeywordBackend = KEYWORD_BACKEND,
+        chunk_size: int = CHUNK_SIZE,
+        batch: int = 10
+) -> None:
+    """
+    Extract the keywords of every paper of a file written by `clear_data`, one chunk at a time.
+
+    Results are appended to `result_path` without the abstracts, `batch` papers at a time with the LLM backend.
+    A rerun skips the papers already in `result_path`.
+    """
+    done: set[str] = set()
     if os.path.exists(result_path):
-        output_df = pd.read_csv(result_path)
-        logger.info(f'load from {result_path}, total: {len(output_df)}')
-    else:
-        output_df = paper_infos.copy()
-        output_df['keywords'] = pd.NA
-        logger.info(f'load from dataframe, total: {len(output_df)}')
-
-    for index, row in tqdm(output_df.iterrows(), total=len(output_df)):
-        if not pd.isna(row.keywords):
-            continue
-
-        abstract = row['abstract']
+        for chunk in pd.read_csv(result_path, usecols=['doi'], chunksize=chunk_size):
+            done.update(chunk['doi'])
+        logger.info(f'load from {result_path}, done: {len(done)}')
 
-        result = ask_llm(abstract)
-        output_df.at[index, 'keywords'] = result.keywords
-        output_df.at[index, 'abstract'] = pd.NA
+    def save(rows: DataFrame, keywords: list[list[str]]) -> None:
+        rows = rows.drop(columns=['abstract']).assign(keywords=pd.Series(keywords, index=rows.index, dtype=object))
+        rows.to_csv(result_path, index=False, mode='a', header=not os.path.exists(result_path))
 
-        if index % 10 == 0:
-            output_df.to_csv(result_path, index=False)
+    for chunk in pd.read_csv(clean_path, chunksize=chunk_size):
+        chunk = chunk[~chunk['doi'].isin(done)]
+        if chunk.empty:
+            continue
 
-    output_df.to_csv(result_path, index=False)
+        abstracts = chunk['abstract'].astype(object).tolist()
+        if backend == KeywordBackend.LOCAL:
+            with span('keywords', model='local', papers=len(chunk)):
+                results = extract_keywords_local(abstracts)
+            save(chunk, [result.keywords for result in results])
+            continue
 
+        for start in tqdm(range(0, len(chunk), batch)):
+            save(chunk.iloc[start:start + batch], [llm_keywords(abstract) for abstract in abstracts[start:start + batch]])
+
+
+def count_papers(
+        papers: DataFrame,
+        stats: KeywordStats,
+        backend: KeywordBackend = KEYWORD_BACKEND,
+        batch: int = 10,
+        search_index: SearchIndex | None = None
+) -> tuple[int, int]:
+    """
+    Extract the keywords of a chunk of papers and add them to the running monthly statistics.
+
+    Papers already counted in their month are skipped, and a paper seen in an earlier month reuses its keywords,
+    so every paper is extracted once. LLM results are stored every `batch` papers, an interrupted run resumes
+    where it stopped. The local backend weighs phrases against the papers of this chunk, so its keywords depend
+    on how the papers are chunked, a day at a time with `update_day` or `CHUNK_SIZE` rows with `count_csv`. They
+    are stored at the first extraction and never recomputed, so a month keeps its keywords across reruns.
+
+    Args:
+        papers (DataFrame): Papers with at least the columns of `PAPER_COLUMNS`, from any number of days.
+        stats (KeywordStats): The running statistics.
+        backend (KeywordBackend): How keywords are extracted.
+        batch (int): Papers per stored batch with the LLM backend.
+        search_index (SearchIndex | None): Also indexes the keywords of every stored batch for search.
+
+    Returns:
+        tuple[int, int]: The number of papers newly counted and of papers skipped as already counted.
+    """
+    if papers.empty:
+        return 0, 0
+
+    papers = papers.assign(month=papers['date'].str[:7]).drop_duplicates(subset=['month', 'doi'])
+    fresh, skipped = [], 0
+    for month_key, group in papers.groupby('month', sort=False):
+        seen = stats.seen(*month_of(f'{month_key}-01'), group['doi'])
+        skipped += len(seen)
+        fresh.append(group[~group['doi'].isin(seen)])
+    papers = pd.concat(fresh)
+    known = stats.known_keywords(papers['doi'])
+
+    def store(counted: list[tuple]) -> int:
+        if search_index is not None:
+            search_index.add_keywords(DataFrame(counted, columns=[*PAPER_COLUMNS[:4], 'keywords']))
+        return stats.add_papers(counted)
+
+    rows = list(zip(*(papers[column] for column in PAPER_COLUMNS)))
+    added = store([(*row[:4], known[row[0]]) for row in rows if row[0] in known])
+    todo = [row for row in rows if row[0] not in known]
+
+    if backend == KeywordBackend.LOCAL:
+        with span('keywords', model='local', papers=len(todo)):
+            results = extract_keywords_local([row[4] for row in todo])
+        added += store([(*row[:4], result.keywords) for row, result in zip(todo, results)])
+    else:
+        for start in tqdm(range(0, len(todo), batch)):
+            chunk = [
+                (*row[:4], llm_keywords(row[4]))
+                for row in todo[start:start + batch]
+            ]
+            added += store(chunk)
+
+    return added, skipped
+
+
+def update_day(
+        date: str,
+        stats: KeywordStats,
+        backend: KeywordBackend = KEYWORD_BACKEND,
+        search_index: SearchIndex | None = None
+) -> int:
+    """
+    Count one day's papers into the running monthly statistics, streaming the API pages in chunks.
+    With `search_index`, their keywords are indexed for search as they are counted.
+
+    Returns:
+        int: The number of papers newly counted.
+    """
+    added = skipped = 0
+    for chunk in rechunk(iter_pages(date, date)):
+        chunk_added, chunk_skipped = count_papers(chunk, stats, backend, search_index=search_index)
+        added += chunk_added
+        skipped += chunk_skipped
+
+    stats.mark_day(date, added + skipped)
+    logger.info(f'{date} 新增 {added} 篇文献的关键词，跳过 {skipped} 篇已统计的文献')
+    return added
+
+
+def update_range(
+        first_day: str,
+        last_day: str,
+        stats: KeywordStats,
+        backend: KeywordBackend = KEYWORD_BACKEND,
+        search_index: SearchIndex | None = None
+) -> int:
+    """Count every day from `first_day` to `last_day`, at most up to yesterday, that is not counted yet."""
+    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    done = stats.days()
+
+    added = 0
+    for day in pd.date_range(first_day, min(last_day, yesterday)).strftime('%Y-%m-%d'):
+        if day not in done:
+            added += update_day(day, stats, backend, search_index)
+    return added
+
+
+def update_month(
+        year: int,
+        month: int,
+        stats: KeywordStats,
+        backend: KeywordBackend = KEYWORD_BACKEND,
+        search_index: SearchIndex | None = None
+) -> int:
+    """Count every day of the month up to yesterday that is not counted yet."""
+    return update_range(*get_month_start_end(month, year), stats, backend, search_index)
+
+
+def count_csv(
+        csv_path: FilePath,
+        stats: KeywordStats,
+        backend: KeywordBackend = KEYWORD_BACKEND,
+        chunk_size: int = CHUNK_SIZE,
+        search_index: SearchIndex | None = None
+) -> int:
+    """
+    Count a raw file written by `get_month_data`, or any CSV with the columns of `PAPER_COLUMNS`, chunk by chunk.
+    With `search_index`, their keywords are indexed for search as they are counted.
+
+    Returns:
+        int: The number of papers newly counted.
+    """
+    added = 0
+    for chunk in tqdm(pd.read_csv(csv_path, usecols=PAPER_COLUMNS, dtype=str, chunksize=chunk_size), desc=csv_path):
+        added += count_papers(chunk, stats, backend, search_index=search_index)[0]
+    return added
+
+
+def normalize_counts(counts: DataFrame, mapping_file: str | None = KEYWORD_MAP_FILE) -> Series:
+    """Sum rows of raw (category, keyword, count) by the canonical form of every keyword."""
+    canonical = canonical_keywords(Counter(counts.groupby('keyword')['count'].sum().to_dict()), mapping_file)
+    return counts.assign(keyword=counts['keyword'].map(canonical)).groupby(['category', 'keyword'])['count'].sum()
+
+
+def draw_report(keyword_counts: Series, paper_counts: Series, image_path: FilePath, tag: str) -> None:
+    """
+    Draw the word clouds and bar charts of a month or a range of months.
+
+    Args:
+        keyword_counts (Series): Occurrences of every canonical keyword, indexed by (category, keyword).
+        paper_counts (Series): Number of papers of every category.
+        image_path (FilePath): The folder the images are written to.
+        tag (str): Names the period in the file names, like 2410 for October 2024.
+    """
+    import seaborn as sns
+    from matplotlib import pyplot as plt
+    from wordcloud import WordCloud
 
-def draw_wordcloud(result_path: FilePath, image_path: FilePath, month: int):
     os.makedirs(os.path.join(image_path, 'conclusion'), exist_ok=True)
 
-    result_data = pd.read_csv(result_path)
-    all_keywords = result_data['keywords'].dropna().apply(eval).explode()
-    word_freq = all_keywords.value_counts()
+    word_freq = keyword_counts.groupby(level='keyword').sum().sort_values(ascending=False)
     filtered_word_freq = word_freq[word_freq > 1]
 
     wordcloud: WordCloud = WordCloud(
@@ -192,24 +427,24 @@ def draw_wordcloud(result_path: FilePath, image_path: FilePath, month: int):
     ).generate_from_frequencies(filtered_word_freq)
 
     image = wordcloud.to_image()
-    image.save(os.path.join(image_path, 'conclusion', f'conclusion_{YEAR}{month}.png'), 'png')
+    image.save(os.path.join(image_path, 'conclusion', f'conclusion_{tag}.png'), 'png')
 
     def plot_paper_counts() -> None:
-        paper_counts = result_data['category'].value_counts().reset_index()
-        paper_counts.columns = ['category', 'count']
+        _paper_counts = paper_counts.sort_values(ascending=False).reset_index()
+        _paper_counts.columns = ['category', 'count']
 
         sns.set_theme(style="whitegrid")
         plt.figure(figsize=(10, 6))
-        sns.barplot(y='category', x='count', data=paper_counts, orient='h')
-        for index, value in enumerate(paper_counts['count']):
+        sns.barplot(y='category', x='count', data=_paper_counts, orient='h')
+        for index, value in enumerate(_paper_counts['count']):
             plt.text(value + 10, index, str(value), ha='left', va='center', color='dimgray')
         plt.title('Paper Count by Category')
         plt.ylabel('Category')
         plt.xlabel('Count')
         plt.tight_layout()
-        plt.savefig(os.path.join(image_path, 'conclusion', f'paper_counts_{YEAR}{month}.png'))
+        plt.savefig(os.path.join(image_path, 'conclusion', f'paper_counts_{tag}.png'))
 
-    def plot_keyword_counts(_keyword_counts: DataFrame, _image_path: FilePath, top: int = 10) -> None:
+    def plot_keyword_counts(_keyword_counts: Series, _image_path: FilePath, top: int = 10) -> None:
         _keyword_counts = _keyword_counts.head(top).reset_index()
         _keyword_counts.columns = ['category', 'count']
 
@@ -226,16 +461,14 @@ def draw_wordcloud(result_path: FilePath, image_path: FilePath, month: int):
         plt.close()
 
     plot_paper_counts()
-    plot_keyword_counts(word_freq, os.path.join(image_path, 'conclusion', f'keyword_counts_{YEAR}{month}.png'), 20)
+    plot_keyword_counts(word_freq, os.path.join(image_path, 'conclusion', f'keyword_counts_{tag}.png'), 20)
 
     print(filtered_word_freq)
 
-    for category in tqdm(result_data['category'].unique()):
+    for category in tqdm(keyword_counts.index.unique(level='category')):
         os.makedirs(os.path.join(image_path, category), exist_ok=True)
 
-        sub_data = result_data[result_data['category'] == category]
-        sub_keywords = sub_data['keywords'].dropna().apply(eval).explode()
-        sub_word_freq = sub_keywords.value_counts()
+        sub_word_freq = keyword_counts.xs(category, level='category').sort_values(ascending=False)
 
         sub_wordcloud: WordCloud = WordCloud(
             width=1920,
@@ -245,23 +478,94 @@ def draw_wordcloud(result_path: FilePath, image_path: FilePath, month: int):
         ).generate_from_frequencies(sub_word_freq)
 
         image = sub_wordcloud.to_image()
-        image.save(os.path.join(image_path, category, f'wordcloud_{YEAR}{month}.png'), 'png')
-
-        plot_keyword_counts(sub_word_freq, os.path.join(image_path, category, f'keyword_counts_{YEAR}{month}.png'))
+        image.save(os.path.join(image_path, category, f'wordcloud_{tag}.png'), 'png')
+
+        plot_keyword_counts(sub_word_freq, os.path.join(image_path, category, f'keyword_counts_{tag}.png'))
+
+
+@traced()
+def draw_wordcloud(
+        result_path: FilePath,
+        image_path: FilePath,
+        month: int,
+        mapping_file: str | None = KEYWORD_MAP_FILE,
+        year: int | None = None,
+        chunk_size: int = CHUNK_SIZE
+):
+    """Draw the report of a month from a `result_{month}.csv` written by `get_key_words`, read chunk by chunk."""
+    keyword_counts, paper_counts = Counter(), Counter()
+    for chunk in pd.read_csv(result_path, usecols=['category', 'keywords'], chunksize=chunk_size):
+        paper_counts.update(chunk['category'].dropna())
+        for category, keywords in zip(chunk['category'], chunk['keywords']):
+            keyword_counts.update((category, keyword) for keyword in parse_keywords(keywords))
+
+    counts = DataFrame([(*key, count) for key, count in keyword_counts.items()], columns=['category', 'keyword', 'count'])
+    year = year or datetime.now().year
+    draw_report(normalize_counts(counts, mapping_file), Series(paper_counts), image_path, f'{year % 100}{month}')
+
+
+@traced()
+def draw_month(
+        stats: KeywordStats,
+        year: int,
+        month: int,
+        image_path: FilePath,
+        mapping_file: str | None = KEYWORD_MAP_FILE,
+        months: int = 1
+) -> bool:
+    """
+    Draw the report of a month, or of `months` months from it, from the running keyword statistics.
+
+    Nothing is downloaded or extracted. A paper with versions in two months counts in both, as in their
+    monthly reports.
+
+    Returns:
+        bool: False when the period has no keywords counted yet.
+    """
+    counts = stats.keyword_counts(year, month, months)
+    if counts.empty:
+        logger.warning(f'{year}-{month:02d} 起 {months} 个月还没有关键词统计')
+        return False
+
+    tag = f'{year % 100}{month}' + (f'_{months}m' if months > 1 else '')
+    draw_report(normalize_counts(counts, mapping_file), stats.paper_counts(year, month, months), image_path, tag)
+    return True
 
 
 def main() -> None:
-    month = 10
-    raw_path = os.path.join('conclusion', f'paper_{month}.csv')
-    clean_path = os.path.join('conclusion', f'clean_{month}.csv')
-    result_path = os.path.join('conclusion', f'result_{month}.csv')
-    image_path = os.path.join('conclusion', 'image')
+    parser = argparse.ArgumentParser(description='统计每月预印本的关键词并生成词云，每天增量更新')
+    parser.add_argument('--month', help='统计的月份，格式为YYYY-MM，默认生成上个月的报告，或更新昨天所在的月份')
+    parser.add_argument('--months', type=int, default=1, help='从--month起统计的月份数，如12即为全年')
+    parser.add_argument('--csv', help='从get_month_data下载的CSV文件分块计入统计，而不是从API下载')
+    parser.add_argument('--update-only', action='store_true', help='只把尚未统计的日期计入统计，不生成报告，可每天定时运行')
+    parser.add_argument('--backend', type=KeywordBackend, choices=list(KeywordBackend), default=KEYWORD_BACKEND,
+                        help='关键词提取方式')
+    args = parser.parse_args()
+
+    if args.month:
+        year, month = month_of(f'{args.month}-01')
+    elif args.update_only:
+        year, month = month_of((datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'))
+    else:
+        year, month = last_month()
+    end_year, end_month = add_months(year, month, args.months - 1)
 
+    image_path = os.path.join('conclusion', 'image')
     os.makedirs('conclusion', exist_ok=True)
-    # get_month_data(month, raw_path)
-    # data = clear_data(raw_path, clean_path)
-    # get_key_words(data, result_path)
-    draw_wordcloud(result_path, image_path, month)
+    reset_run()
+
+    with KeywordStats() as stats:
+        with SearchIndex() as search_index:
+            if args.csv:
+                count_csv(args.csv, stats, args.backend, search_index=search_index)
+            else:
+                first_day = get_month_start_end(month, year)[0]
+                last_day = get_month_start_end(end_month, end_year)[1]
+                update_range(first_day, last_day, stats, args.backend, search_index)
+
+        if not args.update_only:
+            draw_month(stats, year, month, image_path, months=args.months)
+    tracer.export(os.path.join('conclusion', 'metrics'), f'month_{year}{month:02d}')
 
 
 if __name__ == '__main__':
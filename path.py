@@ -2,4 +2,4 @@ import os
 
 
 def get_work_path():
-    return os.path.dirname(os.path.abspath(__file__))
+    return os.environ.get('BIOSUMMARY_WORK_PATH', os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,42 @@
+import argparse
+import time
+
+from loguru import logger
+
+from util.search_index import SearchIndex, SEARCH_FILE, import_outputs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='检索历史文献总结与关键词')
+    parser.add_argument('text', nargs='?', help='检索词，多个词之间为“且”的关系')
+    parser.add_argument('--category', help='只检索该分类')
+    parser.add_argument('--start', help='开始日期，YYYY-MM-DD')
+    parser.add_argument('--end', help='结束日期（包含），YYYY-MM-DD')
+    parser.add_argument('--keyword', help='只检索带有该关键词的文献')
+    parser.add_argument('--limit', type=int, default=20, help='最多返回的结果数')
+    parser.add_argument('--import', dest='import_path', nargs='?', const='', metavar='WORK_PATH',
+                        help='先从已有的docx、zip与关键词csv导入，默认为工作目录')
+    parser.add_argument('--index', default=SEARCH_FILE, help='全文检索数据库')
+    args = parser.parse_args()
+
+    with SearchIndex(args.index) as index:
+        if args.import_path is not None:
+            import_outputs(index, args.import_path or None)
+            if not any([args.text, args.category, args.start, args.end, args.keyword]):
+                return
+
+        start = time.perf_counter()
+        hits = index.search(args.text, args.category, args.start, args.end, args.keyword, args.limit)
+        logger.info(f'共 {len(hits)} 条结果，耗时 {(time.perf_counter() - start) * 1000:.1f} ms')
+
+        for hit in hits:
+            print(f'{hit.date} [{hit.category}] {hit.title}')
+            print(f'    https://doi.org/{hit.doi}')
+            if hit.snippet:
+                print(f'    {hit.snippet}')
+            if hit.keywords:
+                print(f"    关键词: {', '.join(hit.keywords)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, field, asdict
+from enum import StrEnum
+
+from loguru import logger
+
+from path import get_work_path
+from util.biorxiv_fetcher import Paper
+from util.decorator import retry
+from util.llm_integration import LLM_API_BASE, SUMMARY_MODEL, SUMMARY_TEMPERATURE, get_secret, summary_messages
+from util.metrics import span, tracer
+from util.resilience import Dependency
+
+BATCH_PATH = os.path.join(get_work_path(), 'batch')
+# the request path inside the job file, '/v4/chat/completions' for the default GLM endpoint
+BATCH_ENDPOINT = os.environ.get('LLM_BATCH_ENDPOINT', '/v4/chat/completions')
+POLL_SECONDS = float(os.environ.get('LLM_BATCH_POLL', 60))
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+class JobStage(StrEnum):
+    PREPARED = 'prepared'
+    SUBMITTED = 'submitted'
+    FINISHED = 'finished'
+
+
+@dataclass
+class BatchEntry:
+    """What is kept of a paper while its summary is in a batch job: the paper, its image and what was skipped."""
+    paper: dict
+    image: str = ''
+    degraded: list[str] = field(default_factory=list)
+
+
+@dataclass
+class JobState:
+    stage: JobStage = JobStage.PREPARED
+    file_id: str | None = None
+    batch_id: str | None = None
+    status: str | None = None
+
+
+def load_client():
+    from openai import OpenAI
+
+    return OpenAI(base_url=LLM_API_BASE, api_key=get_secret('gml_key'))
+
+
+def batch_request(paper: Paper) -> dict:
+    """One line of the job file. The DOI is the custom id the result is mapped back by."""
+    return {
+        'custom_id': paper.doi,
+        'method': 'POST',
+        'url': BATCH_ENDPOINT,
+        'body': {
+            'model': SUMMARY_MODEL,
+            'messages': summary_messages(paper),
+            'temperature': SUMMARY_TEMPERATURE,
+        },
+    }
+
+
+class BatchJob:
+    """
+    The summaries of one day as one OpenAI-compatible batch job.
+
+    The prepared papers, the job file and the ids returned by the provider are kept in `batch/{name}/`, so a
+    run that stops after any step resumes from it: a prepared job is not prepared again, a submitted job is
+    only polled, and finished results are read from disk.
+    """
+
+    def __init__(self, name: str, job_path: str = BATCH_PATH):
+        self.name = name
+        self.path = os.path.join(job_path, name)
+        self.state_file = os.path.join(self.path, 'state.json')
+        self.entries_file = os.path.join(self.path, 'papers.jsonl')
+        self.requests_file = os.path.join(self.path, 'requests.jsonl')
+        self.results_file = os.path.join(self.path, 'results.jsonl')
+        self.image_path = os.path.join(self.path, 'images')
+        self.state = self._load_state()
+
+    def _load_state(self) -> JobState | None:
+        if not os.path.exists(self.state_file):
+            return None
+        with open(self.state_file, encoding='utf8') as f:
+            data = json.load(f)
+        return JobState(JobStage(data.pop('stage')), **data)
+
+    def _save_state(self) -> None:
+        tmp_file = f'{self.state_file}.tmp'
+        with open(tmp_file, 'w', encoding='utf8') as f:
+            json.dump(asdict(self.state), f)
+        os.replace(tmp_file, self.state_file)
+
+    @property
+    def prepared(self) -> bool:
+        return self.state is not None
+
+    def write(self, prepared: list[tuple[Paper, str | bytes, list[str]]]) -> int:
+        """
+        Write the job file and keep what the docx writer needs of every paper.
+
+        Args:
+            prepared (list[tuple[Paper, str | bytes, list[str]]]): Prepared papers with their first image, as a
+                path or bytes, and their degraded stages.
+
+        Returns:
+            int: The number of requests in the job file.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.image_path)
+
+        with open(self.entries_file, 'w', encoding='utf8') as entries, \
+                open(self.requests_file, 'w', encoding='utf8') as requests:
+            for i, (paper, image, degraded) in enumerate(prepared):
+                if isinstance(image, bytes):
+                    image_file = os.path.join(self.image_path, f'{i}.png')
+                    with open(image_file, 'wb') as f:
+                        f.write(image)
+                    image = image_file
+
+                paper_data = {column: getattr(paper, column) for column in Paper.columns()}
+                entries.write(json.dumps(asdict(BatchEntry(paper_data, image, list(degraded))), ensure_ascii=False) + '\n')
+                requests.write(json.dumps(batch_request(paper), ensure_ascii=False) + '\n')
+
+        self.state = JobState()
+        self._save_state()
+        logger.info(f'批量任务 {self.name} 已写入 {len(prepared)} 条请求')
+        return len(prepared)
+
+    def entries(self) -> dict[str, BatchEntry]:
+        with open(self.entries_file, encoding='utf8') as f:
+            entries = [BatchEntry(**json.loads(line)) for line in f]
+        return {entry.paper['doi']: entry for entry in entries}
+
+    @retry(delay=5.0, breaker=Dependency.LLM)
+    def submit(self, client) -> str:
+        """Upload the job file and create the batch, each only once."""
+        if self.state.file_id is None:
+            with open(self.requests_file, 'rb') as f:
+                self.state.file_id = client.files.create(file=f, purpose='batch').id
+            self._save_state()
+
+        if self.state.batch_id is None:
+            batch = client.batches.create(
+                input_file_id=self.state.file_id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window='24h',
+                metadata={'description': f'BioSummary {self.name}'},
+            )
+            self.state.batch_id = batch.id
+            self.state.status = batch.status
+            self.state.stage = JobStage.SUBMITTED
+            self._save_state()
+            logger.info(f'批量任务 {self.name} 已提交: {batch.id}')
+        return self.state.batch_id
+
+    @retry(delay=5.0, breaker=Dependency.LLM)
+    def _retrieve(self, client):
+        return client.batches.retrieve(self.state.batch_id)
+
+    def wait(self, client, poll: float = POLL_SECONDS, timeout: float | None = None):
+        """
+        Poll the batch until it reaches a final status.
+
+        Raises:
+            TimeoutError: The batch is still running after `timeout` seconds, poll it again on the next run.
+        """
+        start = time.monotonic()
+        while True:
+            batch = self._retrieve(client)
+            if batch.status != self.state.status:
+                counts = batch.request_counts
+                logger.info(f'批量任务 {self.name} 状态: {batch.status}'
+                            + (f' ({counts.completed}/{counts.total})' if counts is not None else ''))
+                self.state.status = batch.status
+                self._save_state()
+
+            if batch.status in FINAL_STATUSES:
+                return batch
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise TimeoutError(f'batch {self.state.batch_id} is still {batch.status}')
+            time.sleep(poll)
+
+    @retry(delay=5.0, breaker=Dependency.LLM)
+    def _download(self, client, file_id: str) -> str:
+        return client.files.content(file_id).text
+
+    def results(self, client, poll: float = POLL_SECONDS, timeout: float | None = None) -> dict[str, str]:
+        """
+        Submit the job if needed, wait for it and return the summaries by DOI.
+
+        Requests that failed inside the batch are left out, the caller summarizes them one by one.
+        """
+        if self.state.stage != JobStage.FINISHED:
+            self.submit(client)
+            with span('batch', job=self.name) as _span:
+                batch = self.wait(client, poll, timeout)
+                _span.attrs['status'] = batch.status
+
+            with open(self.results_file, 'w', encoding='utf8') as f:
+                if batch.output_file_id:
+                    f.write(self._download(client, batch.output_file_id))
+            self.state.stage = JobStage.FINISHED
+            self._save_state()
+
+        summaries = {}
+        failed = 0
+        with open(self.results_file, encoding='utf8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get('response') or {}
+                if result.get('error') or response.get('status_code') != 200:
+                    failed += 1
+                    continue
+                summaries[result['custom_id']] = response['body']['choices'][0]['message']['content']
+
+        tracer.incr('batch', 'completed', len(summaries))
+        if failed:
+            tracer.incr('batch', 'failed', failed)
+            logger.warning(f'批量任务 {self.name} 有 {failed} 条请求失败')
+        return summaries
+
+    def remove(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -1,7 +1,5 @@
 import os
-import random
-import subprocess
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 from datetime import datetime, timedelta
 from enum import StrEnum
 
@@ -12,34 +10,41 @@ from pandas import DataFrame, Series
 
 from path import get_work_path
 from util.decorator import retry
+from util.metrics import span
+from util.resilience import Dependency, RetryableError, Deadline, DeadlineExceeded
 
-CONTENT_ENDPOINT = 'https://api.biorxiv.org/details/biorxiv'
+CONTENT_ENDPOINT = os.environ.get('BIORXIV_API_ENDPOINT', 'https://api.biorxiv.org/details/biorxiv')
+PDF_ENDPOINT = os.environ.get('BIORXIV_PDF_ENDPOINT', 'https://www.biorxiv.org/content')
+PDF_SESSION = requests.Session()
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36'
 
 
-@dataclass
+@dataclass(slots=True)
 class Paper:
+    """The fields of a bioRxiv record that the summary pipeline uses."""
     doi: str
     title: str
     authors: str
     author_corresponding: str
     author_corresponding_institution: str
     date: str
-    version: int
-    type: str
-    license: str
     category: str
-    jatsxml: str
     abstract: str
-    published: bool
-    server: str
-    more_graph: dict
+    more_graph: dict = field(default_factory=dict)
 
     @classmethod
-    def from_dict(cls, data: Series):
-        data_dict = data.to_dict()
-        version = int(data_dict.pop('version'))
-        return cls(**data_dict, version=version, more_graph={})
+    def columns(cls) -> list[str]:
+        return [f.name for f in fields(cls) if f.name != 'more_graph']
+
+    @classmethod
+    def from_dict(cls, data: Series | dict):
+        data_dict = data.to_dict() if isinstance(data, Series) else data
+        return cls(*(data_dict[c] for c in cls.columns()))
+
+    @classmethod
+    def from_frame(cls, data: DataFrame) -> list['Paper']:
+        """Build the papers of a DataFrame in bulk from its columns, without creating a Series per row."""
+        return [cls(*values) for values in zip(*(data[c].tolist() for c in cls.columns()))]
 
 
 class Category(StrEnum):
@@ -85,7 +90,7 @@ MAIN_LIST = [
 ]
 
 
-@retry(delay=random.uniform(2.0, 5.0))
+@retry(delay=2.0, breaker=Dependency.BIORXIV_API)
 def get_daily_papers(yesterday: str) -> DataFrame:
     """Fetches the daily papers from BioRxiv for the previous day.
 
@@ -103,50 +108,82 @@ def get_daily_papers(yesterday: str) -> DataFrame:
     payload = {}
     headers = {'User-Agent': USER_AGENT}
 
-    response = requests.request("GET", url, headers=headers, data=payload).json()
+    with span('fetch', date=yesterday) as _span:
+        raw_response = requests.request("GET", url, headers=headers, data=payload)
+        raw_response.raise_for_status()
+        _span.attrs['bytes'] = len(raw_response.content)
+        response = raw_response.json()
+
     message: dict = response['messages'][0]
+    # bioRxiv answers a day without posts with this status instead of "ok"
+    if message['status'] == "no posts found":
+        logger.info(f"{yesterday}没有预印本")
+        return DataFrame(columns=Paper.columns() + ['version'])
     if message['status'] == "ok":
         logger.info(f"下载完毕，"
                     f"{yesterday}共有{message['total']}篇预印本，"
                     f"其中有{message['count_new_papers']}篇有新动态")
     else:
-        raise Exception("下载信息失败")
+        raise RetryableError("下载信息失败")
 
     return DataFrame(response['collection'])
 
 
-@retry(delay=random.uniform(2.0, 5.0))
-def download_pdf(base_path: str | bytes, doi: str) -> str:
+@retry(delay=2.0, breaker=Dependency.BIORXIV_PDF)
+def fetch_pdf(doi: str, deadline: Deadline | None = None) -> bytes:
     """
-    Download the PDF of a paper from BioRxiv using its DOI.
+    Download the PDF of a paper from BioRxiv into memory.
 
     Args:
-        base_path:
         doi (str): The DOI of the paper to download.
+        deadline (Deadline | None): Every attempt times out at the deadline, and no attempt starts after it.
 
     Returns:
-        str: The file path where the downloaded PDF is saved.
+        bytes: The content of the PDF.
 
     Raises:
-        Exception: If the PDF download fails.
+        requests.HTTPError: If BioRxiv answers with an error status.
+        DeadlineExceeded: If the deadline ran out before an attempt.
     """
-    url = f"https://www.biorxiv.org/content/{doi}v1.full.pdf"
-    pdf_path = os.path.join(base_path, doi.replace('/', '@'), f"{doi.replace('/', '@')}.pdf")
+    url = f"{PDF_ENDPOINT}/{doi}v1.full.pdf"
     headers = {
         "User-Agent": USER_AGENT
     }
 
-    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
-    wget_command = ["wget", "-O", pdf_path, url]
-    for header, value in headers.items():
-        wget_command.extend(["--header", f"{header}: {value}"])
+    if deadline is not None and deadline.expired:
+        raise DeadlineExceeded(f'No time left to download {doi}')
+
+    with span('download_pdf', doi=doi) as _span:
+        response = PDF_SESSION.get(url, headers=headers, timeout=deadline.timeout(120) if deadline is not None else 120)
+        if response.status_code != 200:
+            logger.error(f"Failed to download PDF. Status code: {response.status_code}")
+        response.raise_for_status()
+
+        content = response.content
+        if not content.startswith(b'%PDF'):
+            raise RetryableError(f"下载PDF {url} 失败: 返回内容不是PDF")
+
+        _span.attrs['bytes'] = len(content)
+
+    return content
 
-    result = subprocess.run(wget_command, capture_output=True)
 
-    if result.returncode != 0:
-        error_message = result.stderr.decode()
-        logger.error(f"Failed to download PDF. Return code: {result.returncode}")
-        raise Exception(f"下载PDF {url} 失败: {error_message}")
+def download_pdf(base_path: str | bytes, doi: str) -> str:
+    """
+    Download the PDF of a paper from BioRxiv using its DOI and save it under `base_path`.
+
+    Args:
+        base_path: The folder to save the PDF in.
+        doi (str): The DOI of the paper to download.
+
+    Returns:
+        str: The file path where the downloaded PDF is saved.
+    """
+    pdf_path = os.path.join(base_path, doi.replace('/', '@'), f"{doi.replace('/', '@')}.pdf")
+    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+
+    with open(pdf_path, 'wb') as f:
+        f.write(fetch_pdf(doi))
 
     return pdf_path
 
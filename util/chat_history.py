@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from path import get_work_path
+
+HISTORY_FILE = os.path.join(get_work_path(), 'chat_history.sqlite3')
+PAGE_SIZE = 20
+RETENTION_DAYS = float(os.environ.get('CHAT_HISTORY_DAYS', 7))
+
+
+@dataclass
+class ChatMessage:
+    id: int
+    role: str
+    content: str
+
+
+class ChatHistory:
+    """
+    Chat messages of the summary page, kept in SQLite instead of the Streamlit session state.
+
+    Only the pages that are shown are read back, so a rerun costs the same however long the history is.
+    Messages older than `retention_days` are deleted when the history is opened, so the file does not grow
+    with every session that was ever started.
+    """
+
+    def __init__(self, history_file: str = HISTORY_FILE, retention_days: float = RETENTION_DAYS):
+        os.makedirs(os.path.dirname(os.path.abspath(history_file)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(history_file, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS message (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS message_session ON message (session, id);
+            CREATE INDEX IF NOT EXISTS message_created ON message (created_at);
+        """)
+        self.conn.commit()
+        self.prune(retention_days)
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def append(self, session: str, role: str, content: str) -> None:
+        with self._lock:
+            self.conn.execute(
+                'INSERT INTO message (session, role, content, created_at) VALUES (?, ?, ?, ?)',
+                (session, role, content, time.time())
+            )
+            self.conn.commit()
+
+    def count(self, session: str) -> int:
+        with self._lock:
+            return self.conn.execute('SELECT count(*) FROM message WHERE session = ?', (session,)).fetchone()[0]
+
+    def recent(self, session: str, pages: int = 1, page_size: int = PAGE_SIZE) -> list[ChatMessage]:
+        """
+        The latest messages of a session, oldest first.
+
+        Args:
+            session (str): The session the messages belong to.
+            pages (int): How many pages of `page_size` messages to load.
+            page_size (int): The number of messages in a page.
+
+        Returns:
+            list[ChatMessage]: At most `pages * page_size` messages.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT id, role, content FROM message WHERE session = ? ORDER BY id DESC LIMIT ?',
+                (session, pages * page_size)
+            ).fetchall()
+        return [ChatMessage(*row) for row in reversed(rows)]
+
+    def prune(self, days: float) -> int:
+        """
+        Delete the messages older than `days`.
+
+        Returns:
+            int: The number of messages deleted.
+        """
+        with self._lock:
+            cursor = self.conn.execute('DELETE FROM message WHERE created_at < ?', (time.time() - days * 86400,))
+            self.conn.commit()
+        return cursor.rowcount
+
+    def clear(self, session: str) -> None:
+        with self._lock:
+            self.conn.execute('DELETE FROM message WHERE session = ?', (session,))
+            self.conn.commit()
@@ -1,18 +1,36 @@
 import io
 import os
 import shutil
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import timedelta, datetime
+from enum import StrEnum
+from typing import TYPE_CHECKING
 
-import fitz
-from PIL.Image import Resampling
-from docx import Document
-from docx.image.exceptions import UnrecognizedImageError
-from docx.shared import Pt, RGBColor, Cm
-from PIL import Image, UnidentifiedImageError
 from loguru import logger
 
 from path import get_work_path
+from util.metrics import traced
+
+# PyMuPDF, Pillow and python-docx are imported by the functions that use them, so importing DocData stays cheap
+if TYPE_CHECKING:
+    import fitz
+
+
+class Degraded(StrEnum):
+    NO_PDF = 'no_pdf'
+    NO_SECTIONS = 'no_sections'
+    NO_IMAGE = 'no_image'
+    TRUNCATED = 'truncated'
+    NO_SUMMARY = 'no_summary'
+
+
+DEGRADED_NOTES = {
+    Degraded.NO_PDF: '未能及时获取全文，仅根据摘要总结',
+    Degraded.NO_SECTIONS: '未能及时解析全文，仅根据摘要总结',
+    Degraded.NO_IMAGE: '未能及时提取配图',
+    Degraded.TRUNCATED: '总结生成超时，内容可能不完整',
+    Degraded.NO_SUMMARY: '未能生成总结，仅附原文摘要',
+}
 
 
 @dataclass
@@ -22,11 +40,15 @@ class DocData:
     institution: str
     doi: str
     desc: str
-    img: str
+    img: str | bytes
+    degraded: list[str] = field(default_factory=list)
 
 
 def resize_image_if_needed(image_data, image_type, max_resolution=(2560, 1440)):
     """Resize image if its dimensions exceed the specified max resolution."""
+    from PIL import Image, UnidentifiedImageError
+    from PIL.Image import Resampling
+
     try:
         with Image.open(io.BytesIO(image_data)) as img:
             # Check if the image exceeds the max resolution
@@ -42,7 +64,9 @@ def resize_image_if_needed(image_data, image_type, max_resolution=(2560, 1440)):
         return image_data
 
 
-def recover_pix(doc: Document, item):
+def recover_pix(doc: 'fitz.Document', item):
+    import fitz
+
     xref = item[0]  # xref of PDF image
     smask = item[1]  # xref of its /SMask
 
@@ -82,46 +106,57 @@ def recover_pix(doc: Document, item):
     return doc.extract_image(xref)
 
 
-def get_image(pdf_path: str) -> str:
-    doc = fitz.open(pdf_path)
-
-    page_count = doc.page_count  # number of pages
-
-    xref_list = []
-    img_list = []
-    for pno in range(page_count):
-        if len(img_list) >= 4:
-            break
-
-        il = doc.get_page_images(pno)
-        for img in il:
-            xref = img[0]
-            if xref in xref_list:
-                continue
-
-            try:
-                image = recover_pix(doc, img)
-                imgdata = image["image"]
-
-                imgdata = resize_image_if_needed(imgdata, 'png')
-
-                img_file = os.path.join(
-                    os.path.dirname(pdf_path),
-                    f"page_{pno}_img_{xref}.png"
-                )
+@traced()
+def get_image(pdf_file: str | bytes, output_path: str | None = None) -> str | bytes:
+    """
+    Extract the first usable image of a PDF.
+
+    Args:
+        pdf_file: The path of the PDF, or its content.
+        output_path: The folder to save the image in. A PDF path defaults to its own folder, the image of an
+            in-memory PDF is returned as bytes unless a folder is given.
+
+    Returns:
+        The path of the saved image, the image bytes, or an empty string if the PDF has no usable image.
+    """
+    import fitz
+
+    if isinstance(pdf_file, bytes):
+        doc = fitz.open(stream=pdf_file, filetype='pdf')
+    else:
+        doc = fitz.open(pdf_file)
+        output_path = output_path or os.path.dirname(pdf_file)
+
+    with doc:
+        for pno in range(doc.page_count):
+            for img in doc.get_page_images(pno):
+                xref = img[0]
+                try:
+                    image = recover_pix(doc, img)
+                    imgdata = resize_image_if_needed(image["image"], 'png')
+                except:
+                    logger.error('img extract error')
+                    continue
+
+                if output_path is None:
+                    return imgdata
+
+                img_file = os.path.join(output_path, f"page_{pno}_img_{xref}.png")
                 os.makedirs(os.path.dirname(img_file), exist_ok=True)
                 with open(img_file, "wb") as fout:
                     fout.write(imgdata)
 
-                img_list.append(img_file)
-                xref_list.append(xref)
-            except:
-                logger.error('img extract error')
+                return img_file
 
-    return img_list[0] if len(img_list) > 0 else ""
+    return ""
 
 
+@traced()
 def write_to_docx(paper_list: list[DocData], output_file: str | bytes):
+    from docx import Document
+    from docx.image.exceptions import UnrecognizedImageError
+    from docx.shared import Pt, RGBColor, Cm
+
     document = Document()
 
     representation = document.add_paragraph().add_run(
@@ -157,11 +192,19 @@ def write_to_docx(paper_list: list[DocData], output_file: str | bytes):
         desc_run = p3.add_run(data.desc)
         desc_run.font.size = Pt(13)
 
-        if data.img != "":
+        if data.degraded:
+            note_run = document.add_paragraph().add_run(
+                f"注：{'；'.join(DEGRADED_NOTES.get(d, d) for d in data.degraded)}")
+            note_run.font.size = Pt(11)
+            note_run.font.italic = True
+            note_run.font.color.rgb = RGBColor(123, 125, 125)
+
+        if data.img:
             try:
-                document.add_picture(data.img, width=Cm(13))
+                image = io.BytesIO(data.img) if isinstance(data.img, bytes) else data.img
+                document.add_picture(image, width=Cm(13))
             except UnrecognizedImageError as e:
-                logger.error(f'"{e}", {data.img}')
+                logger.error(f'"{e}", {data.doi}')
 
     document.save(output_file)
 
@@ -1,12 +1,12 @@
 import os
 import re
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from enum import StrEnum
 from pathlib import Path
 
 import requests
-from bs4 import BeautifulSoup
 from loguru import logger
 from requests import RequestException, ReadTimeout
 from requests.adapters import HTTPAdapter
@@ -14,6 +14,11 @@ from tqdm import tqdm
 from urllib3 import Retry
 
 from util.decorator import retry
+from util.resilience import Dependency, HTTPStatusError, Deadline, DeadlineExceeded
+from util.metrics import span, traced
+
+
+GROBID_SERVER = os.environ.get('GROBID_SERVER', 'https://aye10032-grobid.hf.space')
 
 
 class ConsolidateHeader(StrEnum):
@@ -41,7 +46,7 @@ class GrobidConfig:
     service: str
     batch_size: int
     sleep_time: int
-    timeout: int
+    timeout: float
     coordinates: list[str]
     multi_process: int
 
@@ -63,7 +68,7 @@ class GrobidConnector:
         self._check_server_status()
         self.session = requests.Session()
 
-        retries = Retry(total=5, backoff_factor=5, status_forcelist=[500, 502, 503, 504])
+        retries = Retry(total=2, backoff_factor=1, status_forcelist=[502, 503, 504])
         adapter = HTTPAdapter(max_retries=retries)
         self.session.mount('http://', adapter)
         self.session.mount('https://', adapter)
@@ -117,28 +122,40 @@ class GrobidConnector:
         :param end: The end page for parsing. Default is -1 (no limit).
         :return: A tuple containing the HTTP status code and the response text.
         """
-        with open(pdf_file, 'rb') as f:
+        the_data = {
+            "consolidateHeader": consolidate_header,
+            "consolidateCitations": consolidate_citations,
+            "consolidateFunders": consolidate_funders,
+            "teiCoordinates": self.coordinates,
+            "start": start,
+            "end": end,
+            "includeRawCitations": "1" if include_raw_citations else "0",
+            "includeRawAffiliations": "1" if include_raw_affiliations else "0",
+            "includeRawCopyrights": "1" if include_raw_copyrights else "0",
+            "segmentSentences": "1" if segment_sentences else "0",
+            "generateIDs": "1" if generate_ids else "0"
+        }
+
+        if isinstance(pdf_file, bytes):
             files = {
                 "input": (
+                    "input.pdf",
                     pdf_file,
-                    f,
                     "application/pdf",
                     {"Expires": "0"},
                 )
             }
+            response = self.session.post(self.server_url, files=files, data=the_data, timeout=self.timeout)
+            return pdf_file, response.status_code, response.text
 
-            the_data = {
-                "consolidateHeader": consolidate_header,
-                "consolidateCitations": consolidate_citations,
-                "consolidateFunders": consolidate_funders,
-                "teiCoordinates": self.coordinates,
-                "start": start,
-                "end": end,
-                "includeRawCitations": "1" if include_raw_citations else "0",
-                "includeRawAffiliations": "1" if include_raw_affiliations else "0",
-                "includeRawCopyrights": "1" if include_raw_copyrights else "0",
-                "segmentSentences": "1" if segment_sentences else "0",
-                "generateIDs": "1" if generate_ids else "0"
+        with open(pdf_file, 'rb') as f:
+            files = {
+                "input": (
+                    pdf_file,
+                    f,
+                    "application/pdf",
+                    {"Expires": "0"},
+                )
             }
 
             response = self.session.post(self.server_url, files=files, data=the_data, timeout=self.timeout)
@@ -214,14 +231,33 @@ class GrobidConnector:
                         pbar.update(1)
 
 
-@retry(delay=1.0)
-def parse_pdf(pdf_path: str) -> str:
+@retry(delay=2.0, breaker=Dependency.GROBID)
+def parse_pdf(pdf_file: str | bytes, deadline: Deadline | None = None, cancelled: threading.Event | None = None) -> str:
+    """
+    Parse a PDF into TEI XML with Grobid.
+
+    Args:
+        pdf_file (str | bytes): The path or the content of the PDF.
+        deadline (Deadline | None): Every attempt times out at the deadline, and no attempt starts after it.
+        cancelled (threading.Event | None): Once set, no further attempt starts.
+
+    Returns:
+        str: The TEI XML.
+
+    Raises:
+        DeadlineExceeded: If the deadline ran out, or the call was cancelled before an attempt.
+    """
+    if cancelled is not None and cancelled.is_set():
+        raise DeadlineExceeded('Grobid call abandoned')
+    if deadline is not None and deadline.expired:
+        raise DeadlineExceeded('No time left to parse the PDF')
+
     grobid_config = GrobidConfig(
-        grobid_server="https://aye10032-grobid.hf.space",
+        grobid_server=GROBID_SERVER,
         service="processFulltextDocument",
         batch_size=1000,
         sleep_time=5,
-        timeout=300,
+        timeout=deadline.timeout(300) if deadline is not None else 300,
         coordinates=[
             "persName",
             "ref",
@@ -232,21 +268,33 @@ def parse_pdf(pdf_path: str) -> str:
         ],
         multi_process=10
     )
-    with GrobidConnector(grobid_config) as connector:
-        _, result_code, xml_text = connector.parse_file(pdf_path)
+    with span('parse_pdf') as _span:
+        with GrobidConnector(grobid_config) as connector:
+            try:
+                _, result_code, xml_text = connector.parse_file(pdf_file)
+            except RequestException as e:
+                # a request cut off by the deadline is not worth another attempt
+                if deadline is not None and deadline.expired:
+                    raise DeadlineExceeded('Grobid missed the deadline') from e
+                raise
 
-    if result_code != 200:
-        raise Exception('download error.')
+        if result_code != 200:
+            raise HTTPStatusError(result_code, 'Grobid parse error.')
+
+        _span.attrs['bytes'] = len(xml_text)
 
     return xml_text
 
 
 def check_title(title):
-    pattern = re.compile(r'^(Introduction|Discussions|Conclusion?)$', re.IGNORECASE)
+    pattern = re.compile(r'^(Introduction|Discussions?|Conclusions?)$', re.IGNORECASE)
     return bool(pattern.match(title))
 
 
+@traced()
 def extract_paragraphs(xml: str) -> dict:
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(xml, 'xml')
     paragraphs = soup.find('body').find_all('div', recursive=False)
 
@@ -0,0 +1,206 @@
+import json
+import os
+import re
+import unicodedata
+import zlib
+from collections import Counter, defaultdict
+
+import numpy as np
+from loguru import logger
+from pandas import Series
+
+from path import get_work_path
+
+KEYWORD_MAP_FILE = os.path.join(get_work_path(), 'conclusion', 'keyword_map.json')
+SEPARATORS = re.compile(r'[\s\-‐‑‒–—_/]+')
+NGRAM = 3
+NUM_PERM = 64
+BANDS = 16
+SIMILARITY = 0.8
+# the smallest prime above 2^32, so (a * x + b) of 32-bit CRCs fits in uint64
+PRIME = (1 << 32) + 15
+
+
+def _singular(word: str) -> str:
+    if len(word) <= 3 or not word.isalpha():
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('sses', 'xes', 'ches', 'shes')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is', 'ous')):
+        return word[:-1]
+    return word
+
+
+def fold(keyword: str) -> str:
+    """Case, width, separator and plural folding: 'K-mer Analyses' and 'k-mer analysis' fold to the same key."""
+    text = unicodedata.normalize('NFKC', keyword).casefold().strip()
+    words = [w for w in SEPARATORS.split(text) if w]
+    return ' '.join(_singular(w) for w in words)
+
+
+def _ngrams(key: str) -> set[str]:
+    padded = f' {key} '
+    return {padded[i:i + NGRAM] for i in range(max(len(padded) - NGRAM + 1, 1))}
+
+
+def _jaccard(a: set[str], b: set[str]) -> float:
+    return len(a & b) / len(a | b)
+
+
+def _minhash(grams: list[set[str]]) -> np.ndarray:
+    rng = np.random.default_rng(1)
+    a = rng.integers(1, 1 << 32, NUM_PERM, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+    sizes = np.fromiter((len(g) for g in grams), dtype=np.int64, count=len(grams))
+    hashes = np.fromiter((zlib.crc32(g.encode()) for gram_set in grams for g in gram_set), dtype=np.uint64, count=sizes.sum())
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    signatures = np.empty((len(grams), NUM_PERM), dtype=np.uint64)
+    # one permutation at a time keeps the intermediate array at the size of the flat gram list
+    for p in range(NUM_PERM):
+        signatures[:, p] = np.minimum.reduceat((hashes * a[p] + b[p]) % PRIME, offsets)
+    return signatures
+
+
+def cluster_keys(keys: list[str], similarity: float = SIMILARITY) -> list[int]:
+    """
+    Group folded keywords whose character trigram Jaccard similarity reaches `similarity`.
+
+    MinHash signatures split into LSH bands only make keys that share a band bucket candidates, so the work
+    grows with the number of keys instead of the number of pairs. Candidates are checked with the exact Jaccard.
+
+    Returns:
+        list[int]: The cluster id of every key.
+    """
+    parent = list(range(len(keys)))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    if len(keys) < 2:
+        return parent
+
+    grams = [_ngrams(k) for k in keys]
+    signatures = _minhash(grams)
+    rows = NUM_PERM // BANDS
+    # mixes the rows of a band into one bucket key, a rare collision only costs an extra Jaccard check
+    mix = np.random.default_rng(2).integers(1, 1 << 63, rows, dtype=np.uint64) | np.uint64(1)
+    for band in range(BANDS):
+        bucket_keys = (signatures[:, band * rows:(band + 1) * rows] * mix).sum(axis=1)
+        _, bucket, sizes = np.unique(bucket_keys, return_inverse=True, return_counts=True)
+        shared = np.flatnonzero(sizes[bucket] > 1)
+        if shared.size == 0:
+            continue
+        shared = shared[np.argsort(bucket[shared], kind='stable')]
+        bounds = np.flatnonzero(np.diff(bucket[shared])) + 1
+
+        for members in np.split(shared, bounds):
+            first = int(members[0])
+            for j in members[1:].tolist():
+                root_i, root_j = find(first), find(j)
+                if root_i != root_j and _jaccard(grams[first], grams[j]) >= similarity:
+                    parent[root_j] = root_i
+
+    return [find(i) for i in range(len(keys))]
+
+
+def load_mapping(mapping_file: str = KEYWORD_MAP_FILE) -> dict[str, str]:
+    if not os.path.exists(mapping_file):
+        return {}
+    with open(mapping_file, encoding='utf8') as f:
+        return json.load(f)
+
+
+def save_mapping(mapping: dict[str, str], mapping_file: str = KEYWORD_MAP_FILE) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(mapping_file)), exist_ok=True)
+    with open(mapping_file, 'w', encoding='utf8') as f:
+        json.dump(mapping, f, ensure_ascii=False, indent=0, sort_keys=True)
+
+
+def update_mapping(counts: Counter, mapping: dict[str, str], similarity: float = SIMILARITY) -> dict[str, str]:
+    """
+    Extend a folded keyword -> canonical keyword mapping with new raw keywords.
+
+    Keys already in the mapping keep their canonical form. New keys are clustered together with the known
+    canonical forms, so a new spelling joins an existing cluster. A new cluster is named after its most
+    frequent spelling.
+
+    Args:
+        counts (Counter): Raw keyword -> number of occurrences.
+        mapping (dict[str, str]): The mapping of earlier months, updated in place.
+        similarity (float): The trigram Jaccard similarity from which two keywords are the same.
+
+    Returns:
+        dict[str, str]: The updated mapping.
+    """
+    surfaces: dict[str, Counter] = defaultdict(Counter)
+    for raw, count in counts.items():
+        surfaces[fold(raw)][raw] += count
+
+    new_keys = [k for k in surfaces if k not in mapping]
+    if not new_keys:
+        return mapping
+
+    known = {fold(canonical): canonical for canonical in mapping.values()}
+    new_set = set(new_keys)
+    keys = new_keys + [k for k in known if k not in new_set]
+    clusters = defaultdict(list)
+    for key, cluster in zip(keys, cluster_keys(keys, similarity)):
+        clusters[cluster].append(key)
+
+    for members in clusters.values():
+        existing = sorted(known[k] for k in members if k in known)
+        if existing:
+            canonical = existing[0]
+        else:
+            merged = Counter()
+            for k in members:
+                merged.update(surfaces[k])
+            # the most frequent spelling, preferring lower case over Title Case on ties
+            canonical = max(merged.items(), key=lambda item: (item[1], not item[0].istitle(), item[0]))[0]
+
+        for k in members:
+            if k in surfaces:
+                mapping.setdefault(k, canonical)
+
+    logger.info(f'关键词归一化：{len(counts)} 个写法，新增 {len(new_keys)} 个，共 {len(set(mapping.values()))} 个规范词')
+    return mapping
+
+
+def canonical_keywords(counts: Counter, mapping_file: str | None = KEYWORD_MAP_FILE) -> dict[str, str]:
+    """
+    The canonical form of every raw keyword, updating the cached mapping with the new ones.
+
+    Args:
+        counts (Counter): Raw keyword -> number of occurrences.
+        mapping_file (str | None): Where the mapping is cached across months, None to not cache it.
+
+    Returns:
+        dict[str, str]: Raw keyword -> canonical keyword.
+    """
+    mapping = load_mapping(mapping_file) if mapping_file else {}
+    update_mapping(counts, mapping)
+    if mapping_file:
+        save_mapping(mapping, mapping_file)
+
+    return {raw: mapping[fold(raw)] for raw in counts}
+
+
+def normalize_keywords(keywords: Series, mapping_file: str | None = KEYWORD_MAP_FILE) -> Series:
+    """
+    Replace every keyword of an exploded keyword Series by the canonical form of its cluster.
+
+    Args:
+        keywords (Series): One raw keyword per row.
+        mapping_file (str | None): Where the mapping is cached across months, None to not cache it.
+
+    Returns:
+        Series: The canonical keywords, with the same index.
+    """
+    keywords = keywords.dropna().astype(str)
+    return keywords.map(canonical_keywords(Counter(keywords.value_counts().to_dict()), mapping_file))
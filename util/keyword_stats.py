@@ -0,0 +1,224 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Iterable
+
+from pandas import DataFrame, Series
+
+from path import get_work_path
+
+STATS_FILE = os.path.join(get_work_path(), 'conclusion', 'keyword_stats.sqlite3')
+EMPTY_DAY_SETTLE = 3
+"""Days after a date before bioRxiv having no papers for it is taken as final."""
+
+
+def month_of(date: str) -> tuple[int, int]:
+    """The (year, month) of a 'YYYY-MM-DD' date."""
+    return int(date[:4]), int(date[5:7])
+
+
+def add_months(year: int, month: int, months: int) -> tuple[int, int]:
+    """The (year, month) `months` months after (year, month)."""
+    year, month = divmod(year * 12 + month - 1 + months, 12)
+    return year, month + 1
+
+
+class KeywordStats:
+    """
+    Running per-(year, month, category) keyword counts, updated one day at a time.
+
+    Every paper of a month is recorded with its keywords once, and its keywords are added to the monthly
+    counts in the same transaction, so a day that is processed again or a run that stops halfway never counts
+    a paper twice. The raw keywords are counted, normalization happens when a report is drawn, so a better
+    keyword mapping also applies to earlier months.
+    """
+
+    def __init__(self, stats_file: str = STATS_FILE):
+        os.makedirs(os.path.dirname(os.path.abspath(stats_file)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(stats_file, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS paper (
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                doi TEXT NOT NULL,
+                title TEXT,
+                date TEXT NOT NULL,
+                category TEXT NOT NULL,
+                keywords TEXT NOT NULL,
+                PRIMARY KEY (year, month, doi)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS paper_doi ON paper (doi);
+
+            CREATE TABLE IF NOT EXISTS keyword_count (
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (year, month, category, keyword)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS paper_count (
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (year, month, category)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS day (
+                date TEXT PRIMARY KEY,
+                papers INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_papers(self, papers: Iterable[tuple[str, str, str, str, list[str]]]) -> int:
+        """
+        Record papers and add their keywords to the counts of their month and category.
+
+        Args:
+            papers (Iterable[tuple[str, str, str, str, list[str]]]): (doi, title, date, category, keywords) of
+                every paper.
+
+        Returns:
+            int: The number of papers that were new in their month, papers seen before are not counted again.
+        """
+        keyword_counts, paper_counts = Counter(), Counter()
+        added = 0
+        with self._lock:
+            try:
+                for doi, title, date, category, keywords in papers:
+                    year, month = month_of(date)
+                    cursor = self.conn.execute(
+                        'INSERT OR IGNORE INTO paper (year, month, doi, title, date, category, keywords) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (year, month, doi, title, date, category, json.dumps(keywords, ensure_ascii=False))
+                    )
+                    if cursor.rowcount == 0:
+                        continue
+                    added += 1
+                    paper_counts[year, month, category] += 1
+                    keyword_counts.update((year, month, category, keyword) for keyword in keywords)
+
+                self.conn.executemany(
+                    'INSERT INTO keyword_count (year, month, category, keyword, count) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT DO UPDATE SET count = count + excluded.count',
+                    [(*key, count) for key, count in keyword_counts.items()]
+                )
+                self.conn.executemany(
+                    'INSERT INTO paper_count (year, month, category, count) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT DO UPDATE SET count = count + excluded.count',
+                    [(*key, count) for key, count in paper_counts.items()]
+                )
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+        return added
+
+    def mark_day(self, date: str, papers: int) -> None:
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO day (date, papers, updated_at) VALUES (?, ?, ?)', (date, papers, time.time())
+            )
+            self.conn.commit()
+
+    def days(self) -> set[str]:
+        """
+        The dates whose papers are all counted.
+
+        A date counted with no papers is left out until it was counted `EMPTY_DAY_SETTLE` days after it, bioRxiv
+        answers "no posts found" for a day it has not published yet as well.
+        """
+        with self._lock:
+            rows = self.conn.execute('SELECT date, papers, updated_at FROM day').fetchall()
+        return {
+            date for date, papers, updated_at in rows
+            if papers > 0 or updated_at >= datetime.strptime(date, '%Y-%m-%d').timestamp() + EMPTY_DAY_SETTLE * 86400
+        }
+
+    def seen(self, year: int, month: int, dois: Iterable[str]) -> set[str]:
+        """The DOIs among `dois` that are already counted in the month."""
+        dois = list(dois)
+        result = set()
+        with self._lock:
+            for i in range(0, len(dois), 900):
+                chunk = dois[i:i + 900]
+                rows = self.conn.execute(
+                    f"SELECT doi FROM paper WHERE year = ? AND month = ? AND doi IN ({','.join('?' * len(chunk))})",
+                    (year, month, *chunk)
+                )
+                result.update(row[0] for row in rows)
+        return result
+
+    def known_keywords(self, dois: Iterable[str]) -> dict[str, list[str]]:
+        """Keywords extracted for the DOIs in any month, so a new version of a paper is not extracted again."""
+        dois = list(dois)
+        result = {}
+        with self._lock:
+            for i in range(0, len(dois), 900):
+                chunk = dois[i:i + 900]
+                rows = self.conn.execute(
+                    f"SELECT doi, keywords FROM paper WHERE doi IN ({','.join('?' * len(chunk))})", chunk
+                )
+                result.update((doi, json.loads(keywords)) for doi, keywords in rows)
+        return result
+
+    def keyword_counts(self, year: int, month: int, months: int = 1) -> DataFrame:
+        """
+        The raw keyword counts of a month, or the sums over `months` months from it, summed in SQLite so only
+        one row per distinct keyword is loaded whatever the range.
+
+        Returns:
+            DataFrame: The columns category, keyword and count.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT category, keyword, sum(count) FROM keyword_count '
+                'WHERE year * 12 + month BETWEEN ? AND ? GROUP BY category, keyword',
+                self._month_range(year, month, months)
+            ).fetchall()
+        return DataFrame(rows, columns=['category', 'keyword', 'count'])
+
+    def paper_counts(self, year: int, month: int, months: int = 1) -> Series:
+        """The number of papers of every category in a month, or over `months` months from it, largest first."""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT category, sum(count) AS total FROM paper_count WHERE year * 12 + month BETWEEN ? AND ? '
+                'GROUP BY category ORDER BY total DESC, category',
+                self._month_range(year, month, months)
+            ).fetchall()
+        return Series(dict(rows), name='count', dtype='int64')
+
+    @staticmethod
+    def _month_range(year: int, month: int, months: int) -> tuple[int, int]:
+        return year * 12 + month, year * 12 + month + months - 1
+
+    def month_keywords(self, year: int, month: int) -> DataFrame:
+        """Every paper of a month with its keywords, in the shape `SearchIndex.add_keywords` reads."""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT doi, title, date, category, keywords FROM paper WHERE year = ? AND month = ?', (year, month)
+            ).fetchall()
+        data = DataFrame(rows, columns=['doi', 'title', 'date', 'category', 'keywords'])
+        data['keywords'] = [json.loads(keywords) for keywords in data['keywords']]
+        return data
@@ -0,0 +1,141 @@
+import math
+import os
+import re
+from collections import Counter
+from enum import StrEnum
+
+from pydantic import BaseModel, Field
+
+from util.relevance import STOP_WORDS
+
+WORD_PATTERN = re.compile(r"[A-Za-z0-9α-ωΑ-Ω]+(?:[-'/][A-Za-z0-9α-ωΑ-Ω]+)*|[.,;:!?()\[\]{}\"]")
+KEYWORD_STOP_WORDS = STOP_WORDS | frozenset("""
+across additionally analysis analyses analyzed associated available can considerable critical demonstrate demonstrated
+demonstrates different et effect effects enable enables especially first high higher identify identified important
+improve improved improves including increase increased key known large less likely low lower many much multiple
+number one overall particular possible potential present provide provides recent reveal revealed reveals role several
+significant significantly specific still suggest suggests therefore thus two well whether yet via
+""".split())
+MAX_PHRASE_WORDS = 3
+
+
+class KeywordResponse(BaseModel):
+    keywords: list[str] = Field(description='Keywords list of the paper.')
+
+
+class KeywordBackend(StrEnum):
+    LLM = 'llm'
+    LOCAL = 'local'
+
+
+KEYWORD_BACKEND = KeywordBackend(os.environ.get('KEYWORD_BACKEND', KeywordBackend.LLM))
+
+
+def _is_content_word(word: str) -> bool:
+    lower = word.lower()
+    return lower not in KEYWORD_STOP_WORDS and len(lower) > 1 and not lower.isdigit() and any(c.isalpha() for c in lower)
+
+
+def candidate_phrases(text: str) -> list[tuple[str, str]]:
+    """
+    The candidate keyphrases of a text in order of appearance, as (normalized, surface) pairs.
+
+    Like RAKE, the text is cut at punctuation and stop words, and every run of up to three content words
+    inside a chunk is a candidate.
+    """
+    chunks, chunk = [], []
+    for token in WORD_PATTERN.findall(text):
+        if _is_content_word(token):
+            chunk.append(token)
+        elif chunk:
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+
+    phrases = []
+    for chunk in chunks:
+        for size in range(1, MAX_PHRASE_WORDS + 1):
+            for i in range(len(chunk) - size + 1):
+                words = chunk[i:i + size]
+                phrases.append((' '.join(w.lower() for w in words), ' '.join(words)))
+    return phrases
+
+
+def _surface_form(forms: Counter) -> str:
+    """How a phrase is usually written, lower-cased unless it contains an acronym like CRISPR or SARS-CoV2."""
+    surface = forms.most_common(1)[0][0]
+    if any(sum(c.isupper() for c in w) > 1 for w in surface.split()):
+        return surface
+    return surface.lower()
+
+
+def extract_keywords_local(abstracts: list[str], min_keywords: int = 3, max_keywords: int = 7) -> list[KeywordResponse]:
+    """
+    Extract keyphrases from every abstract of a corpus in one pass, with no model or API calls.
+
+    A phrase scores by its frequency in the abstract times its inverse document frequency over `abstracts`,
+    favouring multi-word phrases and phrases that appear early. Phrases contained in a better phrase are dropped.
+    The result only depends on `abstracts`, so the same corpus always gives the same keywords, but an abstract
+    extracted in a different corpus, e.g. one day instead of a whole month, may get different ones.
+
+    Args:
+        abstracts (list[str]): The abstracts of the corpus, e.g. a day or a month.
+        min_keywords (int): Return at least this many keywords when the abstract has enough candidates.
+        max_keywords (int): Return at most this many keywords.
+
+    Returns:
+        list[KeywordResponse]: The keywords of each abstract, in the same order.
+    """
+    documents = [candidate_phrases(text) if isinstance(text, str) else [] for text in abstracts]
+
+    doc_freq = Counter()
+    for phrases in documents:
+        doc_freq.update({phrase for phrase, _ in phrases})
+    n = len(documents)
+
+    results = []
+    for phrases in documents:
+        counts = Counter(phrase for phrase, _ in phrases)
+        forms: dict[str, Counter] = {}
+        first_seen: dict[str, int] = {}
+        for position, (phrase, surface) in enumerate(phrases):
+            forms.setdefault(phrase, Counter())[surface] += 1
+            first_seen.setdefault(phrase, position)
+
+        total = len(phrases) or 1
+        scores = {}
+        for phrase, count in counts.items():
+            size = phrase.count(' ') + 1
+            # a phrase that occurs once is usually an accident of word order or a passing mention, not a topic
+            if count == 1 and (size == 1 or doc_freq[phrase] == 1):
+                continue
+            idf = math.log((n + 1) / (doc_freq[phrase] + 0.5))
+            position = 1 + 0.5 / (1 + first_seen[phrase] / total * 10)
+            scores[phrase] = count * idf * (1 + 0.6 * (size - 1)) * position
+
+        selected = []
+        for phrase in sorted(scores, key=lambda p: (-scores[p], p)):
+            if len(selected) == max_keywords:
+                break
+            if any(f' {phrase} ' in f' {chosen} ' for chosen in selected):
+                continue
+            # a longer phrase that repeats replaces the shorter one it contains, "unique k-mers" over "unique"
+            contained = [i for i, chosen in enumerate(selected) if f' {chosen} ' in f' {phrase} ']
+            if contained:
+                if counts[phrase] > 1:
+                    selected[contained[0]] = phrase
+                    selected = [p for i, p in enumerate(selected) if i not in contained[1:]]
+                continue
+            selected.append(phrase)
+
+        # fall back to frequent single words for abstracts too short to yield enough phrases
+        if len(selected) < min_keywords:
+            for phrase, _ in counts.most_common():
+                if len(selected) >= min_keywords:
+                    break
+                if phrase not in selected and ' ' not in phrase:
+                    selected.append(phrase)
+
+        results.append(KeywordResponse(keywords=[_surface_form(forms[p]) for p in selected]))
+    return results
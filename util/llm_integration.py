@@ -1,31 +1,49 @@
-import streamlit as st
-
+import os
 from operator import itemgetter
-
-from langchain_core.messages import SystemMessage
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableLambda
-from langchain_openai import ChatOpenAI
+from typing import TYPE_CHECKING
 
 from util.biorxiv_fetcher import Paper
+from util.metrics import trace_stream
+from util.resilience import Dependency, get_breaker
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
 
 SYSTEM_PROMPT = """你是一名科研助理，你的任务是对于用户给出的科研文献内容进行精炼总结，总结时需要遵从以下格式：
 你给出的总结总共分为两段，600字以内。
 第一段以以“来自XXX的这项研究工作...”或“来自XXX的研究团队在这篇文章中...”或“来自XXX的研究人员提出了...”类似的句子开头。这一段的总结内容包括文章的创新点、主要内容、取得的主要成果、作者认为未来要做的工作（如果有）。这一段*不用*总结研究意义。
 第二段以“这项研究...”开头，用一句话总结一下这篇文章的意义。"""
 
+LLM_API_BASE = os.environ.get('LLM_API_BASE', 'https://open.bigmodel.cn/api/paas/v4/')
+OPENAI_API_BASE = os.environ.get('OPENAI_API_BASE')
+SUMMARY_MODEL = 'glm-4-flash'
+SUMMARY_TEMPERATURE = 0.6
+
 ASK_PROMPT = """下面是文献的相关信息：
 \n==================\n{info}\n====================\n
 请用中文以简洁的语言给出的文献内容进行总结，，符合要求的格式，务必包含文献真正关键的信息。"""
 
 
-def load_gpt() -> ChatOpenAI:
+def get_secret(name: str) -> str:
+    """Read a secret from the environment variable `NAME` first, then from the Streamlit secrets."""
+    value = os.environ.get(name.upper())
+    if value:
+        return value
+
+    import streamlit as st
+    return st.secrets[name]
+
+
+def load_gpt(timeout: float | None = None) -> 'ChatOpenAI':
+    from langchain_openai import ChatOpenAI
+
     llm = ChatOpenAI(
-        model_name="glm-4-flash",
-        openai_api_base='https://open.bigmodel.cn/api/paas/v4/',
-        temperature=0.6,
-        openai_api_key=st.secrets['gml_key'],
-        streaming=True
+        model_name=SUMMARY_MODEL,
+        openai_api_base=LLM_API_BASE,
+        temperature=SUMMARY_TEMPERATURE,
+        openai_api_key=get_secret('gml_key'),
+        streaming=True,
+        request_timeout=timeout
     )
     return llm
 
@@ -44,7 +62,19 @@ def format_paper(paper: Paper) -> str:
     return formatted_str
 
 
-def conclusion(paper: Paper):
+def summary_messages(paper: Paper) -> list[dict]:
+    """The chat messages `conclusion` sends for a paper, in the OpenAI request format."""
+    return [
+        {'role': 'system', 'content': SYSTEM_PROMPT},
+        {'role': 'user', 'content': ASK_PROMPT.format(info=format_paper(paper))},
+    ]
+
+
+def conclusion(paper: Paper, timeout: float | None = None):
+    from langchain_core.messages import SystemMessage
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.runnables import RunnableLambda
+
     formatter = itemgetter("paper") | RunnableLambda(format_paper)
 
     prompt = ChatPromptTemplate.from_messages([
@@ -52,10 +82,10 @@ def conclusion(paper: Paper):
         ('human', ASK_PROMPT)
     ])
 
-    llm = load_gpt()
+    llm = load_gpt(timeout)
 
     chain = {'info': formatter} | prompt | llm
 
-    result = chain.stream({'paper': paper})
+    result = get_breaker(Dependency.LLM).wrap_iter(chain.stream({'paper': paper}))
 
-    return result
+    return trace_stream(result, 'llm', doi=paper.doi)
@@ -0,0 +1,294 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Callable, Any, Iterator, Iterable
+
+from loguru import logger
+
+ENABLED = os.environ.get('BIOSUMMARY_TRACE', '1') != '0'
+MAX_SPANS = 200_000
+
+
+@dataclass
+class Span:
+    name: str
+    start_ns: int
+    end_ns: int = 0
+    thread_id: int = 0
+    attrs: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+
+class Histogram:
+    """
+    Log-bucketed latency histogram with a fixed memory footprint.
+
+    Bucket `i` holds values in `[BASE * GROWTH ** (i - 1), BASE * GROWTH ** i)` seconds,
+    so percentiles are accurate to about 10%.
+    """
+    BASE = 1e-4
+    GROWTH = 1.1
+    BUCKETS = 200
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        if value <= self.BASE:
+            index = 0
+        else:
+            index = min(int(math.log(value / self.BASE, self.GROWTH)) + 1, self.BUCKETS - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, p: float) -> float:
+        if self.count == 0:
+            return 0.0
+
+        rank = p / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                upper = self.BASE * self.GROWTH ** index
+                return min(max(upper, self.min), self.max)
+
+        return self.max
+
+    def to_dict(self) -> dict[str, float]:
+        return {
+            'count': self.count,
+            'total': round(self.total, 6),
+            'mean': round(self.total / self.count, 6) if self.count else 0.0,
+            'min': round(self.min, 6) if self.count else 0.0,
+            'p50': round(self.percentile(50), 6),
+            'p95': round(self.percentile(95), 6),
+            'p99': round(self.percentile(99), 6),
+            'max': round(self.max, 6),
+        }
+
+
+class Tracer:
+    """Collects per-stage spans, latency histograms and counters for one pipeline run."""
+
+    def __init__(self, enabled: bool = ENABLED, max_spans: int = MAX_SPANS):
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self._lock = threading.Lock()
+        self._active_runs = 0
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self.run_start_ns = time.perf_counter_ns()
+        self.wall_start = time.time()
+        self.spans: list[Span] = []
+        self.dropped_spans = 0
+        self.histograms: dict[str, Histogram] = {}
+        self.counters: dict[str, dict[str, int]] = {}
+
+    @contextmanager
+    def run(self) -> Iterator['Tracer']:
+        """
+        Scope one run in a process that may start several at once, like the Streamlit server.
+
+        The data is reset only when no other run is active, so a run that starts while another is still going
+        records into the same data instead of wiping it.
+        """
+        with self._lock:
+            if self._active_runs == 0:
+                self._clear()
+            self._active_runs += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._active_runs -= 1
+
+    def record(self, span: Span) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            histogram = self.histograms.get(span.name)
+            if histogram is None:
+                histogram = self.histograms[span.name] = Histogram()
+            histogram.add(span.duration)
+
+            for key in ('bytes', 'tokens'):
+                if key in span.attrs:
+                    self._incr(span.name, key, int(span.attrs[key]))
+
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+
+    def incr(self, stage: str, key: str, value: int = 1) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._incr(stage, key, value)
+
+    def _incr(self, stage: str, key: str, value: int) -> None:
+        stage_counter = self.counters.setdefault(stage, {})
+        stage_counter[key] = stage_counter.get(key, 0) + value
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        """
+        Time the enclosed block as a span of stage `name`.
+
+        Attributes such as `doi`, `bytes` or `tokens` can be passed up front or set on the yielded
+        span's `attrs` inside the block. A raised exception is recorded as `error` and re-raised.
+        """
+        _span = Span(name, time.perf_counter_ns(), thread_id=threading.get_ident(), attrs=attrs)
+        try:
+            yield _span
+        except BaseException as e:
+            _span.attrs['error'] = repr(e)
+            self.incr(name, 'errors')
+            raise
+        finally:
+            _span.end_ns = time.perf_counter_ns()
+            self.record(_span)
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            elapsed = (time.perf_counter_ns() - self.run_start_ns) / 1e9
+            papers = self.histograms['paper'].count if 'paper' in self.histograms else 0
+            return {
+                'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.wall_start)),
+                'elapsed': round(elapsed, 3),
+                'papers': papers,
+                'papers_per_minute': round(papers / elapsed * 60, 3) if elapsed > 0 else 0.0,
+                'stages': {
+                    name: {**histogram.to_dict(), **self.counters.get(name, {})}
+                    for name, histogram in sorted(self.histograms.items())
+                },
+                'counters': {
+                    name: counter
+                    for name, counter in sorted(self.counters.items())
+                    if name not in self.histograms
+                },
+                'dropped_spans': self.dropped_spans,
+            }
+
+    def trace_events(self) -> list[dict[str, Any]]:
+        """Spans in the Chrome trace event format, readable by chrome://tracing and Perfetto."""
+        with self._lock:
+            spans = list(self.spans)
+
+        pid = os.getpid()
+        return [
+            {
+                'name': span.name,
+                'cat': 'biosummary',
+                'ph': 'X',
+                'ts': (span.start_ns - self.run_start_ns) / 1e3,
+                'dur': (span.end_ns - span.start_ns) / 1e3,
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': {key: str(value) for key, value in span.attrs.items()},
+            }
+            for span in spans
+        ]
+
+    def export(self, output_path: str | bytes, prefix: str = 'run') -> tuple[str, str]:
+        """
+        Write the run summary and the trace of the run to `output_path`.
+
+        Returns:
+            tuple[str, str]: Paths of the summary JSON and of the trace JSON.
+        """
+        os.makedirs(output_path, exist_ok=True)
+        summary_file = os.path.join(output_path, f'{prefix}_summary.json')
+        trace_file = os.path.join(output_path, f'{prefix}_trace.json')
+
+        with open(summary_file, 'w', encoding='utf8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+        with open(trace_file, 'w', encoding='utf8') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+
+        logger.info(f'运行统计已保存至 {summary_file}')
+        return summary_file, trace_file
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attrs):
+    return tracer.span(name, **attrs)
+
+
+def traced(name: str | None = None) -> Callable:
+    """A decorator that records every call of the function as a span."""
+
+    def decorator(func: Callable) -> Callable:
+        stage = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs) -> Any:
+            with tracer.span(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_stream(stream: Iterable, name: str = 'llm', **attrs) -> Iterator:
+    """
+    Pass through a streamed LLM response, recording time to first token and total time.
+
+    The first chunk closes a `{name}_ttft` span and the exhausted stream closes a `{name}` span with
+    the number of streamed chunks as `tokens`, or the provider's usage if it is reported.
+    """
+    start_ns = time.perf_counter_ns()
+    thread_id = threading.get_ident()
+    tokens = 0
+    usage_tokens = 0
+    error = None
+
+    try:
+        for chunk in stream:
+            if tokens == 0:
+                tracer.record(Span(f'{name}_ttft', start_ns, time.perf_counter_ns(), thread_id, dict(attrs)))
+            tokens += 1
+
+            usage = getattr(chunk, 'usage_metadata', None)
+            if usage:
+                usage_tokens = usage.get('output_tokens', usage_tokens)
+
+            yield chunk
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        error = repr(e)
+        tracer.incr(name, 'errors')
+        raise
+    finally:
+        _attrs = {**attrs, 'tokens': usage_tokens or tokens}
+        if error is not None:
+            _attrs['error'] = error
+        tracer.record(Span(name, start_ns, time.perf_counter_ns(), thread_id, _attrs))
@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import threading
+import time
+from enum import StrEnum
+from typing import Iterable
+
+from path import get_work_path
+
+INDEX_FILE = os.path.join(get_work_path(), 'paper_index.sqlite3')
+SQLITE_MAX_VARIABLES = 900
+
+
+class PaperState(StrEnum):
+    FETCHED = 'fetched'
+    DOWNLOADED = 'downloaded'
+    PARSED = 'parsed'
+    SUMMARIZED = 'summarized'
+    WRITTEN = 'written'
+
+    @property
+    def rank(self) -> int:
+        return list(PaperState).index(self)
+
+
+class PaperIndex:
+    """
+    Persistent record of how far every DOI got through the pipeline and where its artifacts are.
+
+    States only move forward, so a rerun never downgrades a paper that was already written.
+    """
+
+    def __init__(self, index_file: str = INDEX_FILE):
+        os.makedirs(os.path.dirname(os.path.abspath(index_file)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(index_file, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS paper (
+                doi TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                rank INTEGER NOT NULL,
+                date TEXT,
+                category TEXT,
+                pdf_path TEXT,
+                output_file TEXT,
+                summary TEXT,
+                image BLOB,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _select(self, column: str, dois: Iterable[str]) -> dict[str, any]:
+        dois = list(dict.fromkeys(dois))
+        result = {}
+        with self._lock:
+            for i in range(0, len(dois), SQLITE_MAX_VARIABLES):
+                chunk = dois[i:i + SQLITE_MAX_VARIABLES]
+                rows = self.conn.execute(
+                    f"SELECT doi, {column} FROM paper WHERE doi IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                result.update(rows)
+        return result
+
+    def states(self, dois: Iterable[str]) -> dict[str, PaperState]:
+        """Look up the state of many DOIs at once. Unknown DOIs are left out."""
+        return {doi: PaperState(state) for doi, state in self._select('state', dois).items()}
+
+    def output_files(self, dois: Iterable[str]) -> dict[str, str]:
+        """Look up the summary files many DOIs were written to. DOIs that were not written are left out."""
+        return {doi: path for doi, path in self._select('output_file', dois).items() if path is not None}
+
+    def mark(self, doi: str, state: PaperState, **artifacts) -> None:
+        self.mark_many([doi], state, **artifacts)
+
+    def mark_many(self, dois: Iterable[str], state: PaperState, **artifacts) -> None:
+        """
+        Move DOIs forward to `state` and record their artifacts.
+
+        Args:
+            dois: The DOIs to update.
+            state (PaperState): The stage the papers just finished.
+            **artifacts: Any of `date`, `category`, `pdf_path`, `output_file`, `summary` and `image`.
+                Columns that are not given keep their value. An image given as a path is stored as its bytes,
+                the file usually lives in a temporary folder that is removed after the run.
+        """
+        columns = ['date', 'category', 'pdf_path', 'output_file', 'summary', 'image']
+        unknown = set(artifacts) - set(columns)
+        if unknown:
+            raise ValueError(f'Unknown artifacts: {unknown}')
+
+        if isinstance(artifacts.get('image'), str):
+            with open(artifacts['image'], 'rb') as f:
+                artifacts['image'] = f.read()
+
+        values = [artifacts.get(c) for c in columns]
+        updates = ', '.join(f'{c} = COALESCE(excluded.{c}, {c})' for c in columns)
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                f"""
+                INSERT INTO paper (doi, state, rank, {', '.join(columns)}, updated_at)
+                VALUES (?, ?, ?, {', '.join('?' * len(columns))}, ?)
+                ON CONFLICT(doi) DO UPDATE SET
+                    state = CASE WHEN excluded.rank > rank THEN excluded.state ELSE state END,
+                    rank = MAX(excluded.rank, rank),
+                    {updates},
+                    updated_at = excluded.updated_at
+                """,
+                [(doi, state.value, state.rank, *values, now) for doi in dois]
+            )
+            self.conn.commit()
+
+    def get_summary(self, doi: str) -> tuple[str, bytes | str] | None:
+        """The stored summary and first image of a paper that was already summarized."""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT summary, image FROM paper WHERE doi = ? AND rank >= ?',
+                (doi, PaperState.SUMMARIZED.rank)
+            ).fetchone()
+
+        if row is None or row[0] is None:
+            return None
+
+        summary, image = row
+        # images of older runs were stored as paths, their folder may have been removed since
+        if isinstance(image, str) and not os.path.exists(image):
+            image = None
+        return summary, image or ""
@@ -0,0 +1,210 @@
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from enum import StrEnum
+from typing import TYPE_CHECKING
+
+from loguru import logger
+
+from util.grobid_util import parse_pdf, extract_paragraphs, check_title
+from util.metrics import span, traced
+from util.resilience import Deadline
+
+if TYPE_CHECKING:
+    import fitz
+
+NUMBERING = re.compile(r'^\s*(?:\d+(?:\.\d+)*|[IVX]+)\.?\s+')
+
+
+class SectionMode(StrEnum):
+    GROBID = 'grobid'
+    LOCAL = 'local'
+    RACE = 'race'
+    FALLBACK = 'fallback'
+
+
+SECTION_MODE = SectionMode(os.environ.get('SECTION_MODE', SectionMode.FALLBACK))
+SECTION_DEADLINE = float(os.environ.get('SECTION_DEADLINE', 90))
+
+
+def _read_lines(doc: 'fitz.Document') -> list[tuple[str, float, bool]]:
+    import fitz
+
+    lines = []
+    for page in doc:
+        for block in page.get_text('dict')['blocks']:
+            for line in block.get('lines', []):
+                spans = [s for s in line['spans'] if s['text'].strip()]
+                if not spans:
+                    continue
+
+                text = ' '.join(s['text'].strip() for s in spans)
+                size = round(max(s['size'] for s in spans), 1)
+                bold = all(s['flags'] & fitz.TEXT_FONT_BOLD or 'bold' in s['font'].lower() for s in spans)
+                lines.append((text, size, bold))
+    return lines
+
+
+@traced('local_sections')
+def extract_sections(pdf_file: str | bytes) -> dict:
+    """
+    Find the Introduction, Discussion and Conclusion sections of a PDF from its text blocks.
+
+    A line is a heading when it is short and set larger than the body text or in bold while the body is not.
+    Returns the same dict shape as `extract_paragraphs`: heading -> section text.
+    """
+    import fitz
+
+    with (fitz.open(stream=pdf_file, filetype='pdf') if isinstance(pdf_file, bytes) else fitz.open(pdf_file)) as doc:
+        lines = _read_lines(doc)
+
+    if not lines:
+        return {}
+
+    weights = Counter()
+    bold_weights = Counter()
+    for text, size, bold in lines:
+        weights[size] += len(text)
+        bold_weights[bold] += len(text)
+    body_size = weights.most_common(1)[0][0]
+    body_bold = bold_weights.most_common(1)[0][0]
+
+    def is_heading(_text: str, _size: float, _bold: bool) -> bool:
+        if len(_text) > 80 or _text.endswith(('.', ',', ';')):
+            return False
+        return _size >= body_size + 1 or (_bold and not body_bold)
+
+    result = {}
+    title = None
+    text_list = []
+    for text, size, bold in lines:
+        if is_heading(text, size, bold):
+            if title is not None:
+                result[title] = ' '.join(text_list).strip()
+
+            heading = NUMBERING.sub('', text).strip()
+            title = heading if check_title(heading) else None
+            text_list = []
+        elif title is not None:
+            text_list.append(text)
+
+    if title is not None:
+        result[title] = ' '.join(text_list).strip()
+
+    return {k: v for k, v in result.items() if v}
+
+
+class _GrobidCall:
+    """
+    One Grobid call that can be abandoned.
+
+    It waits at most `wait` seconds for a slot of `grobid_limit`, then gives the upload and its retries `wait`
+    seconds more, and does not upload the PDF once it is cancelled, so calls nobody waits for anymore do not
+    hold the shared Grobid slots.
+    """
+
+    def __init__(self, pdf_file: str | bytes, grobid_limit: threading.Semaphore | None, wait: float | None = None):
+        self.pdf_file = pdf_file
+        self.grobid_limit = grobid_limit
+        self.wait = wait
+        self.started_at: float | None = None
+        self.cancelled = threading.Event()
+
+    def _acquire(self) -> None:
+        if self.grobid_limit is None:
+            return
+
+        end = time.monotonic() + self.wait if self.wait is not None else None
+        while not self.grobid_limit.acquire(timeout=0.5 if end is None else max(min(end - time.monotonic(), 0.5), 0)):
+            if self.cancelled.is_set() or (end is not None and time.monotonic() >= end):
+                raise TimeoutError(f'No Grobid slot within {self.wait}s')
+
+    def __call__(self) -> dict:
+        self._acquire()
+        try:
+            if self.cancelled.is_set():
+                raise TimeoutError('Grobid call abandoned before the upload')
+            self.started_at = time.monotonic()
+            deadline = Deadline(self.wait) if self.wait is not None else None
+            xml_text = parse_pdf(self.pdf_file, deadline=deadline, cancelled=self.cancelled)
+        finally:
+            if self.grobid_limit is not None:
+                self.grobid_limit.release()
+        return extract_paragraphs(xml_text)
+
+
+def parse_sections(
+        pdf_file: str | bytes,
+        mode: SectionMode = SECTION_MODE,
+        deadline: float = SECTION_DEADLINE,
+        min_sections: int = 1,
+        grobid_limit: threading.Semaphore | None = None
+) -> dict:
+    """
+    Extract the key sections of a paper with Grobid, the local extractor, or both.
+
+    Args:
+        pdf_file (str | bytes): The path of the PDF, or its content.
+        mode (SectionMode): `grobid` or `local` use one extractor. `race` runs both and takes the first result
+            with at least `min_sections` sections. `fallback` waits up to `deadline` for Grobid and uses the local
+            result if Grobid fails, times out or finds too few sections.
+        deadline (float): Seconds to wait for Grobid in `race` and `fallback` mode, counted from when it gets a
+            slot of `grobid_limit`. Waiting for the slot is bounded by the same number of seconds.
+        min_sections (int): The number of sections a result needs to be good enough.
+        grobid_limit (threading.Semaphore | None): Guards concurrent Grobid calls.
+
+    Returns:
+        dict: Section heading -> section text, possibly empty.
+    """
+    if mode == SectionMode.GROBID:
+        return _GrobidCall(pdf_file, grobid_limit)()
+    if mode == SectionMode.LOCAL:
+        return extract_sections(pdf_file)
+
+    def good_enough(_result) -> bool:
+        return _result is not None and len(_result) >= min_sections
+
+    # an upload already running when Grobid misses the deadline times out with it, and is not retried
+    grobid_call = _GrobidCall(pdf_file, grobid_limit, deadline)
+    executor = ThreadPoolExecutor(max_workers=2)
+    with span('sections', mode=str(mode)) as _span:
+        future_grobid = executor.submit(grobid_call)
+        future_local = executor.submit(extract_sections, pdf_file)
+        results = {future_grobid: 'grobid', future_local: 'local'}
+
+        def result_of(future):
+            try:
+                return future.result()
+            except Exception as e:
+                logger.warning(f'{results[future]} section extraction failed: {repr(e)}')
+                return None
+
+        queued_until = time.monotonic() + deadline
+        pending = {future_grobid} if mode == SectionMode.FALLBACK else {future_grobid, future_local}
+        while pending:
+            started_at = grobid_call.started_at
+            end = started_at + deadline if started_at is not None else queued_until
+            done, pending = wait(pending, timeout=max(end - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                if grobid_call.started_at is not None and grobid_call.started_at + deadline > time.monotonic():
+                    continue
+                name = 'in-memory PDF' if isinstance(pdf_file, bytes) else os.path.basename(pdf_file)
+                logger.warning(f'Grobid missed the {deadline}s deadline for {name}')
+                break
+
+            for future in done:
+                result = result_of(future)
+                if good_enough(result):
+                    _span.attrs['source'] = results[future]
+                    grobid_call.cancelled.set()
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    return result
+
+        grobid_call.cancelled.set()
+        local = result_of(future_local)
+        executor.shutdown(wait=False, cancel_futures=True)
+        _span.attrs['source'] = 'local'
+        return local or {}
@@ -0,0 +1,312 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from itertools import chain, zip_longest
+
+from loguru import logger
+from pandas import DataFrame
+
+from path import get_work_path
+from util.biorxiv_fetcher import Paper, fetch_pdf, MAIN_LIST
+from util.file_util import get_image, DocData, Degraded
+from util.llm_integration import conclusion
+from util.metrics import span, tracer
+from util.paper_index import PaperIndex, PaperState
+from util.pdf_sections import parse_sections, SECTION_DEADLINE
+from util.resilience import Deadline, DeadlineStream, DeadlineExceeded
+from util.work_queue import Task, encode_doc
+
+
+KEEP_FILES = os.environ.get('BIOSUMMARY_KEEP_FILES', '0') == '1'
+PAPER_TASK = 'paper'
+
+
+@dataclass
+class ResourceLimits:
+    download: int = 4
+    grobid: int = 2
+    llm: int = 4
+
+
+@dataclass
+class Deadlines:
+    """Seconds a paper and each of its stages may take before the pipeline degrades instead of waiting."""
+    paper: float = 240
+    download: float = 60
+    image: float = 15
+    sections: float = SECTION_DEADLINE
+    llm: float = 120
+
+
+DEADLINES = Deadlines()
+
+
+class SharedLimits:
+    """Global concurrency limits shared by every date and category of a run."""
+
+    def __init__(self, limits: ResourceLimits = ResourceLimits()):
+        self.limits = limits
+        self.download = threading.BoundedSemaphore(limits.download)
+        self.grobid = threading.BoundedSemaphore(limits.grobid)
+        self.llm = threading.BoundedSemaphore(limits.llm)
+
+    @property
+    def total(self) -> int:
+        return self.limits.download + self.limits.grobid + self.limits.llm
+
+
+def interleave(groups: list[list]) -> list:
+    """
+    Take one item of every group in turn.
+
+    Work submitted in this order reaches the shared limits round-robin, so a large category cannot hold every
+    slot until it is done while the small ones wait behind it.
+    """
+    missing = object()
+    return [item for item in chain.from_iterable(zip_longest(*groups, fillvalue=missing)) if item is not missing]
+
+
+def get_output_file(date: str, cat: str) -> str:
+    if cat in MAIN_LIST:
+        return os.path.join(
+            get_work_path(),
+            f'{date}-summary',
+            'main',
+            f"{date} BiorRxiv预印本速读【{cat.title()}】.docx"
+        )
+
+    return os.path.join(
+        get_work_path(),
+        f'{date}-summary',
+        f"{date} BiorRxiv预印本速读【{cat.title()}】.docx"
+    )
+
+
+def prepare_paper(
+        paper: Paper,
+        base_path: str,
+        limits: SharedLimits,
+        keep_files: bool = KEEP_FILES,
+        index: PaperIndex | None = None,
+        deadlines: Deadlines = DEADLINES
+) -> tuple[str | bytes, list[Degraded]]:
+    """
+    Download the PDF of a paper, extract its first image and fill `paper.more_graph` with its key sections.
+
+    The PDF is downloaded once and the same bytes are used for the image extraction and the Grobid upload.
+    Preparing shares the paper deadline minus the LLM's share. A stage that fails or runs out of time is
+    skipped: without the PDF or its sections the paper is summarized from the abstract, without the image
+    the entry has no figure.
+
+    Args:
+        paper (Paper): The paper to prepare, `more_graph` is updated in place.
+        base_path (str): Folder for the PDF and the image when `keep_files` is set.
+        limits (SharedLimits): Shared limits guarding the download and Grobid stages.
+        keep_files (bool): Also save the PDF and the image to disk.
+        index (PaperIndex | None): Records the finished stages of the paper.
+        deadlines (Deadlines): The time budgets of the paper and its stages.
+
+    Returns:
+        tuple[str | bytes, list[Degraded]]: The first image of the paper, as a path with `keep_files` and as
+        bytes otherwise, or an empty string if there is none. And the stages that were skipped.
+    """
+    deadline = Deadline(deadlines.paper - deadlines.llm)
+    degraded = []
+
+    download_deadline = Deadline(deadline.cap(deadlines.download))
+
+    def download() -> bytes:
+        # the download gives up with its deadline, so an abandoned one does not keep the slot
+        if not limits.download.acquire(timeout=download_deadline.remaining()):
+            raise DeadlineExceeded(f'No download slot for {paper.doi} in time')
+        try:
+            return fetch_pdf(paper.doi, deadline=download_deadline)
+        finally:
+            limits.download.release()
+
+    # stages that miss their deadline keep running in the background and end on their own timeouts
+    executor = ThreadPoolExecutor(max_workers=3)
+    try:
+        try:
+            pdf_data = executor.submit(download).result(timeout=download_deadline.remaining())
+        except Exception as e:
+            logger.warning(f'{paper.doi} 未能及时下载PDF，仅根据摘要总结: {repr(e)}')
+            paper.more_graph = {}
+            return '', [Degraded.NO_PDF]
+
+        image_path = None
+        pdf_path = None
+        if keep_files:
+            image_path = os.path.join(base_path, paper.doi.replace('/', '@'))
+            pdf_path = os.path.join(image_path, f"{paper.doi.replace('/', '@')}.pdf")
+            os.makedirs(image_path, exist_ok=True)
+            with open(pdf_path, 'wb') as f:
+                f.write(pdf_data)
+
+        if index is not None:
+            index.mark(paper.doi, PaperState.DOWNLOADED, pdf_path=pdf_path)
+
+        future_first_image = executor.submit(get_image, pdf_data, image_path)
+        future_more_paragraphs = executor.submit(
+            parse_sections, pdf_data, deadline=deadline.cap(deadlines.sections), grobid_limit=limits.grobid
+        )
+
+        try:
+            paper.more_graph = future_more_paragraphs.result(timeout=deadline.remaining())
+        except Exception as e:
+            logger.warning(f'{paper.doi} 未能及时解析全文，仅根据摘要总结: {repr(e)}')
+            paper.more_graph = {}
+        if not paper.more_graph:
+            degraded.append(Degraded.NO_SECTIONS)
+
+        try:
+            first_image = future_first_image.result(timeout=deadline.cap(deadlines.image))
+        except Exception as e:
+            logger.warning(f'{paper.doi} 未能及时提取配图: {repr(e)}')
+            first_image = ''
+            degraded.append(Degraded.NO_IMAGE)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if index is not None:
+        index.mark(paper.doi, PaperState.PARSED)
+
+    return first_image, degraded
+
+
+def summarize_paper(
+        paper: Paper,
+        limits: SharedLimits,
+        seconds: float = DEADLINES.llm,
+        deadline: Deadline | None = None
+) -> tuple[str, bool]:
+    """
+    Summarize a paper within `seconds` of getting an LLM slot, and before `deadline` if one is given.
+
+    The slot is held until the stream is closed, so a stream cut short at the deadline does not keep a request
+    running beside the next paper's.
+
+    Returns:
+        tuple[str, bool]: The summary and whether it was cut short.
+
+    Raises:
+        DeadlineExceeded: If no slot came free or nothing was written before the deadline.
+    """
+    if not limits.llm.acquire(timeout=deadline.remaining() if deadline is not None else None):
+        raise DeadlineExceeded(f'No LLM slot for {paper.doi} in time')
+    if deadline is not None:
+        seconds = deadline.timeout(seconds)
+    try:
+        stream = DeadlineStream(conclusion(paper, timeout=seconds), seconds, on_close=limits.llm.release)
+    except BaseException:
+        limits.llm.release()
+        raise
+
+    text = ''.join(chunk.content for chunk in stream)
+    if stream.truncated and not text:
+        raise DeadlineExceeded(f'No summary of {paper.doi} in time')
+    return text, stream.truncated
+
+
+def record_degraded(paper: Paper, degraded: list[Degraded]) -> None:
+    if not degraded:
+        return
+
+    logger.warning(f'{paper.doi} 降级处理: {", ".join(degraded)}')
+    tracer.incr('paper', 'degraded')
+    for reason in degraded:
+        tracer.incr('degraded', str(reason))
+
+
+def build_doc_data(
+        paper: Paper,
+        conclusion_result: str,
+        first_image: str | bytes,
+        degraded: list[Degraded] = ()
+) -> DocData:
+    author_list = paper.authors.split('; ')
+    author_str = "; ".join(author_list[:2] + ['et.al.'] if len(author_list) > 2 else author_list)
+    author_corresponding = "; ".join([
+        f"{a}*"
+        for a in paper.author_corresponding.split('; ')
+    ])
+
+    return DocData(
+        paper.title,
+        f"{author_str}, {author_corresponding}",
+        paper.author_corresponding_institution,
+        paper.doi,
+        conclusion_result,
+        first_image,
+        list(degraded)
+    )
+
+
+def process_paper(
+        paper: Paper,
+        base_path: str,
+        limits: SharedLimits,
+        index: PaperIndex | None = None,
+        deadlines: Deadlines = DEADLINES
+) -> DocData:
+    with span('paper', doi=paper.doi, category=paper.category) as _span:
+        deadline = Deadline(deadlines.paper)
+        stored = index.get_summary(paper.doi) if index is not None else None
+        if stored is not None:
+            tracer.incr('paper', 'reused')
+            return build_doc_data(paper, *stored)
+
+        first_image, degraded = prepare_paper(paper, base_path, limits, index=index, deadlines=deadlines)
+        try:
+            conclusion_result, truncated = summarize_paper(paper, limits, deadlines.llm, deadline)
+        except Exception as e:
+            # the entry keeps the abstract, so a category never waits on or loses a paper the LLM cannot do
+            logger.warning(f'{paper.doi} 未能生成总结，仅附摘要: {repr(e)}')
+            conclusion_result, truncated = paper.abstract, False
+            degraded.append(Degraded.NO_SUMMARY)
+        if truncated:
+            degraded.append(Degraded.TRUNCATED)
+
+        record_degraded(paper, degraded)
+        if degraded:
+            _span.attrs['degraded'] = ','.join(degraded)
+        elif index is not None:
+            # degraded summaries are not stored, so the next run tries the paper in full again
+            index.mark(paper.doi, PaperState.SUMMARIZED, summary=conclusion_result, image=first_image or None)
+        return build_doc_data(paper, conclusion_result, first_image, degraded)
+
+
+def paper_payload(paper: Paper, deadlines: Deadlines = DEADLINES) -> dict:
+    """What a worker needs to process a paper from the work queue, the deadlines of the run included."""
+    return {**{column: getattr(paper, column) for column in Paper.columns()}, 'deadlines': asdict(deadlines)}
+
+
+def run_paper_task(task: Task, limits: SharedLimits, index: PaperIndex | None = None) -> str:
+    paper = Paper.from_dict(task.payload)
+    deadlines = Deadlines(**task.payload['deadlines']) if 'deadlines' in task.payload else DEADLINES
+    base_path = os.path.join(get_work_path(), 'tmp', paper.date, paper.category)
+    return encode_doc(process_paper(paper, base_path, limits, index, deadlines))
+
+
+def drop_written(papers: DataFrame, output_file: str, index: PaperIndex) -> DataFrame:
+    """
+    Drop papers that were already written to another summary file and register the rest as fetched.
+
+    Papers written to `output_file` itself are kept, their stored summaries are reused when it is rebuilt.
+    """
+    if papers.empty:
+        return papers
+
+    written = index.output_files(papers['doi'].tolist())
+    keep = [written.get(doi, output_file) == output_file for doi in papers['doi'].tolist()]
+    remaining = papers[keep]
+
+    if len(remaining) < len(papers):
+        logger.info(f'跳过 {len(papers) - len(remaining)} 篇已总结过的文献')
+        tracer.incr('paper', 'skipped', len(papers) - len(remaining))
+
+    for (date, category), group in remaining.groupby(['date', 'category']):
+        index.mark_many(group['doi'].tolist(), PaperState.FETCHED, date=date, category=category)
+
+    return remaining
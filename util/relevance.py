@@ -0,0 +1,129 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+from loguru import logger
+from pandas import DataFrame
+
+from path import get_work_path
+
+PROFILE_FILE = os.path.join(get_work_path(), 'interest_profiles.json')
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[-\'][a-z0-9]+)*')
+STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having here how however i if in
+into is it its itself may more most no nor not of off on once only or other our out over own same should so some such
+than that the their them then there these they this those through to too under until up very was we were what when
+where which while who whom why will with within would here our us using used use based show shows shown study studies
+result results found find finding findings data method methods approach new novel paper work here
+""".split())
+
+
+@dataclass
+class InterestProfile:
+    name: str
+    query: str
+    weight: float = 1.0
+
+    @classmethod
+    def from_dict(cls, data: dict[str, any]):
+        return cls(**data)
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    return [t for t in tokens if t not in STOP_WORDS and len(t) > 1]
+
+
+def load_profiles(profile_file: str = PROFILE_FILE) -> list[InterestProfile]:
+    """
+    Load interest profiles from a JSON list of `{"name": ..., "query": ..., "weight": ...}` objects.
+    """
+    if not os.path.exists(profile_file):
+        logger.warning(f'兴趣配置 {profile_file} 不存在')
+        return []
+
+    with open(profile_file, encoding='utf8') as f:
+        return [InterestProfile.from_dict(p) for p in json.load(f)]
+
+
+class BM25Index:
+    """Okapi BM25 over a small in-memory corpus, such as the titles and abstracts of one day."""
+
+    def __init__(self, documents: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(doc)) for doc in documents]
+        self.doc_lens = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_len = sum(self.doc_lens) / len(self.doc_lens) if self.doc_lens else 0.0
+
+        doc_freq = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+
+        n = len(documents)
+        self.idf = {
+            term: math.log((n - df + 0.5) / (df + 0.5) + 1)
+            for term, df in doc_freq.items()
+        }
+
+    def scores(self, query: str) -> list[float]:
+        terms = [t for t in set(tokenize(query)) if t in self.idf]
+        result = []
+        for tf, doc_len in zip(self.term_freqs, self.doc_lens):
+            norm = self.k1 * (1 - self.b + self.b * doc_len / self.avg_len) if self.avg_len else self.k1
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            result.append(score)
+        return result
+
+
+def score_papers(papers: DataFrame, profiles: list[InterestProfile]) -> list[float]:
+    """The best weighted BM25 score of each paper's title and abstract over all profiles."""
+    # the title is counted twice so that it weighs more than a single mention in the abstract
+    documents = (papers['title'].fillna('') + ' ' + papers['title'].fillna('') + ' ' + papers['abstract'].fillna('')).tolist()
+    index = BM25Index(documents)
+
+    best = [0.0] * len(documents)
+    for profile in profiles:
+        for i, score in enumerate(index.scores(profile.query)):
+            best[i] = max(best[i], score * profile.weight)
+    return best
+
+
+def select_relevant(
+        papers: DataFrame,
+        profiles: list[InterestProfile],
+        top_n: int | None = None,
+        threshold: float | None = None
+) -> DataFrame:
+    """
+    Keep the papers of each category that match the interest profiles best.
+
+    Args:
+        papers (DataFrame): Papers with `title`, `abstract` and `category` columns.
+        profiles (list[InterestProfile]): The interest profiles to score against.
+        top_n (int | None): Keep at most this many papers per category.
+        threshold (float | None): Keep only papers scoring at least this much.
+
+    Returns:
+        DataFrame: The selected papers with a `relevance` column, in their original order.
+    """
+    if not profiles or papers.empty or (top_n is None and threshold is None):
+        return papers
+
+    scored = papers.assign(relevance=score_papers(papers, profiles))
+    if threshold is not None:
+        scored = scored[scored['relevance'] >= threshold]
+    if top_n is not None:
+        scored = scored.sort_values('relevance', ascending=False, kind='stable').groupby('category').head(top_n)
+
+    logger.info(f'相关性筛选：保留 {len(scored)}/{len(papers)} 篇')
+    return scored.loc[papers.index.intersection(scored.index)]
@@ -0,0 +1,414 @@
+import asyncio
+import contextvars
+import inspect
+import queue
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from enum import StrEnum
+from functools import wraps
+from typing import Callable, Any, Iterable, Iterator
+
+import requests
+from loguru import logger
+
+from util.metrics import tracer
+
+
+class Dependency(StrEnum):
+    BIORXIV_API = 'biorxiv_api'
+    BIORXIV_PDF = 'biorxiv_pdf'
+    GROBID = 'grobid'
+    LLM = 'llm'
+
+
+class RetryableError(Exception):
+    """An error that is known to be transient and worth retrying."""
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status_code: int, message: str = ''):
+        super().__init__(f'HTTP {status_code} {message}'.strip())
+        self.status_code = status_code
+
+
+class DeadlineExceeded(Exception):
+    """The deadline of a call ran out before it started. Not a failure of the dependency, so not retried."""
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f'Circuit "{name}" is open, retry after {retry_after:.1f}s.')
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_retryable(e: BaseException) -> bool:
+    """
+    Decide whether an exception is transient.
+
+    Connection errors, timeouts, HTTP 408/425/429 and 5xx are retried. Other HTTP statuses, open circuits
+    and programming errors are not.
+    """
+    if isinstance(e, (CircuitOpenError, DeadlineExceeded)):
+        return False
+
+    if isinstance(e, RetryableError):
+        return True
+
+    status_code = getattr(e, 'status_code', None)
+    if status_code is None:
+        status_code = getattr(getattr(e, 'response', None), 'status_code', None)
+    if status_code is not None:
+        return status_code in (408, 425, 429) or status_code >= 500
+
+    if isinstance(e, (
+        ConnectionError,
+        TimeoutError,
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        requests.exceptions.RetryError,
+    )):
+        return True
+
+    # an openai error can only be raised once the LLM client is loaded, so it is not imported here
+    openai = sys.modules.get('openai')
+    return openai is not None and isinstance(e, openai.APIConnectionError)
+
+
+@dataclass
+class Backoff:
+    """Exponential backoff with jitter: attempt `n` sleeps `uniform(d / 2, d)` with `d = min(cap, base * factor ** n)`."""
+    base: float = 1.0
+    factor: float = 2.0
+    cap: float = 60.0
+
+    def delay(self, attempt: int) -> float:
+        upper = min(self.cap, self.base * self.factor ** attempt)
+        return random.uniform(upper / 2, upper)
+
+
+class RetryBudget:
+    """A per-run cap on the total number of retries across all call sites."""
+
+    def __init__(self, max_retries: int = 200):
+        self.max_retries = max_retries
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._used >= self.max_retries:
+                return False
+            self._used += 1
+            return True
+
+    @property
+    def remaining(self) -> int:
+        return max(self.max_retries - self._used, 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._used = 0
+
+
+class Deadline:
+    """A point in time shared by several stages, each stage waits at most until it."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.end = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.end - time.monotonic(), 0.0)
+
+    def cap(self, seconds: float) -> float:
+        """The time a stage that would like `seconds` may wait."""
+        return min(seconds, self.remaining())
+
+    def timeout(self, seconds: float) -> float:
+        """Like `cap`, but never 0, which requests refuses as a timeout."""
+        return max(self.cap(seconds), 0.01)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.end
+
+
+class DeadlineStream:
+    """
+    Iterate a stream until a deadline, then close it and note that it was cut short.
+
+    The stream is read in a background thread, so a stream that stops sending chunks is cut short at the
+    deadline as well, instead of only when its request times out. The reader closes the stream with the next
+    chunk it gets after that, then calls `on_close`, which is where a slot held for the stream is released.
+    """
+
+    def __init__(self, stream: Iterator, seconds: float, on_close: Callable[[], None] | None = None):
+        self.stream = stream
+        self.deadline = Deadline(seconds)
+        self.on_close = on_close
+        self.truncated = False
+
+    def _read(self, chunks: queue.Queue, stop: threading.Event) -> None:
+        try:
+            for item in self.stream:
+                if stop.is_set():
+                    break
+                chunks.put(('item', item))
+        except BaseException as e:
+            chunks.put(('error', e))
+        finally:
+            try:
+                close = getattr(self.stream, 'close', None)
+                if close is not None:
+                    close()
+            finally:
+                if self.on_close is not None:
+                    self.on_close()
+                chunks.put(('end', None))
+
+    def __iter__(self) -> Iterator:
+        chunks = queue.Queue()
+        stop = threading.Event()
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(self._read, chunks, stop), daemon=True).start()
+        try:
+            while True:
+                try:
+                    kind, value = chunks.get(timeout=self.deadline.remaining())
+                except queue.Empty:
+                    self.truncated = True
+                    break
+
+                if kind == 'end':
+                    break
+                if kind == 'error':
+                    raise value
+                yield value
+                if self.deadline.expired:
+                    self.truncated = True
+                    break
+        finally:
+            stop.set()
+
+
+class CircuitState(StrEnum):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Fail fast while a dependency is down.
+
+    After `failure_threshold` consecutive transient failures the circuit opens and every call raises
+    `CircuitOpenError` for `recovery_time` seconds. Then a single trial call is let through: success closes
+    the circuit, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_time: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = CircuitState.CLOSED
+            self.failures = 0
+            self.opened_at = 0.0
+            self._trial_running = False
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == CircuitState.CLOSED:
+                return
+
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == CircuitState.OPEN and elapsed >= self.recovery_time:
+                self.state = CircuitState.HALF_OPEN
+                self._trial_running = False
+
+            if self.state == CircuitState.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+
+            raise CircuitOpenError(self.name, max(self.recovery_time - elapsed, 0.0))
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CircuitState.CLOSED:
+                logger.info(f'Circuit "{self.name}" closed.')
+            self.state = CircuitState.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != CircuitState.OPEN:
+                    logger.warning(f'Circuit "{self.name}" opened after {self.failures} failures.')
+                    tracer.incr(self.name, 'circuit_opened')
+                self.state = CircuitState.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_running = False
+
+    def release(self) -> None:
+        """A call ended without an outcome, e.g. it was cancelled or interrupted. The next call may be the trial."""
+        with self._lock:
+            self._trial_running = False
+
+    def record(self, e: BaseException | None) -> None:
+        if e is None:
+            self.record_success()
+        elif isinstance(e, DeadlineExceeded):
+            self.release()
+        elif is_retryable(e):
+            self.record_failure()
+        else:
+            # the dependency answered, the request itself was wrong
+            self.record_success()
+
+    def wrap_iter(self, iterable: Iterable) -> Iterator:
+        """Guard a lazily consumed stream, such as a streamed LLM response."""
+        self.before_call()
+        try:
+            yield from iterable
+        except GeneratorExit:
+            self.record_success()
+            raise
+        except Exception as e:
+            self.record(e)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record_success()
+
+
+BREAKERS: dict[str, CircuitBreaker] = {
+    Dependency.BIORXIV_API: CircuitBreaker(Dependency.BIORXIV_API, failure_threshold=5, recovery_time=60),
+    Dependency.BIORXIV_PDF: CircuitBreaker(Dependency.BIORXIV_PDF, failure_threshold=8, recovery_time=60),
+    Dependency.GROBID: CircuitBreaker(Dependency.GROBID, failure_threshold=4, recovery_time=120),
+    Dependency.LLM: CircuitBreaker(Dependency.LLM, failure_threshold=5, recovery_time=60),
+}
+
+RETRY_BUDGET = RetryBudget()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    if name not in BREAKERS:
+        BREAKERS[name] = CircuitBreaker(name)
+    return BREAKERS[name]
+
+
+def reset_run() -> None:
+    """Refill the retry budget at the start of a run. Circuit states are kept."""
+    RETRY_BUDGET.reset()
+
+
+def retry(
+        retries: int = 3,
+        delay: float = 1,
+        *,
+        max_delay: float = 60,
+        retry_on: Callable[[BaseException], bool] = is_retryable,
+        breaker: str | None = None,
+        budget: RetryBudget | None = RETRY_BUDGET,
+) -> Callable:
+    """
+    A decorator that retries a sync or async function with exponential backoff and jitter.
+
+    Args:
+        retries (int): The total number of attempts. Must be greater than 0.
+        delay (float): The base delay in seconds of the backoff. Must be greater than 0.
+        max_delay (float): The upper bound of a single delay.
+        retry_on (Callable): Decides whether an exception is worth another attempt.
+        breaker (str | None): Name of the circuit breaker of the called dependency.
+        budget (RetryBudget | None): Shared retry budget, None for unlimited.
+
+    Returns:
+        Callable: A decorator that wraps the function with retry logic.
+
+    Raises:
+        The last exception once attempts are exhausted, the exception is not retryable or the budget is spent.
+        `CircuitOpenError` while the breaker of the dependency is open.
+    """
+    if retries < 1 or delay <= 0:
+        raise ValueError('Wrong param')
+
+    backoff = Backoff(delay, 2.0, max_delay)
+    circuit = get_breaker(breaker) if breaker is not None else None
+
+    def should_retry(func: Callable, e: Exception, attempt: int) -> bool:
+        if circuit is not None:
+            circuit.record(e)
+
+        if attempt == retries or not retry_on(e):
+            logger.error(f'Error: {repr(e)}.')
+            logger.error(f'"{func.__name__}()" failed after {attempt} attempts.')
+            return False
+
+        if budget is not None and not budget.try_acquire():
+            logger.error(f'Retry budget exhausted, "{func.__name__}()" gives up: {repr(e)}.')
+            tracer.incr(func.__name__, 'budget_exhausted')
+            return False
+
+        logger.debug(f'Error: {repr(e)} -> Retrying...')
+        tracer.incr(func.__name__, 'retries')
+        return True
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs) -> Any:
+                for attempt in range(1, retries + 1):
+                    if circuit is not None:
+                        circuit.before_call()
+                    try:
+                        result = await func(*args, **kwargs)
+                    except Exception as e:
+                        if not should_retry(func, e, attempt):
+                            raise
+                        await asyncio.sleep(backoff.delay(attempt - 1))
+                    except BaseException:
+                        if circuit is not None:
+                            circuit.release()
+                        raise
+                    else:
+                        if circuit is not None:
+                            circuit.record_success()
+                        return result
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs) -> Any:
+            for attempt in range(1, retries + 1):
+                if circuit is not None:
+                    circuit.before_call()
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    if not should_retry(func, e, attempt):
+                        raise
+                    time.sleep(backoff.delay(attempt - 1))
+                except BaseException:
+                    if circuit is not None:
+                        circuit.release()
+                    raise
+                else:
+                    if circuit is not None:
+                        circuit.record_success()
+                    return result
+
+        return wrapper
+
+    return decorator
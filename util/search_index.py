@@ -0,0 +1,304 @@
+import ast
+import os
+import re
+import sqlite3
+import threading
+import zipfile
+from dataclasses import dataclass
+from typing import Iterable, IO, TYPE_CHECKING
+
+from loguru import logger
+
+from path import get_work_path
+from util.file_util import DocData
+
+# searching needs neither, they are imported when summaries or keyword files are read
+if TYPE_CHECKING:
+    import pandas as pd
+
+SEARCH_FILE = os.path.join(get_work_path(), 'search_index.sqlite3')
+DOCX_NAME = re.compile(r'^(\d{4}-\d{2}-\d{2}) BiorRxiv预印本速读【(.+)】\.docx$')
+DOI_PREFIX = 'https://doi.org/'
+# the trigram tokenizer matches substrings of at least three characters, shorter terms fall back to LIKE
+MIN_MATCH_LENGTH = 3
+
+
+@dataclass
+class SearchHit:
+    doi: str
+    title: str
+    date: str
+    category: str
+    snippet: str
+    keywords: list[str]
+
+
+def parse_keywords(value) -> list[str]:
+    """Keywords as stored by `get_key_words`: a list, or its repr in a CSV cell."""
+    if isinstance(value, list):
+        return [str(k) for k in value]
+    if not isinstance(value, str) or not value.strip():
+        return []
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return [k.strip() for k in value.split(',') if k.strip()]
+    return [str(k) for k in parsed] if isinstance(parsed, (list, tuple)) else []
+
+
+class SearchIndex:
+    """
+    Full-text index over the daily summaries and the monthly keywords.
+
+    Papers live in a plain table and are mirrored into an FTS5 table with the trigram tokenizer, which also
+    matches Chinese text that has no spaces between words.
+    """
+
+    def __init__(self, index_file: str = SEARCH_FILE):
+        os.makedirs(os.path.dirname(os.path.abspath(index_file)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(index_file, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS paper (
+                id INTEGER PRIMARY KEY,
+                doi TEXT NOT NULL UNIQUE,
+                title TEXT,
+                date TEXT,
+                category TEXT,
+                summary TEXT,
+                keywords TEXT
+            );
+            CREATE INDEX IF NOT EXISTS paper_date ON paper (date, category);
+
+            CREATE TABLE IF NOT EXISTS keyword (
+                doi TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                PRIMARY KEY (keyword, doi)
+            ) WITHOUT ROWID;
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS paper_fts USING fts5(
+                title, summary, keywords, content='paper', content_rowid='id', tokenize='trigram'
+            );
+
+            CREATE TRIGGER IF NOT EXISTS paper_ai AFTER INSERT ON paper BEGIN
+                INSERT INTO paper_fts (rowid, title, summary, keywords)
+                VALUES (new.id, new.title, new.summary, new.keywords);
+            END;
+            CREATE TRIGGER IF NOT EXISTS paper_ad AFTER DELETE ON paper BEGIN
+                INSERT INTO paper_fts (paper_fts, rowid, title, summary, keywords)
+                VALUES ('delete', old.id, old.title, old.summary, old.keywords);
+            END;
+            CREATE TRIGGER IF NOT EXISTS paper_au AFTER UPDATE ON paper BEGIN
+                INSERT INTO paper_fts (paper_fts, rowid, title, summary, keywords)
+                VALUES ('delete', old.id, old.title, old.summary, old.keywords);
+                INSERT INTO paper_fts (rowid, title, summary, keywords)
+                VALUES (new.id, new.title, new.summary, new.keywords);
+            END;
+        """)
+        self.conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_summaries(self, date: str, category: str, docs: Iterable[DocData]) -> int:
+        """Index the summaries of one daily output file. Keywords already indexed for a paper are kept."""
+        rows = [(d.doi, d.title, date, category, d.desc) for d in docs]
+        with self._lock:
+            self.conn.executemany(
+                """
+                INSERT INTO paper (doi, title, date, category, summary) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(doi) DO UPDATE SET
+                    title = excluded.title, date = excluded.date,
+                    category = excluded.category, summary = excluded.summary
+                """,
+                rows
+            )
+            self.conn.commit()
+        return len(rows)
+
+    def add_keywords(self, papers: 'pd.DataFrame') -> int:
+        """
+        Index monthly keywords.
+
+        Args:
+            papers (DataFrame): Rows in the shape of `result_{month}.csv`: `doi`, `title`, `date`, `category`
+                and `keywords`. Rows without keywords are skipped.
+
+        Returns:
+            int: The number of papers whose keywords were indexed.
+        """
+        rows = []
+        for doi, title, date, category, keywords in zip(
+                papers['doi'], papers['title'], papers['date'], papers['category'], papers['keywords']
+        ):
+            keywords = parse_keywords(keywords)
+            if keywords:
+                rows.append((doi, title, date, category, keywords))
+
+        with self._lock:
+            self.conn.executemany(
+                """
+                INSERT INTO paper (doi, title, date, category, keywords) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(doi) DO UPDATE SET keywords = excluded.keywords
+                """,
+                [(doi, title, date, category, '; '.join(keywords)) for doi, title, date, category, keywords in rows]
+            )
+            self.conn.executemany('DELETE FROM keyword WHERE doi = ?', [(row[0],) for row in rows])
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO keyword (doi, keyword) VALUES (?, ?)',
+                [(row[0], k.strip().lower()) for row in rows for k in row[4]]
+            )
+            self.conn.commit()
+        return len(rows)
+
+    def search(
+            self,
+            text: str | None = None,
+            category: str | None = None,
+            start: str | None = None,
+            end: str | None = None,
+            keyword: str | None = None,
+            limit: int = 20
+    ) -> list[SearchHit]:
+        """
+        Find indexed papers.
+
+        Args:
+            text (str | None): Words that must all appear in the title, summary or keywords.
+            category (str | None): Only papers of this category.
+            start (str | None): Only papers from this date on, 'YYYY-MM-DD'.
+            end (str | None): Only papers up to this date, 'YYYY-MM-DD'.
+            keyword (str | None): Only papers with exactly this keyword, ignoring case.
+            limit (int): The maximum number of hits.
+
+        Returns:
+            list[SearchHit]: Best matches first when searching by text, otherwise newest first.
+        """
+        conditions, params = [], []
+        terms = text.split() if text else []
+        match_terms = [t for t in terms if len(t) >= MIN_MATCH_LENGTH]
+        for term in terms:
+            if len(term) < MIN_MATCH_LENGTH:
+                conditions.append('(p.title LIKE ? OR p.summary LIKE ? OR p.keywords LIKE ?)')
+                params.extend([f'%{term}%'] * 3)
+
+        if category is not None:
+            conditions.append('p.category = ?')
+            params.append(category.lower())
+        if start is not None:
+            conditions.append('p.date >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('p.date <= ?')
+            params.append(end)
+        if keyword is not None:
+            conditions.append('p.doi IN (SELECT doi FROM keyword WHERE keyword = ?)')
+            params.append(keyword.strip().lower())
+
+        if match_terms:
+            query = ' AND '.join('"' + t.replace('"', '""') + '"' for t in match_terms)
+            sql = """
+                SELECT p.doi, p.title, p.date, p.category,
+                       snippet(paper_fts, -1, '[', ']', '…', 24), p.keywords
+                FROM paper_fts JOIN paper p ON p.id = paper_fts.rowid
+                WHERE paper_fts MATCH ?
+            """
+            params.insert(0, query)
+            order = 'ORDER BY bm25(paper_fts, 5.0, 1.0, 3.0)'
+        else:
+            sql = """
+                SELECT p.doi, p.title, p.date, p.category, substr(coalesce(p.summary, ''), 1, 80), p.keywords
+                FROM paper p WHERE 1
+            """
+            order = 'ORDER BY p.date DESC'
+
+        sql = ' '.join([sql] + [f'AND {c}' for c in conditions] + [order, 'LIMIT ?'])
+        params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        return [
+            SearchHit(doi, title, date, category, snippet or '', keywords.split('; ') if keywords else [])
+            for doi, title, date, category, snippet, keywords in rows
+        ]
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute('SELECT count(*) FROM paper').fetchone()[0]
+
+
+def read_summary_docx(docx_file: str | IO[bytes]) -> list[DocData]:
+    """
+    Read the summaries back from a file written by `write_to_docx`.
+
+    Every paper is a title, author, institution, DOI link and summary paragraph, so the papers are found
+    by their DOI link.
+    """
+    from docx import Document
+
+    paragraphs = [p.text.strip() for p in Document(docx_file).paragraphs]
+    docs = []
+    for i, text in enumerate(paragraphs):
+        if not text.startswith(DOI_PREFIX) or i < 3:
+            continue
+
+        summary = paragraphs[i + 1] if i + 1 < len(paragraphs) else ''
+        docs.append(DocData(paragraphs[i - 3], paragraphs[i - 2], paragraphs[i - 1], text[len(DOI_PREFIX):], summary, ''))
+    return docs
+
+
+def _import_docx(index: SearchIndex, name: str, open_file) -> int:
+    matched = DOCX_NAME.match(os.path.basename(name))
+    if matched is None:
+        return 0
+
+    date, category = matched.groups()
+    with open_file() as f:
+        docs = read_summary_docx(f)
+    return index.add_summaries(date, category.lower(), docs)
+
+
+def import_outputs(index: SearchIndex, work_path: str | None = None) -> tuple[int, int]:
+    """
+    Backfill the index from the summaries and keyword results already on disk.
+
+    Reads `*-summary/**/*.docx` folders, `*-summary.zip` archives whose folder is gone, and
+    `conclusion/result_*.csv` under the work path.
+
+    Returns:
+        tuple[int, int]: The number of summaries and of keyword rows imported.
+    """
+    work_path = work_path or get_work_path()
+    summaries = keywords = 0
+
+    for entry in sorted(os.listdir(work_path)):
+        path = os.path.join(work_path, entry)
+        if entry.endswith('-summary') and os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    summaries += _import_docx(index, file, lambda: open(file_path, 'rb'))
+        elif entry.endswith('-summary.zip') and not os.path.isdir(path[:-len('.zip')]):
+            with zipfile.ZipFile(path) as archive:
+                for name in archive.namelist():
+                    summaries += _import_docx(index, name, lambda: archive.open(name))
+
+    conclusion_path = os.path.join(work_path, 'conclusion')
+    if os.path.isdir(conclusion_path):
+        import pandas as pd
+
+        for file in sorted(os.listdir(conclusion_path)):
+            if file.startswith('result_') and file.endswith('.csv'):
+                keywords += index.add_keywords(pd.read_csv(os.path.join(conclusion_path, file)))
+
+    logger.info(f'导入 {summaries} 篇总结，{keywords} 篇文献的关键词')
+    return summaries, keywords
@@ -0,0 +1,215 @@
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, asdict
+from enum import StrEnum
+from typing import Iterable
+
+from path import get_work_path
+from util.file_util import DocData
+
+QUEUE_FILE = os.path.join(get_work_path(), 'work_queue.sqlite3')
+LEASE_SECONDS = 120.0
+MAX_ATTEMPTS = 3
+# WAL only works when every process is on the same host, use DELETE for a queue file on a network filesystem
+QUEUE_JOURNAL = os.environ.get('BIOSUMMARY_QUEUE_JOURNAL', 'WAL')
+
+
+class TaskState(StrEnum):
+    PENDING = 'pending'
+    LEASED = 'leased'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+@dataclass
+class Task:
+    id: int
+    kind: str
+    key: str
+    payload: dict
+    attempts: int
+
+
+class WorkQueue:
+    """
+    A durable task queue in one SQLite file that several worker processes can share.
+
+    A worker claims tasks with a lease and extends it with heartbeats while it works. When a worker dies its
+    lease runs out and the task goes to the next claim, until it has been tried `max_attempts` times.
+
+    In the default WAL mode all workers must run on the host that has the file, WAL keeps its shared index in
+    local memory. Workers on other hosts need `journal_mode='DELETE'` and the file on a filesystem with working
+    POSIX locks.
+    """
+
+    def __init__(self, queue_file: str = QUEUE_FILE, journal_mode: str = QUEUE_JOURNAL):
+        os.makedirs(os.path.dirname(os.path.abspath(queue_file)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(queue_file, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute(f'PRAGMA journal_mode={journal_mode}')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS task (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                UNIQUE (kind, key)
+            );
+            CREATE INDEX IF NOT EXISTS task_claim ON task (state, lease_expires);
+        """)
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _write(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self.conn.execute(sql, params)
+
+    def enqueue_many(self, kind: str, items: Iterable[tuple[str, dict]], max_attempts: int = MAX_ATTEMPTS) -> int:
+        """
+        Add tasks. A task whose (kind, key) is already queued is left as it is, so enqueueing is idempotent,
+        except a task that failed in an earlier run: it is reset to pending with fresh attempts.
+
+        Returns:
+            int: The number of tasks that were new or reset.
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                before = self.conn.total_changes
+                self.conn.executemany(
+                    'INSERT INTO task (kind, key, payload, state, max_attempts, updated_at) VALUES (?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (kind, key) DO UPDATE SET payload = excluded.payload, state = excluded.state, '
+                    'attempts = 0, max_attempts = excluded.max_attempts, lease_owner = NULL, lease_expires = NULL, '
+                    'result = NULL, error = NULL, updated_at = excluded.updated_at WHERE state = ?',
+                    [(kind, key, json.dumps(payload, ensure_ascii=False), TaskState.PENDING, max_attempts, now,
+                      TaskState.FAILED)
+                     for key, payload in items]
+                )
+                added = self.conn.total_changes - before
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+        return added
+
+    def claim(self, worker: str, limit: int = 1, lease: float = LEASE_SECONDS, kind: str | None = None) -> list[Task]:
+        """
+        Lease up to `limit` pending tasks, or tasks whose lease has run out, to `worker`.
+
+        Tasks whose lease ran out after their last attempt are marked failed instead.
+        """
+        now = time.time()
+        kind_filter, kind_params = ('AND kind = ?', (kind,)) if kind is not None else ('', ())
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.execute(
+                    "UPDATE task SET state = ?, error = 'lease expired', updated_at = ? "
+                    "WHERE state = ? AND lease_expires < ? AND attempts >= max_attempts",
+                    (TaskState.FAILED, now, TaskState.LEASED, now)
+                )
+                rows = self.conn.execute(
+                    f"""
+                    SELECT id, kind, key, payload, attempts FROM task
+                    WHERE (state = ? OR (state = ? AND lease_expires < ?)) {kind_filter}
+                    ORDER BY id LIMIT ?
+                    """,
+                    (TaskState.PENDING, TaskState.LEASED, now, *kind_params, limit)
+                ).fetchall()
+                self.conn.executemany(
+                    'UPDATE task SET state = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, '
+                    'updated_at = ? WHERE id = ?',
+                    [(TaskState.LEASED, worker, now + lease, now, row[0]) for row in rows]
+                )
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+        return [Task(task_id, kind, key, json.loads(payload), attempts + 1) for task_id, kind, key, payload, attempts in rows]
+
+    def heartbeat(self, task_ids: Iterable[int], worker: str, lease: float = LEASE_SECONDS) -> int:
+        """Extend the leases `worker` still holds. Returns how many were extended."""
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.executemany(
+                'UPDATE task SET lease_expires = ?, updated_at = ? WHERE id = ? AND state = ? AND lease_owner = ?',
+                [(now + lease, now, task_id, TaskState.LEASED, worker) for task_id in task_ids]
+            )
+        return cursor.rowcount
+
+    def complete(self, task_id: int, worker: str, result: str) -> bool:
+        """Store the result of a task. False when the lease was lost and the task belongs to another worker now."""
+        cursor = self._write(
+            'UPDATE task SET state = ?, result = ?, error = NULL, lease_expires = NULL, updated_at = ? '
+            'WHERE id = ? AND state = ? AND lease_owner = ?',
+            (TaskState.DONE, result, time.time(), task_id, TaskState.LEASED, worker)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, task_id: int, worker: str, error: str) -> None:
+        """Give a task back for another attempt, or mark it failed after its last attempt."""
+        self._write(
+            'UPDATE task SET state = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, '
+            'error = ?, lease_expires = NULL, updated_at = ? WHERE id = ? AND state = ? AND lease_owner = ?',
+            (TaskState.FAILED, TaskState.PENDING, error, time.time(), task_id, TaskState.LEASED, worker)
+        )
+
+    def counts(self, kind: str | None = None) -> dict[TaskState, int]:
+        kind_filter, params = ('WHERE kind = ?', (kind,)) if kind is not None else ('', ())
+        with self._lock:
+            rows = self.conn.execute(f'SELECT state, count(*) FROM task {kind_filter} GROUP BY state', params).fetchall()
+        result = {state: 0 for state in TaskState}
+        result.update({TaskState(state): count for state, count in rows})
+        return result
+
+    def finished(self, kind: str, keys: Iterable[str]) -> dict[str, tuple[TaskState, str | None]]:
+        """The state and result of the tasks among `keys` that are done or failed."""
+        keys = list(keys)
+        result = {}
+        with self._lock:
+            for i in range(0, len(keys), 900):
+                chunk = keys[i:i + 900]
+                rows = self.conn.execute(
+                    f"SELECT key, state, COALESCE(result, error) FROM task WHERE kind = ? AND state IN (?, ?) "
+                    f"AND key IN ({','.join('?' * len(chunk))})",
+                    (kind, TaskState.DONE, TaskState.FAILED, *chunk)
+                ).fetchall()
+                result.update({key: (TaskState(state), value) for key, state, value in rows})
+        return result
+
+
+def encode_doc(doc: DocData) -> str:
+    data = asdict(doc)
+    if isinstance(doc.img, bytes):
+        data['img'] = {'base64': base64.b64encode(doc.img).decode('ascii')}
+    return json.dumps(data, ensure_ascii=False)
+
+
+def decode_doc(text: str) -> DocData:
+    data = json.loads(text)
+    if isinstance(data['img'], dict):
+        data['img'] = base64.b64decode(data['img']['base64'])
+    return DocData(**data)
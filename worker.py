@@ -0,0 +1,117 @@
+import argparse
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, Future
+
+from loguru import logger
+
+from path import get_work_path
+from util.metrics import tracer
+from util.paper_index import PaperIndex, INDEX_FILE
+from util.pipeline import ResourceLimits, SharedLimits, PAPER_TASK, run_paper_task
+from util.resilience import reset_run
+from util.work_queue import WorkQueue, Task, TaskState, QUEUE_FILE, LEASE_SECONDS
+
+
+def heartbeat(queue: WorkQueue, worker_id: str, in_flight: dict[Future, Task], lease: float, stop: threading.Event):
+    while not stop.wait(lease / 3):
+        task_ids = [task.id for task in list(in_flight.values())]
+        if task_ids:
+            queue.heartbeat(task_ids, worker_id, lease)
+
+
+def run_worker(
+        queue: WorkQueue,
+        worker_id: str,
+        limits: SharedLimits,
+        index: PaperIndex | None = None,
+        lease: float = LEASE_SECONDS,
+        poll: float = 2.0,
+        exit_when_idle: bool = True
+) -> int:
+    """
+    Claim paper tasks from the queue and process them until the queue is drained.
+
+    Args:
+        queue (WorkQueue): The shared queue.
+        worker_id (str): The lease owner name of this worker, unique across hosts.
+        limits (SharedLimits): The concurrency limits of this worker, as many tasks as their total run at once.
+        index (PaperIndex | None): Records the progress of every paper and reuses stored summaries.
+        lease (float): Seconds a claimed task stays leased without a heartbeat.
+        poll (float): Seconds between looks at an empty queue.
+        exit_when_idle (bool): Stop when no task is pending or leased, otherwise wait for new tasks.
+
+    Returns:
+        int: The number of tasks this worker completed.
+    """
+    in_flight: dict[Future, Task] = {}
+    stop = threading.Event()
+    beat = threading.Thread(target=heartbeat, args=(queue, worker_id, in_flight, lease, stop), daemon=True)
+    beat.start()
+
+    completed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=limits.total) as executor:
+            while True:
+                free = limits.total - len(in_flight)
+                if free > 0:
+                    for task in queue.claim(worker_id, free, lease, kind=PAPER_TASK):
+                        in_flight[executor.submit(run_paper_task, task, limits, index)] = task
+
+                if not in_flight:
+                    counts = queue.counts(PAPER_TASK)
+                    if exit_when_idle and counts[TaskState.PENDING] == 0 and counts[TaskState.LEASED] == 0:
+                        break
+                    time.sleep(poll)
+                    continue
+
+                done, _ = wait(list(in_flight), timeout=poll, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f'{task.key} 第{task.attempts}次处理失败: {repr(e)}')
+                        queue.fail(task.id, worker_id, repr(e))
+                        continue
+
+                    if queue.complete(task.id, worker_id, result):
+                        completed += 1
+                    else:
+                        logger.warning(f'{task.key} 的租约已失效，结果由其他worker提交')
+    finally:
+        stop.set()
+
+    return completed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='从任务队列领取文献并生成总结，可在多台机器上同时运行')
+    parser.add_argument('--queue', default=QUEUE_FILE, help='任务队列数据库')
+    parser.add_argument('--worker-id', default=f'{socket.gethostname()}-{os.getpid()}', help='worker名称，需全局唯一')
+    parser.add_argument('--download', type=int, default=ResourceLimits.download, help='PDF下载并发上限')
+    parser.add_argument('--grobid', type=int, default=ResourceLimits.grobid, help='Grobid并发上限')
+    parser.add_argument('--llm', type=int, default=ResourceLimits.llm, help='LLM并发上限')
+    parser.add_argument('--lease', type=float, default=LEASE_SECONDS, help='任务租约时长（秒）')
+    parser.add_argument('--index', default=INDEX_FILE, help='文献处理记录数据库，传空字符串则不记录')
+    parser.add_argument('--wait', action='store_true', help='队列为空时继续等待新任务，而不是退出')
+    args = parser.parse_args()
+
+    limits = SharedLimits(ResourceLimits(args.download, args.grobid, args.llm))
+    reset_run()
+
+    index = PaperIndex(args.index) if args.index else None
+    with WorkQueue(args.queue) as queue:
+        logger.info(f'worker {args.worker_id} 启动')
+        completed = run_worker(queue, args.worker_id, limits, index, args.lease, exit_when_idle=not args.wait)
+        logger.info(f'worker {args.worker_id} 完成 {completed} 个任务')
+
+    if index is not None:
+        index.close()
+    tracer.export(os.path.join(get_work_path(), 'metrics'), f'worker_{args.worker_id}')
+
+
+if __name__ == '__main__':
+    main()